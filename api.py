@@ -0,0 +1,317 @@
+import hashlib
+import json
+from datetime import datetime, timedelta
+
+from flask import Blueprint, Response, abort, current_app, request
+from sqlalchemy import inspect, select
+from sqlalchemy.sql import func
+from werkzeug.exceptions import HTTPException
+
+from directory import venue_directory
+from geo import parse_point, shows_nearby, venues_nearby, weekend
+from listings import DEFAULT_PER_PAGE, MAX_PER_PAGE, artists_page, listing_filters, shows_page
+from models import DEFAULT_SHOW_MINUTES, MAX_SHOW_MINUTES, db, Artist, DeleteCount, Show, Venue
+from payloads import artist_payload, entity_payload, venue_payload
+from read_models import ReadModel, Timeline
+from routing import read_only
+from scheduling import free_slots, week_start
+from search import search
+
+#----------------------------------------------------------------------------#
+# JSON API.
+#----------------------------------------------------------------------------#
+
+API_VERSION = 'v1'
+
+api = Blueprint('api', __name__, url_prefix='/api/' + API_VERSION)
+
+
+def _columns(model):
+    return tuple(prop.key for prop in inspect(model).column_attrs if not prop.deferred)
+
+
+VENUE_LISTING_FIELDS = ('id', 'name', 'city', 'state', 'num_upcoming_shows')
+ARTIST_LISTING_FIELDS = ('id', 'name', 'upcoming_shows_count')
+SHOW_LISTING_FIELDS = ('id', 'start_time', 'venue_id', 'venue_name', 'artist_id', 'artist_name', 'artist_image_link')
+NEARBY_VENUE_FIELDS = VENUE_LISTING_FIELDS + ('latitude', 'longitude', 'distance_km')
+NEARBY_SHOW_FIELDS = SHOW_LISTING_FIELDS + ('distance_km',)
+VENUE_FIELDS = _columns(Venue) + Timeline._fields
+ARTIST_FIELDS = _columns(Artist) + Timeline._fields
+
+
+#  Responses
+#  ----------------------------------------------------------------
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, ReadModel):
+        return value._asdict()
+    raise TypeError('%r is not JSON serializable' % (value,))
+
+
+def json_response(body, status=200):
+    return Response(json.dumps(body, separators=(',', ':'), default=_default),
+                    status=status, mimetype='application/json')
+
+
+# the app's HTML 404 page would otherwise win over the generic handler
+@api.errorhandler(404)
+@api.errorhandler(HTTPException)
+def http_error(error):
+    return json_response({'error': error.description}, error.code)
+
+
+def requested_fields(allowed):
+    """ The ?fields= selection, checked against the resource's fields. """
+    fields = [field.strip() for field in request.args.get('fields', '').split(',') if field.strip()]
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        abort(400, 'Unknown fields: %s.' % ', '.join(unknown))
+    return fields or list(allowed)
+
+
+def pick(item, fields):
+    return dict((field, item[field]) for field in fields if field in item)
+
+
+#  Conditional GET
+#  ----------------------------------------------------------------
+
+def collection_version(session, *models):
+    """ Highest id, latest updated_at and delete count of each table, in one
+    round trip, each read off an index or a single row.
+
+    Inserts move max(id), updates max(updated_at) and deletes the count
+    kept by counters.count_deletes().
+    """
+    columns = []
+    for model in models:
+        columns.append(select(func.max(model.id)).scalar_subquery())
+        columns.append(select(func.max(model.updated_at)).scalar_subquery())
+        columns.append(select(DeleteCount.deletes)
+                       .where(DeleteCount.table_name == model.__tablename__).scalar_subquery())
+    return tuple(session.execute(select(*columns)).one())
+
+
+def detail_version(session, model, entity_id, show_column, other_column, other):
+    """ updated_at of one venue or artist, of its shows and of the other
+    side of those shows, whose names and images the detail embeds. """
+    shows = select(func.count(Show.id).label('shows'),
+                   func.max(Show.updated_at).label('shows_updated_at'),
+                   func.max(other.updated_at).label('others_updated_at')
+                   ).select_from(Show).join(other, other_column == other.id
+                   ).where(show_column == entity_id).subquery()
+    query = select(select(model.updated_at).where(model.id == entity_id).scalar_subquery(), shows)
+    version = tuple(session.execute(query).one())
+    if version[0] is None:
+        abort(404, 'Not found.')
+    return version
+
+
+def conditional(version, build):
+    """ 304 when the client's ETag matches, else the JSON body from build().
+
+    The ETag covers the request path and query string plus `version`, so
+    checking it costs only the version query.
+    """
+    key = json.dumps([API_VERSION, request.full_path, version], default=_default)
+    etag = hashlib.sha1(key.encode('utf-8')).hexdigest()
+    # weak comparison, as If-None-Match wants: compressed responses carry W/ ETags
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = json_response(build())
+    response.set_etag(etag)
+    return response
+
+
+def _page_args():
+    return {
+        'cursor': request.args.get('cursor'),
+        'per_page': request.args.get('per_page', DEFAULT_PER_PAGE, type=int),
+    }
+
+
+def _page_body(items, page, fields):
+    # iterating the rows is what fills in next_cursor
+    data = [pick(item, fields) for item in items]
+    return {'data': data, 'next_cursor': page.next_cursor}
+
+
+#  Venues
+#  ----------------------------------------------------------------
+
+@api.route('/venues')
+@read_only
+def venues():
+    fields = requested_fields(VENUE_LISTING_FIELDS)
+
+    def build():
+        areas, page = venue_directory(db.session, filters=listing_filters(request.args), **_page_args())
+        items = (venue._asdict() for area in areas for venue in area['venues'])
+        return _page_body(items, page, fields)
+    return conditional(collection_version(db.session, Venue), build)
+
+
+@api.route('/venues/<int:venue_id>')
+@read_only
+def venue(venue_id):
+    fields = requested_fields(VENUE_FIELDS)
+    page_cache = current_app.extensions['page_cache']
+    now = page_cache.now()
+    version = detail_version(db.session, Venue, venue_id, Show.venue_id, Show.artist_id, Artist)
+
+    def build():
+        payload = page_cache.get('venue', venue_id, 'payload')
+        if payload is None:
+            payload = venue_payload(venue_id, now)
+            page_cache.set('venue', venue_id, 'payload', payload)
+        return pick(payload, fields)
+    return conditional(version + (now,), build)
+
+
+#  Artists
+#  ----------------------------------------------------------------
+
+@api.route('/artists')
+@read_only
+def artists():
+    fields = requested_fields(ARTIST_LISTING_FIELDS)
+
+    def build():
+        page = artists_page(db.session, listing_filters(request.args), sort=request.args.get('sort'), **_page_args())
+        return _page_body((row._asdict() for row in page), page, fields)
+    return conditional(collection_version(db.session, Artist), build)
+
+
+@api.route('/artists/<int:artist_id>')
+@read_only
+def artist(artist_id):
+    fields = requested_fields(ARTIST_FIELDS)
+    page_cache = current_app.extensions['page_cache']
+    now = page_cache.now()
+    version = detail_version(db.session, Artist, artist_id, Show.artist_id, Show.venue_id, Venue)
+
+    def build():
+        payload = page_cache.get('artist', artist_id, 'payload')
+        if payload is None:
+            payload = artist_payload(artist_id, now)
+            page_cache.set('artist', artist_id, 'payload', payload)
+        return pick(payload, fields)
+    return conditional(version + (now,), build)
+
+
+#  Shows
+#  ----------------------------------------------------------------
+
+@api.route('/shows')
+@read_only
+def shows():
+    fields = requested_fields(SHOW_LISTING_FIELDS)
+
+    def build():
+        page = shows_page(db.session, listing_filters(request.args), **_page_args())
+        return _page_body((row._asdict() for row in page), page, fields)
+    return conditional(collection_version(db.session, Show, Venue, Artist), build)
+
+
+#  Free slots
+#  ----------------------------------------------------------------
+
+def _free_slots(side, model, entity_id):
+    """ Gaps of at least ?min_minutes in the ?week (2026-W43 or a date,
+    default this week) of a venue or artist's calendar. """
+    try:
+        start = week_start(request.args.get('week'))
+    except ValueError:
+        abort(400, 'week must look like 2026-W43 or 2026-10-19.')
+    min_minutes = request.args.get('min_minutes', DEFAULT_SHOW_MINUTES, type=int)
+    if not 0 < min_minutes <= MAX_SHOW_MINUTES:
+        abort(400, 'min_minutes must be between 1 and %d.' % MAX_SHOW_MINUTES)
+    if db.session.get(model, entity_id) is None:
+        abort(404, 'Not found.')
+    slots = free_slots(db.session, side, entity_id, start, min_minutes=min_minutes)
+    return json_response({
+        'week_start': start,
+        'week_end': start + timedelta(days=7),
+        'data': [{'start': slot_start, 'end': slot_end, 'minutes': int((slot_end - slot_start).total_seconds() // 60)}
+                 for slot_start, slot_end in slots],
+    })
+
+
+@api.route('/venues/<int:venue_id>/free-slots')
+@read_only
+def venue_free_slots(venue_id):
+    return _free_slots('venue', Venue, venue_id)
+
+
+@api.route('/artists/<int:artist_id>/free-slots')
+@read_only
+def artist_free_slots(artist_id):
+    return _free_slots('artist', Artist, artist_id)
+
+
+#  Nearby
+#  ----------------------------------------------------------------
+
+def _point():
+    try:
+        return parse_point(request.args)
+    except ValueError as error:
+        abort(400, str(error))
+
+
+def _limit():
+    return min(max(request.args.get('limit', DEFAULT_PER_PAGE, type=int), 1), MAX_PER_PAGE)
+
+
+@api.route('/venues/nearby')
+@read_only
+def nearby_venues():
+    fields = requested_fields(NEARBY_VENUE_FIELDS)
+    lat, lon, radius = _point()
+
+    def build():
+        venues = venues_nearby(db.session, lat, lon, radius, limit=_limit())
+        return {'count': len(venues), 'data': [pick(venue, fields) for venue in venues]}
+    return conditional(collection_version(db.session, Venue), build)
+
+
+@api.route('/shows/nearby')
+@read_only
+def nearby_shows():
+    """ Shows within ?radius km of ?lat/?lon, this weekend unless ?from
+    and ?to (exclusive) dates are given. """
+    fields = requested_fields(NEARBY_SHOW_FIELDS)
+    lat, lon, radius = _point()
+    filters = listing_filters(request.args)
+    start, end = weekend(current_app.extensions['page_cache'].now())
+    start, end = filters['date_from'] or start, filters['date_to'] or end
+
+    def build():
+        shows = shows_nearby(db.session, lat, lon, radius, start, end, limit=_limit())
+        return {'from': start, 'to': end, 'count': len(shows), 'data': [pick(show, fields) for show in shows]}
+    return conditional(collection_version(db.session, Show, Venue, Artist) + (start,), build)
+
+
+#  Search
+#  ----------------------------------------------------------------
+
+SEARCHABLE = {'venues': Venue, 'artists': Artist}
+
+
+@api.route('/search/<kind>')
+@read_only
+def search_entities(kind):
+    model = SEARCHABLE.get(kind)
+    if model is None:
+        abort(404, 'Not found.')
+    fields = requested_fields(_columns(model))
+
+    def build():
+        filters = listing_filters(request.args)
+        results = search(db.session, model, request.args.get('q', ''),
+                         genres=filters['genres'], genre_match=filters['genre_match'])
+        return {'count': len(results), 'data': [pick(entity_payload(entity), fields) for entity in results]}
+    return conditional(collection_version(db.session, model), build)
@@ -2,21 +2,34 @@
 # Imports
 #----------------------------------------------------------------------------#
 
-import logging
-import sys
-from logging import FileHandler, Formatter
-
-import babel
 import dateutil.parser
-from flask import (Flask, Response, flash, redirect, render_template, request,
-                   url_for)
+from flask import (Flask, Response, abort, flash, redirect, render_template,
+                   request, session, stream_with_context, url_for)
 from flask_migrate import Migrate
 from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
 from flask_wtf import Form
-from sqlalchemy.sql import func, expression
 from forms import *
-from models import setup_db,Artist, Show,Venue
+from config import get_config
+from models import DEFAULT_SHOW_MINUTES, db, setup_db,Artist, Show,Venue
+from pooling import metrics as pool_metrics
+from routing import read_only, recently_wrote
+from responses import cache_policy, setup_responses
+from directory import venue_directory
+from listings import DEFAULT_PER_PAGE, artists_page, listing_filters, shows_page
+from search import search
+from scheduling import check_schedule
+from geo import DEFAULT_RADIUS_KM, parse_point, shows_nearby, venues_nearby, weekend
+from cache import make_page_cache
+from counters import delete_shows
+from jobs import enqueue, setup_jobs
+from snapshots import setup_snapshots, warm
+from instrumentation import setup_instrumentation
+from templating import setup_templating, timings as template_timings
+from payloads import artist_payload, venue_payload
+from api import api
+from formatting import format_datetime, format_datetimes
+from assets import setup_assets
+from cli import fyyur_cli
 
 #----------------------------------------------------------------------------#
 # App Config.
@@ -24,98 +37,143 @@ from models import setup_db,Artist, Show,Venue
 
 app = Flask(__name__)
 moment = Moment(app)
-app.config.from_object('config')
-db = SQLAlchemy(app)
-migrate = Migrate(app, db)
+app.config.from_object(get_config())
 setup_db(app)
+migrate = Migrate(app, db)
+page_cache = app.extensions['page_cache'] = make_page_cache(app.config)
+setup_templating(app)
+setup_instrumentation(app)
+jobs = setup_jobs(app)
+snapshots = setup_snapshots(app)
+setup_assets(app)
+setup_responses(app)
+app.cli.add_command(fyyur_cli)
+app.register_blueprint(api)
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format, locale='en')
-
 app.jinja_env.filters['datetime'] = format_datetime
+app.jinja_env.filters['datetimes'] = format_datetimes
+
+@app.template_global()
+def url_for_cursor(cursor):
+  # same listing and filters, next page
+  args = request.args.to_dict()
+  args['cursor'] = cursor
+  return url_for(request.endpoint, **args)
+
+#----------------------------------------------------------------------------#
+# Streaming.
+#----------------------------------------------------------------------------#
+
+def streaming_requested():
+  return request.args.get('stream', type=int, default=int(app.config['STREAM_LISTINGS'])) == 1
+
+def render_listing(template, **context):
+  # streamed pages send the layout before the rows have been fetched
+  if not streaming_requested():
+    return render_template(template, **context)
+  app.update_template_context(context)
+  return Response(stream_with_context(app.jinja_env.get_template(template).generate(context)))
+
+def snapshot_requested():
+  # the plain first page, unless this client has to see its own write
+  return not request.args and not recently_wrote()
 
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
 
 @app.route('/')
+@cache_policy('page')
 def index():
-  return render_template('pages/home.html')
+  return snapshots.response('home')
 
 
 #  Venues
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@cache_policy('page')
+@read_only
 def venues():
-  places  = db.session.query(Venue.city,Venue.state).group_by(Venue.city,Venue.state)
-  data = []
-  for place in places:
-    res = {}
-    res['city'] = place.city
-    res['state'] = place.state
-    venues  = db.session.query(Venue).filter_by(city = place.city,state=place.state).all()
-    for venue in venues:
-      num_upcoming_shows = db.session.query(Show).filter_by(venue_id = venue.id).filter(Show.start_time >= datetime.today()).count()
-      res['venues'] = [{ 'id' : venue.id, 
-                          'name' : venue.name,
-                          "num_upcoming_shows": num_upcoming_shows
-                      }]
-    data.append(res)
-  db.session.close()
-  return render_template('pages/venues.html', areas=data);
+  if snapshot_requested():
+    return snapshots.response('venues')
+  areas, page = venue_directory(db.session,
+                                filters=listing_filters(request.args),
+                                cursor=request.args.get('cursor'),
+                                per_page=request.args.get('per_page', DEFAULT_PER_PAGE, type=int),
+                                stream=streaming_requested())
+  return render_listing('pages/venues.html', areas=areas, page=page)
+
+@app.route('/venues/nearby')
+@cache_policy('page')
+@read_only
+def nearby_venues():
+  context = {'venues': None, 'shows': None, 'error': None, 'default_radius': DEFAULT_RADIUS_KM}
+  if 'lat' in request.args or 'lon' in request.args:
+    try:
+      lat, lon, radius = parse_point(request.args)
+    except ValueError as error:
+      context['error'] = str(error)
+      return render_template('pages/nearby_venues.html', **context), 400
+    start, end = weekend(page_cache.now())
+    context.update(radius=radius,
+                   venues=venues_nearby(db.session, lat, lon, radius),
+                   shows=shows_nearby(db.session, lat, lon, radius, start, end))
+  return render_template('pages/nearby_venues.html', **context)
 
 @app.route('/venues/search', methods=['POST'])
+@read_only
 def search_venues():
-  searchTerm= request.form.get('search_term')
-  query = db.session.query(Venue).filter(func.lower(Venue.name).contains(func.lower(expression.literal(searchTerm)))).all()
-  query_count = len(query)
+  searchTerm= request.form.get('search_term', '')
+  filters = listing_filters(request.values)
+  results = search(db.session, Venue, searchTerm, genres=filters['genres'], genre_match=filters['genre_match'])
   response={
-    "count": query_count,
-    "data": query
+    "count": len(results),
+    "data": results
   }
   return render_template('pages/search_venues.html', results=response, search_term=searchTerm)
 
+def render_cached(kind, entity_id, template, build_payload):
+  # flashed messages are part of the layout, so those pages are never cached
+  cacheable = '_flashes' not in session
+  html = page_cache.get(kind, entity_id, 'html') if cacheable else None
+  if html is not None:
+    return html
+  payload = page_cache.get(kind, entity_id, 'payload')
+  if payload is None:
+    payload = build_payload(entity_id, page_cache.now())
+    if payload is None:
+      abort(404)
+    page_cache.set(kind, entity_id, 'payload', payload)
+  html = render_template(template, **{kind: payload})
+  if cacheable:
+    page_cache.set(kind, entity_id, 'html', html)
+  return html
+
+def after_entity_saved(kind, entity, created=False):
+  # the entity's own pages are dropped now, the ones embedding it in the background
+  page_cache.invalidate(kind, entity.id)
+  enqueue('refresh_snapshots', dedup_key='snapshots:%s' % kind, kind=kind)
+  if not created:
+    enqueue('invalidate_related', dedup_key='related:%s:%d' % (kind, entity.id), kind=kind, entity_id=entity.id)
+  if entity.image_link and app.config['CHECK_IMAGE_LINKS']:
+    enqueue('check_image_link', dedup_key='image:%s:%d' % (kind, entity.id),
+            kind=kind, entity_id=entity.id, url=entity.image_link)
+
 @app.route('/venues/<int:venue_id>')
+@cache_policy('detail')
+@read_only
 def show_venue(venue_id):
-  #  query venue
-  venue  = db.session.query(Venue).filter_by(id = venue_id).first()
-  # get upcoming shows with venue_id
-  upcoming_shows = db.session.query(Artist.id.label('artist_id'),
-                               Artist.name.label('artist_name'),
-                               Artist.image_link.label('artist_image_link'),
-                               func.to_char(Show.start_time,"YYYY-mm-dd HH:MM:SS").label('start_time')
-                               ).join(Show, Show.artist_id == Artist.id
-                                ).join(Venue, Show.venue_id == Venue.id,
-                                  ).filter(Venue.id == venue_id, Show.start_time >= datetime.today()).all()
-
-  setattr(venue,'upcoming_shows',upcoming_shows)
-  # get past shows with venue_id
-  past_shows = db.session.query(Artist.id.label('artist_id'),
-                               Artist.name.label('artist_name'),
-                               Artist.image_link.label('artist_image_link'),
-                               func.to_char(Show.start_time,"YYYY-mm-dd HH:MM:SS").label('start_time')
-                               ).join(Show, Show.artist_id == Artist.id
-                                ).join(Venue, Show.venue_id == Venue.id,
-                                  ).filter(Venue.id == venue_id, Show.start_time < datetime.today()).all()
-  setattr(venue,'past_shows',past_shows)
-  setattr(venue,'past_shows_count',len(past_shows))
-  setattr(venue,'upcoming_shows_count',len(upcoming_shows))
-
-  return render_template('pages/show_venue.html', venue=venue)
+  return render_cached('venue', venue_id, 'pages/show_venue.html', venue_payload)
 
 #  Create Venue
 #  ----------------------------------------------------------------
 
 @app.route('/venues/create', methods=['GET'])
+@cache_policy('form')
 def create_venue_form():
   form = VenueForm()
   return render_template('forms/new_venue.html', form=form)
@@ -126,15 +184,13 @@ def create_venue_submission():
     venue = Venue(name= request.form.get('name'),city= request.form.get('city'),state= request.form.get('state'),address= request.form.get('address'),phone= request.form.get('phone'),genres= request.form.getlist('genres'),facebook_link= request.form.get('facebook_link'),image_link= request.form.get('image_link'),website= request.form.get('website_link'),seeking_talent= request.form.get('seeking_talent') == 'y' ,seeking_description = request.form.get('seeking_description'))
     db.session.add(venue)
     db.session.commit()
+    after_entity_saved('venue', venue, created=True)
   except:
       db.session.rollback()
-      print(sys.exc_info())
+      app.logger.exception('venue create failed')
       flash('An error occurred. Venue ' + request.form.get('name') + ' could not be listed.')
-  finally:
-      db.session.close()
 
   # on successful db insert, flash success\
-  print( request.form.getlist('genres'))
   flash('Venue ' + request.form.get('name') + ' was successfully listed!')
   return render_template('pages/home.html')
 
@@ -142,15 +198,20 @@ def create_venue_submission():
 def delete_venue(venue_id):
   try:
     venue = Venue.query.get(venue_id)
+    shows = delete_shows(db.session, Show.venue_id == venue.id)
     db.session.delete(venue)
     db.session.commit()
+    page_cache.invalidate('venue', venue.id)
+    enqueue('refresh_snapshots', dedup_key='snapshots:venue', kind='venue')
+    artist_ids = sorted(set(show.artist_id for show in shows))
+    if artist_ids:
+      enqueue('invalidate', kind='artist', entity_ids=artist_ids)
     flash('The Venue has been successfully deleted!')
     return render_template('pages/home.html')
   except:
     db.session.rollback()
+    app.logger.exception('venue %s delete failed', venue_id)
     flash('Delete was unsuccessful. Try again!')
-  finally:
-      db.session.close()
 
   # BONUS CHALLENGE: Implement a button to delete a Venue on a Venue Page, have it so that
   # clicking that button delete it from the db then redirect the user to the homepage
@@ -159,51 +220,41 @@ def delete_venue(venue_id):
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
+@cache_policy('page')
+@read_only
 def artists():
-  data = db.session.query(Artist).all()
-  return render_template('pages/artists.html', artists=data)
+  if snapshot_requested():
+    return snapshots.response('artists')
+  page = artists_page(db.session,
+                      listing_filters(request.args),
+                      cursor=request.args.get('cursor'),
+                      per_page=request.args.get('per_page', DEFAULT_PER_PAGE, type=int),
+                      stream=streaming_requested(),
+                      sort=request.args.get('sort'))
+  return render_listing('pages/artists.html', artists=page, page=page)
 
 @app.route('/artists/search', methods=['POST'])
+@read_only
 def search_artists():
-  searchTerm= request.form.get('search_term')
-  query = db.session.query(Artist).filter_by(func.lower(Artist.name).contains(func.lower(func.literal(searchTerm)))).all()
-  query_count = len(query)
+  searchTerm= request.form.get('search_term', '')
+  filters = listing_filters(request.values)
+  results = search(db.session, Artist, searchTerm, genres=filters['genres'], genre_match=filters['genre_match'])
   response={
-    "count": query_count,
-    "data": query
+    "count": len(results),
+    "data": results
   }
   return render_template('pages/search_artists.html', results=response, search_term=searchTerm)
 
 @app.route('/artists/<int:artist_id>')
+@cache_policy('detail')
+@read_only
 def show_artist(artist_id):
-  artist  = db.session.query(Artist).filter_by(id = artist_id).first()
-    # get upcoming shows with venue_id
-  upcoming_shows = db.session.query(Venue.id.label('venue_id'),
-                               Venue.name.label('venue_name'),
-                               Venue.image_link.label('venue_image_link'),
-                               func.to_char(Show.start_time,"YYYY-mm-dd HH:MM:SS").label('start_time')
-                               ).join(Show, Show.venue_id == Venue.id
-                                ).join(Artist, Show.venue_id == Artist.id,
-                                  ).filter(Artist.id == artist_id, Show.start_time >= datetime.today()).all()
-
-  setattr(artist,'upcoming_shows',upcoming_shows)
-  # get past shows with venue_id
-  past_shows = db.session.query(Venue.id.label('venue_id'),
-                               Venue.name.label('venue_name'),
-                               Venue.image_link.label('venue_image_link'),
-                               func.to_char(Show.start_time,"YYYY-mm-dd HH:MM:SS").label('start_time')
-                               ).join(Show, Show.venue_id == Venue.id
-                                ).join(Artist, Show.artist_id == Artist.id,
-                                  ).filter(Artist.id == artist_id, Show.start_time < datetime.today()).all()
-  setattr(artist,'past_shows',past_shows)
-  setattr(artist,'past_shows_count',len(past_shows))
-  setattr(artist,'upcoming_shows_count',len(upcoming_shows))
-  form = ArtistForm()
-  return render_template('pages/show_artist.html',form=form, artist=artist)
+  return render_cached('artist', artist_id, 'pages/show_artist.html', artist_payload)
 
 #  Update
 #  ----------------------------------------------------------------
 @app.route('/artists/<int:artist_id>/edit', methods=['GET'])
+@cache_policy('form')
 def edit_artist(artist_id):
   artist  = db.session.query(Artist).get(artist_id)
   form = ArtistForm()
@@ -226,14 +277,14 @@ def edit_artist_submission(artist_id):
     artist.state =request.form.get('state')
     artist.website = request.form.get('website_link')
     db.session.commit()
+    after_entity_saved('artist', artist)
   except:
       db.session.rollback()
-      print(sys.exc_info())
-  finally:
-      db.session.close()
+      app.logger.exception('artist %s edit failed', artist_id)
   return redirect(url_for('show_artist', artist_id=artist_id))
 
 @app.route('/venues/<int:venue_id>/edit', methods=['GET'])
+@cache_policy('form')
 def edit_venue(venue_id):
   venue  = db.session.query(Venue).filter_by(id = venue_id).first()
   form = VenueForm()
@@ -257,18 +308,18 @@ def edit_venue_submission(venue_id):
     venue.seeking_talent = request.form.get('seeking_talent') == 'y'
     venue.website = request.form.get('website_link')
     db.session.commit()
+    after_entity_saved('venue', venue)
   except:
       db.session.rollback()
-      print(sys.exc_info())
+      app.logger.exception('venue %s edit failed', venue_id)
       flash('An error occurred. Venue ' + request.form.get('name') + ' could not be listed.')
-  finally:
-      db.session.close() 
   return redirect(url_for('show_venue', venue_id=venue_id))
 
 #  Create Artist
 #  ----------------------------------------------------------------
 
 @app.route('/artists/create', methods=['GET'])
+@cache_policy('form')
 def create_artist_form():
   form = ArtistForm()
   return render_template('forms/new_artist.html', form=form)
@@ -280,11 +331,10 @@ def create_artist_submission():
 
     db.session.add(artist)
     db.session.commit()
+    after_entity_saved('artist', artist, created=True)
   except:
       db.session.rollback()
-      print(sys.exc_info())
-  finally:
-      db.session.close()
+      app.logger.exception('artist create failed')
   # on successful db insert, flash success
   flash('Artist ' + request.form.get('name') + ' was successfully listed!')
   return render_template('pages/home.html')
@@ -294,19 +344,19 @@ def create_artist_submission():
 #  ----------------------------------------------------------------
 
 @app.route('/shows')
+@cache_policy('page')
+@read_only
 def shows():
   # displays list of shows at /shows
-  data = db.session.query(Venue.id.label('venue_id'),
-                          Venue.name.label('venue_name'),
-                          Artist.id.label('artist_id'),
-                          Artist.name.label('artist_name'),
-                          Artist.image_link.label('artist_image_link'),
-                          
-                          func.to_char(Show.start_time,"YYYY-mm-dd HH:MM:SS").label('start_time')).join(Show, Show.artist_id == Artist.id).join(Venue, Show.venue_id == Venue.id).all()
-  db.session.close()
-  return render_template('pages/shows.html', shows=data)
+  page = shows_page(db.session,
+                    listing_filters(request.args),
+                    cursor=request.args.get('cursor'),
+                    per_page=request.args.get('per_page', DEFAULT_PER_PAGE, type=int),
+                    stream=streaming_requested())
+  return render_listing('pages/shows.html', shows=page, page=page)
 
 @app.route('/shows/create')
+@cache_policy('form')
 def create_shows():
   # renders form. do not touch.
   form = ShowForm()
@@ -314,20 +364,55 @@ def create_shows():
 
 @app.route('/shows/create', methods=['POST'])
 def create_show_submission():
+  form = ShowForm(request.form)
+  # load_calendar looks back MAX_SHOW_MINUTES, so longer bookings would go unseen
+  if not form.duration_minutes.validate(form):
+    flash('Show could not be listed. Duration: ' + ' '.join(form.duration_minutes.errors))
+    return render_template('forms/new_show.html', form=form), 400
   try:
-    show = Show(start_time= request.form.get('start_time'),venue_id= request.form.get('venue_id'),artist_id= request.form.get('artist_id'))
+    show = Show(start_time= dateutil.parser.parse(request.form.get('start_time')),venue_id= request.form.get('venue_id'),artist_id= request.form.get('artist_id'),
+                duration_minutes= form.duration_minutes.data or DEFAULT_SHOW_MINUTES)
+    conflicts = check_schedule(db.session, [show])
+    if conflicts:
+      flash('Show could not be listed. ' + ' '.join(message for messages in conflicts[0].values() for message in messages))
+      return render_template('forms/new_show.html', form=ShowForm(request.form)), 409
 
     db.session.add(show)
     db.session.commit()
+    page_cache.invalidate('venue', show.venue_id)
+    page_cache.invalidate('artist', show.artist_id)
+    enqueue('refresh_snapshots', dedup_key='snapshots:show', kind='show')
   except:
       db.session.rollback()
-      print(sys.exc_info())
-      
-  finally:
-      db.session.close()
+      app.logger.exception('show create failed')
+      flash('An error occurred. Show could not be listed.')
+      return render_template('forms/new_show.html', form=ShowForm(request.form)), 500
+
   flash('Show was successfully listed!')
   return render_template('pages/home.html')
 
+#  Metrics
+#  ----------------------------------------------------------------
+
+if app.config['METRICS_ENDPOINT']:
+  @app.route('/_metrics/pool')
+  def pool_metrics_view():
+    return pool_metrics.snapshot(db.engine.pool)
+
+  @app.route('/_metrics/templates')
+  def template_metrics_view():
+    fragment_cache = app.extensions.get('fragment_cache')
+    return {'templates': template_timings.snapshot(),
+            'fragment_cache': fragment_cache.stats() if fragment_cache else None}
+
+  @app.route('/_metrics/jobs')
+  def job_metrics_view():
+    return jobs.stats()
+
+  @app.route('/_metrics/snapshots')
+  def snapshot_metrics_view():
+    return snapshots.stats()
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
@@ -337,20 +422,15 @@ def server_error(error):
     return render_template('errors/500.html'), 500
 
 
-if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
-
 #----------------------------------------------------------------------------#
 # Launch.
 #----------------------------------------------------------------------------#
 
+# With gunicorn --preload, SNAPSHOT_WARM=1 builds the page snapshots once in
+# the master process, so that every forked worker starts with them.
+if app.config['SNAPSHOT_WARM']:
+  warm(app)
+
 # Default port:
 if __name__ == '__main__':
     app.run()
@@ -0,0 +1,286 @@
+"""ASGI entry point for high-concurrency read traffic.
+
+    pip install uvicorn asyncpg          # aiosqlite instead of asyncpg for SQLite
+    uvicorn asgi:application --workers 4
+
+The listing, detail and search pages are served from the event loop with
+async SQLAlchemy sessions, so a request waiting on the database does not
+hold a thread. They run the same query builders, payloads and templates as
+the WSGI views. Every other request (forms, writes, the API, static files)
+is handed to the Flask WSGI app on a worker thread.
+"""
+import asyncio
+import io
+import random
+import sys
+
+from flask import abort, render_template, request, request_started, session
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from werkzeug.exceptions import HTTPException
+
+from app import app, snapshot_requested
+from directory import venue_directory
+from listings import DEFAULT_PER_PAGE, artists_page, listing_filters, shows_page
+from models import Artist, Venue
+from pooling import async_engine_options, async_url
+from read_models import ArtistDetail, VenueDetail, load_detail
+from routing import recently_wrote
+from search import search
+from timeline import artist_timeline, venue_timeline
+
+#----------------------------------------------------------------------------#
+# Database.
+#----------------------------------------------------------------------------#
+
+async def run(engine, fn, *args):
+    """ Run sync query code on a connection of its own; concurrent calls
+    (see detail_page) therefore run their queries in parallel. """
+    async with AsyncSession(engine) as db_session:
+        return await db_session.run_sync(fn, *args)
+
+
+#----------------------------------------------------------------------------#
+# Views.
+#----------------------------------------------------------------------------#
+
+def _page_args():
+    return {
+        'cursor': request.args.get('cursor'),
+        'per_page': request.args.get('per_page', DEFAULT_PER_PAGE, type=int),
+    }
+
+
+async def venues(engine):
+    # the snapshot, unless it would have to be built on the event loop
+    if snapshot_requested() and app.extensions['snapshots'].ready('venues'):
+        return app.extensions['snapshots'].response('venues')
+    filters = listing_filters(request.args)
+    areas, page = await run(engine, lambda db_session: venue_directory(db_session, filters=filters, **_page_args()))
+    return render_template('pages/venues.html', areas=areas, page=page)
+
+
+async def artists(engine):
+    if snapshot_requested() and app.extensions['snapshots'].ready('artists'):
+        return app.extensions['snapshots'].response('artists')
+    filters = listing_filters(request.args)
+    page = await run(engine, lambda db_session: artists_page(db_session, filters, sort=request.args.get('sort'),
+                                                             **_page_args()))
+    return render_template('pages/artists.html', artists=page, page=page)
+
+
+async def shows(engine):
+    filters = listing_filters(request.args)
+    page = await run(engine, lambda db_session: shows_page(db_session, filters, **_page_args()))
+    return render_template('pages/shows.html', shows=page, page=page)
+
+
+async def detail_page(engine, kind, entity_id, template, detail, timeline):
+    # mirrors app.render_cached, with the entity and its shows fetched concurrently
+    page_cache = app.extensions['page_cache']
+    cacheable = '_flashes' not in session
+    html = page_cache.get(kind, entity_id, 'html') if cacheable else None
+    if html is not None:
+        return html
+    payload = page_cache.get(kind, entity_id, 'payload')
+    if payload is None:
+        now = page_cache.now()
+        payload, shows = await asyncio.gather(
+            run(engine, load_detail, detail, entity_id),
+            run(engine, timeline, entity_id, now, app.config['DETAIL_SHOWS_LIMIT']))
+        if payload is None:
+            abort(404)
+        payload.with_timeline(shows)
+        page_cache.set(kind, entity_id, 'payload', payload)
+    html = render_template(template, **{kind: payload})
+    if cacheable:
+        page_cache.set(kind, entity_id, 'html', html)
+    return html
+
+
+async def show_venue(engine, venue_id):
+    return await detail_page(engine, 'venue', venue_id, 'pages/show_venue.html', VenueDetail, venue_timeline)
+
+
+async def show_artist(engine, artist_id):
+    return await detail_page(engine, 'artist', artist_id, 'pages/show_artist.html', ArtistDetail, artist_timeline)
+
+
+async def search_page(engine, model, template):
+    term = request.form.get('search_term', '')
+    filters = listing_filters(request.values)
+    results = await run(engine, lambda db_session: search(db_session, model, term, genres=filters['genres'],
+                                                          genre_match=filters['genre_match']))
+    return render_template(template, results={'count': len(results), 'data': results}, search_term=term)
+
+
+async def search_venues(engine):
+    return await search_page(engine, Venue, 'pages/search_venues.html')
+
+
+async def search_artists(engine):
+    return await search_page(engine, Artist, 'pages/search_artists.html')
+
+
+# Flask endpoint -> async view
+VIEWS = {
+    'venues': venues,
+    'artists': artists,
+    'shows': shows,
+    'show_venue': show_venue,
+    'show_artist': show_artist,
+    'search_venues': search_venues,
+    'search_artists': search_artists,
+}
+
+
+#----------------------------------------------------------------------------#
+# ASGI <-> WSGI plumbing.
+#----------------------------------------------------------------------------#
+
+def wsgi_environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client')
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/%s' % scope.get('http_version', '1.1'),
+        'REMOTE_ADDR': client[0] if client else '',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name, value = name.decode('latin-1'), value.decode('latin-1')
+        if name == 'content-type':
+            environ['CONTENT_TYPE'] = value
+        elif name == 'content-length':
+            environ['CONTENT_LENGTH'] = value
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+            environ[key] = environ[key] + ',' + value if key in environ else value
+    return environ
+
+
+async def read_body(receive):
+    chunks = []
+    more_body = True
+    while more_body:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        more_body = message.get('more_body', False)
+    return b''.join(chunks)
+
+
+async def send_response(send, status, headers, chunks, head=False):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(name.encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+    })
+    if not head:
+        for chunk in chunks:
+            if chunk:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+def call_wsgi(wsgi_app, environ):
+    """ Run a WSGI app to completion; returns (status, headers, body chunks). """
+    response = {}
+    chunks = []
+
+    def start_response(status, headers, exc_info=None):
+        response['status'], response['headers'] = int(status.split(' ', 1)[0]), headers
+        return chunks.append
+
+    result = wsgi_app(environ, start_response)
+    try:
+        chunks.extend(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return response['status'], response['headers'], chunks
+
+
+#----------------------------------------------------------------------------#
+# Application.
+#----------------------------------------------------------------------------#
+
+class AsyncReadApp(object):
+    """ ASGI app serving VIEWS itself and everything else through Flask. """
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        config = flask_app.config
+        options = async_engine_options(config)
+        self.primary = create_async_engine(async_url(config['SQLALCHEMY_DATABASE_URI']), **options)
+        self.replicas = [create_async_engine(async_url(uri), **options) for uri in config['SQLALCHEMY_REPLICA_URIS']]
+
+    def read_engine(self):
+        # same policy as routing.RoutingSession
+        if self.replicas and not recently_wrote():
+            return random.choice(self.replicas)
+        return self.primary
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise RuntimeError('unsupported ASGI scope %r' % scope['type'])
+
+        environ = wsgi_environ(scope, await read_body(receive))
+        try:
+            endpoint, args = self.flask_app.url_map.bind_to_environ(environ).match()
+        except HTTPException:
+            endpoint = None
+        view = VIEWS.get(endpoint)
+        if view is None:
+            loop = asyncio.get_running_loop()
+            status, headers, chunks = await loop.run_in_executor(None, call_wsgi, self.flask_app, environ)
+        else:
+            status, headers, chunks = await self.dispatch(view, environ, args)
+            # Flask's own responses went through the middleware already
+            compression = self.flask_app.extensions.get('compression')
+            if compression is not None:
+                headers, chunks = compression.compress(environ, status, headers, chunks)
+        await send_response(send, status, headers, chunks, head=scope['method'] == 'HEAD')
+
+    async def dispatch(self, view, environ, args):
+        flask_app = self.flask_app
+        # Flask.full_dispatch_request with an awaited view; leaving the
+        # request context runs the teardown_request functions
+        with flask_app.request_context(environ):
+            try:
+                try:
+                    request_started.send(flask_app)
+                    rv = flask_app.preprocess_request()
+                    if rv is None:
+                        rv = await view(self.read_engine(), **args)
+                except Exception as error:
+                    rv = flask_app.handle_user_exception(error)
+                response = flask_app.finalize_request(rv)
+            except Exception as error:
+                response = flask_app.make_response(flask_app.handle_exception(error))
+            return response.status_code, list(response.headers.items()), [response.get_data()]
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                for engine in [self.primary] + self.replicas:
+                    await engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+application = AsyncReadApp(app)
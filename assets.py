@@ -0,0 +1,262 @@
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+
+from flask import abort, current_app, request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:  # optional: pip install brotli
+    brotli = None
+
+try:
+    import rcssmin
+except ImportError:  # optional: pip install rcssmin
+    rcssmin = None
+
+try:
+    import rjsmin
+except ImportError:  # optional: pip install rjsmin
+    rjsmin = None
+
+#----------------------------------------------------------------------------#
+# Static assets.
+#----------------------------------------------------------------------------#
+
+# `flask fyyur build-assets` copies every file under static/ to ASSETS_DIR
+# with a hash of its content in the name, concatenates and minifies the
+# BUNDLES, and writes .gz (and, with brotli installed, .br) next to every
+# text file. manifest.json maps source paths and bundle names to the
+# hashed files. A changed file gets a new name, so the hashed files are
+# served with a one-year `immutable` Cache-Control and browsers never
+# revalidate them.
+#
+# Templates link assets with asset_url('css/main.css') and
+# asset_urls('main.css'). Until a build exists, or with ASSETS_BUNDLED off
+# (the development default), these return the plain /static/ sources.
+
+logger = logging.getLogger('fyyur.assets')
+
+MANIFEST = 'manifest.json'
+
+# bundle name -> static files, in load order
+BUNDLES = {
+    'main.css': ('css/bootstrap.min.css', 'css/font-awesome.css', 'css/layout.main.css',
+                 'css/main.css', 'css/main.responsive.css', 'css/main.quickfix.css'),
+    # needed before the page renders
+    'head.js': ('js/libs/modernizr-2.8.2.min.js', 'js/libs/moment.min.js'),
+    # loaded with defer; plugins and script depend on jQuery
+    'main.js': ('js/libs/jquery-1.11.1.min.js', 'js/libs/bootstrap-3.1.1.min.js',
+                'js/plugins.js', 'js/script.js'),
+}
+
+COMPRESSIBLE = ('.css', '.js', '.map', '.svg', '.json', '.txt', '.eot', '.otf', '.ttf')
+HASH_LENGTH = 12
+
+
+#  Build
+#  ----------------------------------------------------------------
+
+def fingerprint(data):
+    return hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+
+
+def hashed_name(path, data):
+    """ 'css/main.css' -> 'css/main.0123456789ab.css' """
+    root, extension = posixpath.splitext(path)
+    return '%s.%s%s' % (root, fingerprint(data), extension)
+
+
+CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+
+def rewrite_css_urls(css, source, target, files):
+    """ Repoint the relative url()s of `source` (a static path) so that
+    they work from `target` (a path in ASSETS_DIR), using the hashed
+    names from `files` where there are any. """
+    source_dir, target_dir = posixpath.dirname(source), posixpath.dirname(target) or '.'
+
+    def replace(match):
+        quote, url = match.groups()
+        if re.match(r'^([a-z]+:|/|#)', url):
+            return match.group(0)
+        path, suffix = re.match(r'^([^?#]*)(.*)$', url).groups()
+        path = posixpath.normpath(posixpath.join(source_dir, path))
+        if path not in files:
+            # missing from static/ altogether; left as it was
+            return match.group(0)
+        return 'url(%s%s%s%s)' % (quote, posixpath.relpath(files[path], target_dir), suffix, quote)
+
+    return CSS_URL.sub(replace, css)
+
+
+CSS_TOKENS = re.compile(r'''("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*'|/\*.*?\*/)''', re.S)
+
+
+def minify_css(css):
+    if rcssmin is not None:
+        return rcssmin.cssmin(css, keep_bang_comments=True)
+    parts = []
+    for index, part in enumerate(CSS_TOKENS.split(css)):
+        if index % 2:
+            # strings, and /*! license */ comments, are kept as they are
+            if not part.startswith('/*') or part.startswith('/*!'):
+                parts.append(part)
+            continue
+        part = re.sub(r'\s+', ' ', part)
+        part = re.sub(r' ?([{};,>]) ?', r'\1', part)
+        parts.append(part.replace(';}', '}'))
+    return ''.join(parts).strip()
+
+
+def minify_js(js, path):
+    if rjsmin is None or '.min.' in path:
+        return js
+    return rjsmin.jsmin(js, keep_bang_comments=True)
+
+
+def _write(directory, name, data):
+    """ Write the file and its compressed variants, unless they exist:
+    the content is in the name. """
+    path = os.path.join(directory, *name.split('/'))
+    if os.path.exists(path):
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    variants = [(path, data)]
+    if name.endswith(COMPRESSIBLE):
+        variants.append((path + '.gz', gzip.compress(data, 9, mtime=0)))
+        if brotli is not None:
+            variants.append((path + '.br', brotli.compress(data)))
+    for variant_path, variant in variants:
+        if variant_path != path and len(variant) >= len(data):
+            continue
+        with open(variant_path + '.tmp', 'wb') as target:
+            target.write(variant)
+        os.replace(variant_path + '.tmp', variant_path)
+
+
+def _static_files(static_folder, skip):
+    for root, directories, names in os.walk(static_folder):
+        directories[:] = sorted(d for d in directories if os.path.join(root, d) != skip)
+        for name in sorted(names):
+            path = os.path.join(root, name)
+            yield os.path.relpath(path, static_folder).replace(os.sep, '/'), path
+
+
+def build_assets(app, clean=False):
+    """ Fingerprint, bundle and compress the static files into ASSETS_DIR.
+    Returns the manifest, {static path or bundle name: hashed path}.
+
+    Earlier builds are kept, so that pages rendered (or cached) before a
+    deploy keep working; pass clean to start from an empty directory.
+    """
+    directory = app.config['ASSETS_DIR']
+    if clean and os.path.isdir(directory):
+        shutil.rmtree(directory)
+    os.makedirs(directory, exist_ok=True)
+
+    sources = {}
+    for name, path in _static_files(app.static_folder, os.path.abspath(directory)):
+        with open(path, 'rb') as source:
+            sources[name] = source.read()
+
+    # stylesheets last: their url()s need the other files' hashed names
+    files = {}
+    for name in sorted(sources, key=lambda name: (name.endswith('.css'), name)):
+        data = sources[name]
+        if name.endswith('.css'):
+            data = rewrite_css_urls(data.decode('utf-8'), name, name, files).encode('utf-8')
+        files[name] = hashed_name(name, data)
+        _write(directory, files[name], data)
+
+    for bundle, members in sorted(BUNDLES.items()):
+        texts = []
+        for member in members:
+            text = sources[member].decode('utf-8')
+            if bundle.endswith('.css'):
+                texts.append(minify_css(rewrite_css_urls(text, member, bundle, files)))
+            else:
+                # ; guards against a file without a trailing one
+                texts.append(minify_js(text, member).rstrip() + '\n;')
+        data = '\n'.join(texts).encode('utf-8')
+        files[bundle] = hashed_name(bundle, data)
+        _write(directory, files[bundle], data)
+
+    manifest = os.path.join(directory, MANIFEST)
+    with open(manifest + '.tmp', 'w', encoding='utf-8') as target:
+        json.dump(files, target, indent=1, sort_keys=True)
+    os.replace(manifest + '.tmp', manifest)
+    return files
+
+
+#  Serving
+#  ----------------------------------------------------------------
+
+class Assets(object):
+    """ The manifest of the current build, read when the app starts. """
+
+    def __init__(self, app):
+        self.directory = app.config['ASSETS_DIR']
+        self.files = {}
+        if app.config['ASSETS_BUNDLED']:
+            self.reload()
+
+    def reload(self):
+        try:
+            with open(os.path.join(self.directory, MANIFEST), encoding='utf-8') as source:
+                self.files = json.load(source)
+        except FileNotFoundError:
+            logger.warning('no asset build in %s, serving the static sources; '
+                           'run flask fyyur build-assets', self.directory)
+            self.files = {}
+
+    def url(self, name):
+        """ URL of a static file or bundle, hashed when built. """
+        if name in self.files:
+            return url_for('assets', filename=self.files[name])
+        return url_for('static', filename=name)
+
+    def urls(self, bundle):
+        """ The bundle's URL, or its files' while there is no build. """
+        if bundle in self.files:
+            return [self.url(bundle)]
+        return [url_for('static', filename=name) for name in BUNDLES[bundle]]
+
+
+def _accepts(encoding):
+    return request.accept_encodings.quality(encoding) > 0
+
+
+def serve_asset(filename):
+    """ A hashed file, precompressed if the client accepts it. """
+    directory = current_app.config['ASSETS_DIR']
+    if filename == MANIFEST or filename.endswith(('.gz', '.br', '.tmp')):
+        abort(404)
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    path, encoding = filename, None
+    if filename.endswith(COMPRESSIBLE):
+        for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if _accepts(candidate) and os.path.isfile(os.path.join(directory, *(filename + suffix).split('/'))):
+                path, encoding = filename + suffix, candidate
+                break
+    response = send_from_directory(directory, path, mimetype=mimetype,
+                                   max_age=current_app.config['ASSETS_MAX_AGE'])
+    if encoding is not None:
+        response.content_encoding = encoding
+    if filename.endswith(COMPRESSIBLE):
+        response.vary.add('Accept-Encoding')
+    response.cache_control.immutable = True
+    return response
+
+
+def setup_assets(app):
+    assets = app.extensions['assets'] = Assets(app)
+    app.add_url_rule(app.static_url_path + '/dist/<path:filename>', 'assets', serve_asset)
+    app.jinja_env.globals.update(asset_url=assets.url, asset_urls=assets.urls)
+    return assets
@@ -0,0 +1,75 @@
+"""Per-row cost of formatting show start times on a 10k-show page.
+
+"before" replays the old path: a to_char() string per row, re-parsed by
+dateutil and formatted by babel from scratch. "after" uses native datetime
+values with the memoized formatter, per row and vectorized.
+
+    python bench/datetime_formatting.py [rows]
+"""
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import babel.dates  # noqa: E402
+import dateutil.parser  # noqa: E402
+from jinja2 import Environment  # noqa: E402
+
+from formatting import PATTERNS, format_datetime, format_datetimes  # noqa: E402
+
+ROWS = 10000
+PAGE = ("{% for show in shows %}<h4>{{ show.start_time|datetime('full') }}</h4>{% endfor %}")
+# the detail pages' timelines: the column formatted first, then the rows
+BATCHED_PAGE = ("{% set start_times = shows|map(attribute='start_time')|datetimes('full') %}"
+                "{% for show in shows %}<h4>{{ start_times[loop.index0] }}</h4>{% endfor %}")
+
+
+def legacy_format_datetime(value, format='medium'):
+    date = dateutil.parser.parse(value)
+    return babel.dates.format_datetime(date, PATTERNS.get(format, format), locale='en')
+
+
+def timed(label, rows, function):
+    started = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - started
+    print('%-28s %8.1f ms  %6.2f us/row' % (label, elapsed * 1000, elapsed * 1e6 / rows))
+    return elapsed
+
+
+def main(rows):
+    start = datetime(2026, 1, 1, 20, 0)
+    values = [start + timedelta(hours=i) for i in range(rows)]
+    # what to_char(start_time, 'YYYY-mm-dd HH:MM:SS') used to hand the filter
+    strings = [value.strftime('%Y-%m-%d %I:%m:%S') for value in values]
+
+    legacy = Environment()
+    legacy.filters['datetime'] = legacy_format_datetime
+    current = Environment()
+    current.filters['datetime'] = format_datetime
+    current.filters['datetimes'] = format_datetimes
+    legacy_page = legacy.from_string(PAGE)
+    current_page = current.from_string(PAGE)
+    batched_page = current.from_string(BATCHED_PAGE)
+
+    print('%d rows' % rows)
+    before = timed('before: filter only', rows,
+                   lambda: [legacy_format_datetime(value, 'full') for value in strings])
+    timed('after: filter only', rows,
+          lambda: [format_datetime(value, 'full') for value in values])
+    timed('after: vectorized', rows, lambda: format_datetimes(values, 'full'))
+    before_page = timed('before: page render', rows,
+                        lambda: legacy_page.render(shows=[{'start_time': value} for value in strings]))
+    after_page = timed('after: page render', rows,
+                       lambda: current_page.render(shows=[{'start_time': value} for value in values]))
+    timed('after: page render, batched', rows,
+          lambda: batched_page.render(shows=[{'start_time': value} for value in values]))
+    print('page render speedup: %.1fx' % (before_page / after_page))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else ROWS))
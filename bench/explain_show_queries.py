@@ -0,0 +1,92 @@
+"""EXPLAIN regression check for the show queries behind the detail pages.
+
+Captures every statement issued by GET /venues/<id> and /artists/<id>,
+explains the ones touching "Show" and fails if any of them scans the whole
+table instead of using the (venue_id, start_time) / (artist_id, start_time)
+indexes. Runs against DATABASE_URL (Postgres) or a throwaway SQLite file.
+
+    python bench/explain_show_queries.py
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+if 'DATABASE_URL' not in os.environ:
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(
+        tempfile.mkdtemp(prefix='fyyur-explain-'), 'explain.db')
+
+from sqlalchemy import event  # noqa: E402
+
+from app import app, db  # noqa: E402
+from models import Artist, Show, Venue  # noqa: E402
+
+DETAIL_PAGES = ('/venues/1', '/artists/1')
+
+
+def seed(engine):
+    now = datetime.today()
+    with engine.begin() as conn:
+        if conn.execute(Venue.__table__.select().where(Venue.id == 1)).first():
+            return
+        conn.execute(Venue.__table__.insert(), [{'id': 1, 'name': 'Explain Venue', 'genres': []}])
+        conn.execute(Artist.__table__.insert(), [{'id': 1, 'name': 'Explain Artist', 'genres': []}])
+        conn.execute(Show.__table__.insert(), [
+            {'venue_id': 1, 'artist_id': 1, 'start_time': now + timedelta(days=offset)}
+            for offset in range(-30, 30)
+        ])
+
+
+def capture(engine, client):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if '"Show"' in statement or 'Show' in statement.split():
+            statements.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        for path in DETAIL_PAGES:
+            assert client.get(path).status_code == 200, path
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    return statements
+
+
+def sequential_scans(conn, statement, parameters):
+    if conn.dialect.name == 'postgresql':
+        # small tables are always cheaper to scan; ask whether an index *can* be used
+        conn.exec_driver_sql('SET enable_seqscan = off')
+        plan = [row[0] for row in conn.exec_driver_sql('EXPLAIN ' + statement, parameters)]
+        return [line for line in plan if 'Seq Scan on "Show"' in line or 'Seq Scan on "Show_' in line]
+    plan = [row[-1] for row in conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters)]
+    return [line for line in plan if line.startswith('SCAN Show') or line.startswith('SCAN "Show"')]
+
+
+def main():
+    with app.app_context():
+        engine = db.engine
+        Venue.metadata.create_all(engine)
+        seed(engine)
+        statements = capture(engine, app.test_client())
+        failures = 0
+        with engine.connect() as conn:
+            for statement, parameters in statements:
+                scans = sequential_scans(conn, statement, parameters)
+                status = 'FAIL' if scans else 'ok'
+                failures += bool(scans)
+                print('%-4s %s' % (status, ' '.join(statement.split())[:120]))
+                for line in scans:
+                    print('       ' + line)
+    if not statements:
+        print('FAIL: no statements on Show captured')
+        return 1
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,85 @@
+"""Throughput benchmark for the detail pages, the form pages and form validation.
+
+Renders each page repeatedly through the test client against a throwaway
+SQLite database and reports requests per second. The page cache is
+bypassed for the detail pages so every request builds its payload and
+renders. Also times bulk.validate_row, the per-row form validation used
+by flask fyyur import.
+
+    python bench/form_pages.py [requests per page]
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(
+    tempfile.mkdtemp(prefix='fyyur-forms-'), 'forms.db')
+
+from app import app, db  # noqa: E402
+from bulk import KINDS, validate_row  # noqa: E402
+from models import Artist, Show, Venue  # noqa: E402
+
+DEFAULT_REQUESTS = 500
+PAGES = (
+    '/venues/1',
+    '/artists/1',
+    '/venues/1/edit',
+    '/artists/1/edit',
+    '/venues/create',
+    '/artists/create',
+    '/shows/create',
+)
+ARTIST_ROW = {'name': 'Bench Artist', 'city': 'San Francisco', 'state': 'CA', 'phone': '326-123-5000',
+              'genres': 'Jazz;Hip-Hop', 'facebook_link': 'https://www.facebook.com/bench'}
+
+
+def seed(engine):
+    now = datetime.today()
+    with engine.begin() as conn:
+        conn.execute(Venue.__table__.insert(), [{'id': 1, 'name': 'Bench Venue', 'city': 'San Francisco',
+                                                 'state': 'CA', 'genres': ['Jazz', 'Blues']}])
+        conn.execute(Artist.__table__.insert(), [{'id': 1, 'name': 'Bench Artist', 'city': 'San Francisco',
+                                                  'state': 'CA', 'genres': ['Jazz']}])
+        conn.execute(Show.__table__.insert(), [
+            {'venue_id': 1, 'artist_id': 1, 'start_time': now + timedelta(days=offset)}
+            for offset in range(-10, 10)
+        ])
+
+
+def throughput(fn, count):
+    started = time.perf_counter()
+    for _ in range(count):
+        fn()
+    return count / (time.perf_counter() - started)
+
+
+def main(count):
+    with app.app_context():
+        db.create_all()
+        seed(db.engine)
+    page_cache = app.extensions['page_cache']
+    client = app.test_client()
+    for path in PAGES:
+        def get():
+            page_cache.invalidate(path.split('/')[1].rstrip('s'), 1)
+            response = client.get(path)
+            assert response.status_code == 200, (path, response.status_code)
+        get()
+        print('%-18s %8.0f req/s' % (path, throughput(get, count)))
+
+    kind = KINDS['artists']
+    with app.test_request_context():
+        assert validate_row(kind, ARTIST_ROW)[1] is None, validate_row(kind, ARTIST_ROW)[1]
+        rate = throughput(lambda: validate_row(kind, ARTIST_ROW), count * 10)
+    print('%-18s %8.0f rows/s' % ('validate_row', rate))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_REQUESTS))
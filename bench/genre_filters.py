@@ -0,0 +1,97 @@
+"""Latency benchmark for the genre any/all filters at 500k artists.
+
+Tops the Artist table up to the requested size with artists carrying one to
+three random genres, then times a count and a first listing page for a few
+any/all filters. On Postgres (DATABASE_URL, migrated with flask db upgrade)
+it also prints the plan, which should be a bitmap scan of ix_artist_genres;
+otherwise it runs against a throwaway SQLite file, where the filter is a
+LIKE over the JSON list and has no index to use.
+
+    python bench/genre_filters.py [artists]
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+if 'DATABASE_URL' not in os.environ:
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(
+        tempfile.mkdtemp(prefix='fyyur-genres-'), 'genres.db')
+
+from sqlalchemy import func, select, text  # noqa: E402
+
+from app import app, db  # noqa: E402
+from enums import Genre, State  # noqa: E402
+from listings import artists_page, genre_filter  # noqa: E402
+from models import Artist  # noqa: E402
+
+DEFAULT_ARTISTS = 500000
+BATCH = 10000
+RUNS = 5
+CASES = (
+    ('any Jazz', ['Jazz'], 'any'),
+    ('any Jazz, Blues, Soul', ['Jazz', 'Blues', 'Soul'], 'any'),
+    ('all Jazz, Blues', ['Jazz', 'Blues'], 'all'),
+    ('all Jazz, Blues, Soul', ['Jazz', 'Blues', 'Soul'], 'all'),
+)
+
+
+def seed(engine, artist_count):
+    rnd = random.Random(artist_count)
+    genres = [genre.name for genre in Genre]
+    states = [state.value for state in State]
+    with engine.begin() as conn:
+        existing = conn.execute(select(func.count()).select_from(Artist)).scalar()
+    for start in range(existing, artist_count, BATCH):
+        with engine.begin() as conn:
+            conn.execute(Artist.__table__.insert(), [
+                {'name': 'Artist %d' % i,
+                 'city': 'City %d' % rnd.randrange(200),
+                 'state': rnd.choice(states),
+                 'genres': rnd.sample(genres, rnd.randint(1, 3))}
+                for i in range(start, min(start + BATCH, artist_count))
+            ])
+    if engine.dialect.name == 'postgresql':
+        with engine.begin() as conn:
+            conn.execute(text('ANALYZE "Artist"'))
+
+
+def timed(fn):
+    samples = []
+    for _ in range(RUNS):
+        started = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return result, statistics.median(samples)
+
+
+def main(artist_count):
+    with app.app_context():
+        engine = db.engine
+        if engine.dialect.name == 'sqlite':
+            db.create_all()
+        seed(engine, artist_count)
+        session = db.session
+        print('artists=%d  backend=%s  median of %d runs' % (artist_count, engine.dialect.name, RUNS))
+        for label, genres, match in CASES:
+            condition = genre_filter(session, Artist.genres, genres, match)
+            count_query = select(func.count()).select_from(Artist).where(condition)
+            count, count_ms = timed(lambda: session.execute(count_query).scalar())
+            filters = {'genres': genres, 'genre_match': match}
+            _, page_ms = timed(lambda: list(artists_page(session, filters)))
+            print('%-24s matches=%-7d count %8.1f ms  first page %7.1f ms' % (label, count, count_ms, page_ms))
+            if engine.dialect.name == 'postgresql':
+                plan = session.execute(text('EXPLAIN ' + str(count_query.compile(
+                    engine, compile_kwargs={'literal_binds': True})))).scalars().all()
+                print('    ' + '\n    '.join(line for line in plan if 'Scan' in line))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ARTISTS))
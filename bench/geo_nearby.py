@@ -0,0 +1,111 @@
+"""Latency benchmark for the nearby venue and weekend show queries at 200k venues.
+
+Tops the Venue table up to the requested size with venues scattered around
+the gazetteer's cities (about 15 km apart on average), gives each one show
+in the coming weeks, then times geo.venues_nearby and geo.shows_nearby at
+a few radii around random cities. Uses DATABASE_URL (migrated with flask db
+upgrade) or a throwaway SQLite file.
+
+    python bench/geo_nearby.py [venues]
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+if 'DATABASE_URL' not in os.environ:
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(
+        tempfile.mkdtemp(prefix='fyyur-geo-'), 'geo.db')
+
+from sqlalchemy import func, select, text  # noqa: E402
+
+from app import app, db  # noqa: E402
+from geo import KM_PER_DEGREE, encode, geocode, shows_nearby, venues_nearby, weekend  # noqa: E402
+from models import Artist, Show, Venue  # noqa: E402
+from seed import PLACES  # noqa: E402
+
+DEFAULT_VENUES = 200000
+BATCH = 10000
+RUNS = 20
+RADII = (5, 25, 100)
+SPREAD_KM = 15
+# one artist per this many venues, each playing on consecutive days
+VENUES_PER_ARTIST = 10
+
+
+def seed(engine, venue_count):
+    rnd = random.Random(venue_count)
+    today = datetime.combine(datetime.today().date(), datetime.min.time())
+    with engine.begin() as conn:
+        existing = conn.execute(select(func.count()).select_from(Venue)).scalar()
+        artists = conn.execute(select(func.count()).select_from(Artist)).scalar()
+    wanted_artists = venue_count // VENUES_PER_ARTIST + 1
+    if artists < wanted_artists:
+        with engine.begin() as conn:
+            conn.execute(Artist.__table__.insert(), [{'name': 'Artist %d' % i, 'genres': ['Jazz']}
+                                                    for i in range(artists, wanted_artists)])
+    with engine.begin() as conn:
+        artist_ids = conn.execute(select(Artist.id).order_by(Artist.id)).scalars().all()
+    for start in range(existing, venue_count, BATCH):
+        rows = []
+        for i in range(start, min(start + BATCH, venue_count)):
+            city, state = rnd.choice(PLACES)
+            lat, lon = geocode(city, state)
+            lat += rnd.gauss(0, SPREAD_KM) / KM_PER_DEGREE
+            lon += rnd.gauss(0, SPREAD_KM) / KM_PER_DEGREE
+            rows.append({'name': 'Venue %d' % i, 'city': city, 'state': state,
+                         'latitude': lat, 'longitude': lon, 'geohash': encode(lat, lon)})
+        with engine.begin() as conn:
+            first = conn.execute(select(func.coalesce(func.max(Venue.id), 0))).scalar() + 1
+            conn.execute(Venue.__table__.insert(), rows)
+            # ids are consecutive here; an artist never plays twice on a day
+            conn.execute(Show.__table__.insert(), [
+                {'venue_id': first + offset, 'artist_id': artist_ids[(start + offset) % len(artist_ids)],
+                 'start_time': today + timedelta(days=(start + offset) // len(artist_ids) % 28, hours=20)}
+                for offset in range(len(rows))])
+    if engine.dialect.name == 'postgresql':
+        with engine.begin() as conn:
+            conn.execute(text('ANALYZE "Venue"'))
+            conn.execute(text('ANALYZE "Show"'))
+
+
+def timed(fn, centers):
+    samples, found = [], []
+    for lat, lon in centers:
+        started = time.perf_counter()
+        found.append(len(fn(lat, lon)))
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return statistics.median(found), statistics.median(samples), samples[int(len(samples) * 0.95)]
+
+
+def main(venue_count):
+    with app.app_context():
+        engine = db.engine
+        if engine.dialect.name == 'sqlite':
+            db.create_all()
+        seed(engine, venue_count)
+        session = db.session
+        rnd = random.Random(1)
+        centers = [geocode(*rnd.choice(PLACES)) for _ in range(RUNS)]
+        # next week's, so that it is a whole weekend
+        today = datetime.combine(datetime.today().date(), datetime.min.time())
+        start, end = weekend(today + timedelta(days=7 - today.weekday()))
+        print('venues=%d  backend=%s  %d random cities per radius' % (venue_count, engine.dialect.name, RUNS))
+        for radius in RADII:
+            venues, p50, p95 = timed(lambda lat, lon: venues_nearby(session, lat, lon, radius), centers)
+            print('venues within %3d km  median found %5d  p50 %7.1f ms  p95 %7.1f ms' % (radius, venues, p50, p95))
+            shows, p50, p95 = timed(lambda lat, lon: shows_nearby(session, lat, lon, radius, start, end), centers)
+            print('shows  within %3d km  median found %5d  p50 %7.1f ms  p95 %7.1f ms' % (radius, shows, p50, p95))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_VENUES))
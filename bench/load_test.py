@@ -0,0 +1,108 @@
+"""Closed-loop HTTP load test for comparing the WSGI and ASGI entry points.
+
+Opens the given number of keep-alive connections, each sending GET requests
+back to back for the duration, cycling through the read pages, and reports
+throughput and p50/p95/p99 latency. Start the server under test first, e.g.
+
+    gunicorn -w 4 --threads 8 app:app -b 127.0.0.1:8000
+    uvicorn asgi:application --workers 4 --port 8000
+
+    python bench/load_test.py [--clients 500] [--duration 30] [--url http://127.0.0.1:8000]
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from urllib.parse import urlsplit
+
+PATHS = (
+    '/venues',
+    '/artists',
+    '/shows',
+    '/venues/1',
+    '/artists/1',
+)
+
+
+def percentile(samples, fraction):
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+async def get(reader, writer, host, path):
+    writer.write(('GET %s HTTP/1.1\r\nHost: %s\r\n\r\n' % (path, host)).encode('latin-1'))
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+
+async def client(number, url, paths, deadline, latencies, errors):
+    host = url.netloc
+    reader = writer = None
+    request = number
+    while time.perf_counter() < deadline:
+        path = url.path.rstrip('/') + paths[request % len(paths)]
+        request += 1
+        started = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(url.hostname, url.port or 80)
+            status = await get(reader, writer, host, path)
+        except (OSError, ValueError, IndexError, asyncio.IncompleteReadError):
+            errors.append(path)
+            if writer is not None:
+                writer.close()
+            reader = writer = None
+            continue
+        if status != 200:
+            errors.append(path)
+        latencies.append(time.perf_counter() - started)
+    if writer is not None:
+        writer.close()
+
+
+async def drive(base_url, paths, clients, duration):
+    """ Returns (latencies in seconds, failed paths, elapsed seconds). """
+    url = urlsplit(base_url)
+    latencies, errors = [], []
+    started = time.perf_counter()
+    deadline = started + duration
+    await asyncio.gather(*[client(number, url, paths, deadline, latencies, errors) for number in range(clients)])
+    return latencies, errors, time.perf_counter() - started
+
+
+async def run(args):
+    latencies, errors, elapsed = await drive(args.url, PATHS, args.clients, args.duration)
+    if not latencies:
+        print('no responses from %s' % args.url)
+        return 1
+    latencies.sort()
+    print('%s  clients=%d  %.0fs' % (args.url, args.clients, elapsed))
+    print('requests %8d  errors %d  %8.0f req/s' % (len(latencies), len(errors), len(latencies) / elapsed))
+    print('latency  mean %7.1f ms  p50 %7.1f ms  p95 %7.1f ms  p99 %7.1f ms' % (
+        statistics.mean(latencies) * 1000,
+        percentile(latencies, 0.50) * 1000,
+        percentile(latencies, 0.95) * 1000,
+        percentile(latencies, 0.99) * 1000))
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--clients', type=int, default=500)
+    parser.add_argument('--duration', type=float, default=30)
+    return asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
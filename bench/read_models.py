@@ -0,0 +1,156 @@
+"""Memory and throughput of the read models against ORM instances, per 10k rows.
+
+Fills a throwaway SQLite database with seed.py's venues and artists and a
+show for each, then loads them 10k at a time the way the pages used to and
+the way they do now:
+
+    venue entity   ORM Venue instances, identity map and all, against
+                   VenueDetail records from a column-only select()
+    venue detail   the same instances turned into dicts, as payloads.py did
+    venue card     dicts per directory row, against VenueCard
+    show row       dicts per timeline row, against ShowRow
+
+Memory is what the loaded rows keep allocated while the session that loaded
+them is open (tracemalloc), rows/sec the best of RUNS loads.
+
+    python bench/read_models.py [rows]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='fyyur-read-'), 'read.db')
+
+from sqlalchemy import select  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from app import app, db  # noqa: E402
+from models import Artist, Show, Venue  # noqa: E402
+from payloads import entity_payload  # noqa: E402
+from read_models import ShowRow, VenueCard, VenueDetail  # noqa: E402
+from seed import artist_row, venue_row  # noqa: E402
+
+DEFAULT_ROWS = 10000
+PER = 10000
+RUNS = 5
+
+
+def seed(engine, count):
+    rnd = random.Random(count)
+    today = datetime.combine(datetime.today().date(), datetime.min.time())
+    with engine.begin() as conn:
+        conn.execute(Venue.__table__.insert(), [dict(venue_row(rnd, i), id=i) for i in range(1, count + 1)])
+        conn.execute(Artist.__table__.insert(), [dict(artist_row(rnd, i), id=i) for i in range(1, count + 1)])
+        conn.execute(Show.__table__.insert(), [
+            {'venue_id': i, 'artist_id': i, 'start_time': today + timedelta(days=i % 60 - 30, hours=20)}
+            for i in range(1, count + 1)])
+
+
+#  Loaders: each returns the list a page would hold on to
+#  ----------------------------------------------------------------
+
+def orm_entities(session, count):
+    return session.query(Venue).order_by(Venue.id).limit(count).all()
+
+
+def orm_details(session, count):
+    return [entity_payload(venue) for venue in session.query(Venue).order_by(Venue.id).limit(count)]
+
+
+def read_details(session, count):
+    query = select(*[getattr(Venue, name) for name in VenueDetail.columns]).order_by(Venue.id).limit(count)
+    return [VenueDetail.from_row(row) for row in session.execute(query)]
+
+
+def _card_rows(session, count):
+    query = select(Venue.id, Venue.name, Venue.city, Venue.state,
+                   Venue.upcoming_shows_count.label('num_upcoming_shows')).order_by(Venue.id).limit(count)
+    return session.execute(query)
+
+
+def dict_cards(session, count):
+    return [{'id': row.id, 'name': row.name, 'city': row.city, 'state': row.state,
+             'num_upcoming_shows': row.num_upcoming_shows} for row in _card_rows(session, count)]
+
+
+def read_cards(session, count):
+    return [VenueCard.from_row(row) for row in _card_rows(session, count)]
+
+
+SHOW_COLUMNS = ('artist_id', 'artist_name', 'artist_image_link', 'start_time')
+
+
+def _show_rows(session, count):
+    query = select(Artist.id, Artist.name, Artist.image_link, Show.start_time
+                   ).join(Artist, Show.artist_id == Artist.id).order_by(Show.id).limit(count)
+    return session.execute(query)
+
+
+def dict_shows(session, count):
+    return [dict(zip(SHOW_COLUMNS, row)) for row in _show_rows(session, count)]
+
+
+def read_shows(session, count):
+    return [ShowRow.from_values(SHOW_COLUMNS, row) for row in _show_rows(session, count)]
+
+
+CASES = (
+    ('venue entity', orm_entities, read_details),
+    ('venue detail', orm_details, read_details),
+    ('venue card', dict_cards, read_cards),
+    ('show row', dict_shows, read_shows),
+)
+
+
+#  Measuring
+#  ----------------------------------------------------------------
+
+def memory(engine, load, count):
+    """ Bytes still allocated after the load, with its session open. """
+    with Session(engine) as session:
+        session.execute(select(Venue.id).limit(1)).all()  # connection and statement caches
+        load(session, 1)
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        rows = load(session, count)
+        used = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        assert len(rows) == count
+    return used
+
+
+def throughput(engine, load, count):
+    best = None
+    for _ in range(RUNS):
+        with Session(engine) as session:
+            started = time.perf_counter()
+            load(session, count)
+            elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return count / best
+
+
+def main(count):
+    with app.app_context():
+        engine = db.engine
+        db.create_all()
+        seed(engine, count)
+        print('rows=%d  backend=%s  memory per %d rows, best of %d loads' % (count, engine.dialect.name, PER, RUNS))
+        print('%-14s %-8s %12s %14s' % ('', '', 'KiB/10k', 'rows/sec'))
+        for name, before, after in CASES:
+            for label, load in (('before', before), ('after', after)):
+                kib = memory(engine, load, count) * PER / count / 1024
+                print('%-14s %-8s %12.0f %14.0f' % (name, label, kib, throughput(engine, load, count)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ROWS))
@@ -0,0 +1,182 @@
+"""Seeded synthetic venues, artists and shows for the benchmarks.
+
+The same seed and scale always produce the same rows (show times are
+offsets from today, so the past/upcoming split stays realistic). There is
+one venue per 20 shows and one artist per 10, at least 10 of each. Refuses
+to write into a database that already has venues. On Postgres, run
+flask db upgrade first; SQLite tables are created as needed.
+
+    python bench/seed.py --database-url URL [--shows 100000] [--seed 1]
+"""
+import argparse
+import csv
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+from enums import Genre  # noqa: E402
+
+DEFAULT_SHOWS = 10000
+# show starts; 120-minute shows at these hours never overlap
+SLOTS = (18, 21)
+DEFAULT_SEED = 1
+BATCH = 10000
+WORDS = ('Blue', 'Red', 'Electric', 'Velvet', 'Golden', 'Silver', 'Midnight', 'Lucky', 'Wild', 'Hidden',
+         'Lantern', 'Echo', 'Harbor', 'Garden', 'Tiger', 'River', 'Moon', 'Owl', 'Fox', 'Crown')
+GENRES = [genre.name for genre in Genre]
+# the gazetteer's cities, so that venues can be geocoded
+with open(os.path.join(ROOT, 'data', 'gazetteer.csv'), newline='', encoding='utf-8') as _source:
+    PLACES = [(row['city'], row['state']) for row in csv.DictReader(_source) if row['city']]
+
+
+class Dataset(object):
+    """ Scale of a seeded database and deterministic ids/values drawn from it. """
+
+    def __init__(self, shows, seed=DEFAULT_SEED, venues=None, artists=None):
+        self.shows = shows
+        self.venues = venues or max(10, shows // 20)
+        self.artists = artists or max(10, shows // 10)
+        self.seed = seed
+        self.rnd = random.Random(seed)
+
+    def venue_id(self):
+        return self.rnd.randint(1, self.venues)
+
+    def artist_id(self):
+        return self.rnd.randint(1, self.artists)
+
+    def point(self):
+        """ (lat, lon) of one of the seeded cities. """
+        from geo import geocode
+
+        return geocode(*self.rnd.choice(PLACES))
+
+    def word(self):
+        return self.rnd.choice(WORDS)
+
+    def as_dict(self):
+        return {'shows': self.shows, 'venues': self.venues, 'artists': self.artists, 'seed': self.seed}
+
+
+def _name(rnd, noun):
+    return '%s %s %s' % (rnd.choice(WORDS), rnd.choice(WORDS), noun)
+
+
+def venue_row(rnd, number):
+    city, state = rnd.choice(PLACES)
+    return {
+        'name': _name(rnd, 'Hall'),
+        'city': city,
+        'state': state,
+        'address': '%d %s Street' % (rnd.randrange(1, 2000), rnd.choice(WORDS)),
+        'phone': '%03d-%03d-%04d' % (rnd.randrange(200, 999), rnd.randrange(1000), rnd.randrange(10000)),
+        'genres': rnd.sample(GENRES, rnd.randint(1, 3)),
+        'image_link': 'https://images.example.com/venues/%d.jpg' % number,
+        'facebook_link': 'https://www.facebook.com/venue%d' % number,
+        'website': 'https://venue%d.example.com' % number,
+        'seeking_talent': rnd.random() < 0.3,
+        'seeking_description': 'Looking for local acts.',
+    }
+
+
+def artist_row(rnd, number):
+    city, state = rnd.choice(PLACES)
+    return {
+        'name': _name(rnd, 'Band'),
+        'city': city,
+        'state': state,
+        'phone': '%03d-%03d-%04d' % (rnd.randrange(200, 999), rnd.randrange(1000), rnd.randrange(10000)),
+        'genres': rnd.sample(GENRES, rnd.randint(1, 3)),
+        'image_link': 'https://images.example.com/artists/%d.jpg' % number,
+        'facebook_link': 'https://www.facebook.com/artist%d' % number,
+        'website': 'https://artist%d.example.com' % number,
+        'seeking_venue': rnd.random() < 0.3,
+        'seeking_description': 'Touring this year.',
+    }
+
+
+def show_rows(rnd, dataset, today):
+    """ Shows with no double-booked venue or artist (the exclusion
+    constraints reject them on Postgres); a collision is drawn again. """
+    booked = set()
+    for _ in range(dataset.shows):
+        while True:
+            venue_id, artist_id = rnd.randint(1, dataset.venues), rnd.randint(1, dataset.artists)
+            day, hour = rnd.randrange(-365, 365), rnd.choice(SLOTS)
+            if (0, venue_id, day, hour) not in booked and (1, artist_id, day, hour) not in booked:
+                break
+        booked.add((0, venue_id, day, hour))
+        booked.add((1, artist_id, day, hour))
+        yield {'venue_id': venue_id, 'artist_id': artist_id,
+               'start_time': today + timedelta(days=day, hours=hour)}
+
+
+def _insert(engine, table, rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == BATCH:
+            with engine.begin() as conn:
+                conn.execute(table.insert(), batch)
+            batch = []
+    if batch:
+        with engine.begin() as conn:
+            conn.execute(table.insert(), batch)
+
+
+def generate(session, shows=DEFAULT_SHOWS, seed=DEFAULT_SEED):
+    """ Fill an empty database and initialise the show counters. """
+    from sqlalchemy import func, select
+
+    from counters import check_counters
+    from geo import location_columns
+    from models import Artist, Show, Venue
+
+    engine = session.get_bind()
+    if session.execute(select(func.count()).select_from(Venue)).scalar():
+        raise RuntimeError('refusing to seed a database that already has venues')
+    session.rollback()
+
+    dataset = Dataset(shows, seed)
+    rnd = random.Random(seed)
+    today = datetime.combine(datetime.today().date(), datetime.min.time())
+    venues = (venue_row(rnd, i) for i in range(1, dataset.venues + 1))
+    _insert(engine, Venue.__table__, (dict(venue, id=i, **location_columns(venue['city'], venue['state']))
+                                      for i, venue in enumerate(venues, 1)))
+    _insert(engine, Artist.__table__, (dict(artist_row(rnd, i), id=i) for i in range(1, dataset.artists + 1)))
+    _insert(engine, Show.__table__, show_rows(rnd, dataset, today))
+    if engine.dialect.name == 'postgresql':
+        # explicit ids bypassed the sequences
+        for model, count in ((Venue, dataset.venues), (Artist, dataset.artists)):
+            sequence = func.pg_get_serial_sequence('"%s"' % model.__tablename__, 'id')
+            session.execute(select(func.setval(sequence, count)))
+        session.commit()
+    check_counters(session, repair=True)
+    return dataset
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--database-url', required=True)
+    parser.add_argument('--shows', type=int, default=DEFAULT_SHOWS)
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    args = parser.parse_args()
+    os.environ['DATABASE_URL'] = args.database_url
+
+    from app import app, db
+
+    with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            db.create_all()
+        dataset = generate(db.session, args.shows, args.seed)
+    print('seeded %(venues)d venues, %(artists)d artists, %(shows)d shows (seed %(seed)d)' % dataset.as_dict())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,324 @@
+"""Benchmark every route against a seeded database and compare with a baseline.
+
+Seeds a database with bench/seed.py, then sends each route in ROUTES a
+number of requests through the test client. For every route it records
+latency p50/p95/p99, SQL statements per request (from the Server-Timing
+header) and the process RSS. With --http it also runs a multi-process
+HTTP load test (bench/load_test.py) over the GET routes against a server
+started separately on the same database.
+
+--out writes the results as a JSON baseline. --compare reads one back
+and exits 1 if any route's p50 or p95 grew by more than --threshold, issues
+more statements, or fails more often.
+
+By default it uses a throwaway SQLite file; pass --database-url for an
+empty, migrated Postgres database, or --reuse to run against data that
+is already there.
+
+    python bench/suite.py [--shows 10000] [--requests 200] [--out bench/baseline.json]
+    python bench/suite.py --compare bench/baseline.json [--threshold 0.2]
+    python bench/suite.py --database-url URL --reuse --http http://127.0.0.1:8000 --processes 4
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import re
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import load_test
+import seed
+from load_test import percentile
+
+DEFAULT_REQUESTS = 200
+DEFAULT_THRESHOLD = 0.2
+# latency changes smaller than this are noise whatever the ratio
+MIN_REGRESSION_MS = 1.0
+# p99 of a few hundred samples is mostly noise, so it is reported but not compared
+COMPARED = ('p50_ms', 'p95_ms')
+WARMUP = 3
+SERVER_TIMING_QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+def venue_form(data):
+    form = seed.venue_row(data.rnd, 0)
+    form['website_link'] = form.pop('website')
+    form['seeking_talent'] = 'y' if form['seeking_talent'] else ''
+    return form
+
+
+def artist_form(data):
+    form = seed.artist_row(data.rnd, 0)
+    form['website_link'] = form.pop('website')
+    form['seeking_venue'] = 'y' if form['seeking_venue'] else ''
+    return form
+
+
+def show_form(data):
+    # past the seeded shows and 3 hours apart, so no booking conflicts
+    start = datetime.combine(datetime.today().date(), datetime.min.time()) + timedelta(
+        days=400, hours=3 * next(data.show_slots))
+    return {'venue_id': data.venue_id(), 'artist_id': data.artist_id(),
+            'start_time': start.strftime('%Y-%m-%d %H:%M:%S')}
+
+
+# endpoint -> (method, builder returning (path, form data)); every rule in
+# app.url_map should be listed here or in SKIPPED
+ROUTES = {
+    'index': ('GET', lambda data: ('/', None)),
+    'venues': ('GET', lambda data: ('/venues', None)),
+    'nearby_venues': ('GET', lambda data: ('/venues/nearby?lat=%s&lon=%s&radius=50' % data.point(), None)),
+    'search_venues': ('POST', lambda data: ('/venues/search', {'search_term': data.word()})),
+    'show_venue': ('GET', lambda data: ('/venues/%d' % data.venue_id(), None)),
+    'create_venue_form': ('GET', lambda data: ('/venues/create', None)),
+    'create_venue_submission': ('POST', lambda data: ('/venues/create', venue_form(data))),
+    'delete_venue': ('DELETE', lambda data: ('/venues/%d' % data.spare_venue_id(), None)),
+    'edit_venue': ('GET', lambda data: ('/venues/%d/edit' % data.venue_id(), None)),
+    'edit_venue_submission': ('POST', lambda data: ('/venues/%d/edit' % data.venue_id(), venue_form(data))),
+    'artists': ('GET', lambda data: ('/artists', None)),
+    'search_artists': ('POST', lambda data: ('/artists/search', {'search_term': data.word()})),
+    'show_artist': ('GET', lambda data: ('/artists/%d' % data.artist_id(), None)),
+    'create_artist_form': ('GET', lambda data: ('/artists/create', None)),
+    'create_artist_submission': ('POST', lambda data: ('/artists/create', artist_form(data))),
+    'edit_artist': ('GET', lambda data: ('/artists/%d/edit' % data.artist_id(), None)),
+    'edit_artist_submission': ('POST', lambda data: ('/artists/%d/edit' % data.artist_id(), artist_form(data))),
+    'shows': ('GET', lambda data: ('/shows', None)),
+    'create_shows': ('GET', lambda data: ('/shows/create', None)),
+    'create_show_submission': ('POST', lambda data: ('/shows/create', show_form(data))),
+    'api.venues': ('GET', lambda data: ('/api/v1/venues', None)),
+    'api.venue': ('GET', lambda data: ('/api/v1/venues/%d' % data.venue_id(), None)),
+    'api.artists': ('GET', lambda data: ('/api/v1/artists', None)),
+    'api.artist': ('GET', lambda data: ('/api/v1/artists/%d' % data.artist_id(), None)),
+    'api.shows': ('GET', lambda data: ('/api/v1/shows', None)),
+    'api.venue_free_slots': ('GET', lambda data: ('/api/v1/venues/%d/free-slots' % data.venue_id(), None)),
+    'api.artist_free_slots': ('GET', lambda data: ('/api/v1/artists/%d/free-slots' % data.artist_id(), None)),
+    'api.nearby_venues': ('GET', lambda data: ('/api/v1/venues/nearby?lat=%s&lon=%s&radius=50' % data.point(), None)),
+    'api.nearby_shows': ('GET', lambda data: ('/api/v1/shows/nearby?lat=%s&lon=%s&radius=50' % data.point(), None)),
+    'api.search_entities': ('GET', lambda data: ('/api/v1/search/venues?q=%s' % data.word(), None)),
+    'pool_metrics_view': ('GET', lambda data: ('/_metrics/pool', None)),
+    'template_metrics_view': ('GET', lambda data: ('/_metrics/templates', None)),
+    'job_metrics_view': ('GET', lambda data: ('/_metrics/jobs', None)),
+    'snapshot_metrics_view': ('GET', lambda data: ('/_metrics/snapshots', None)),
+    'assets': ('GET', lambda data: ('/static/dist/%s' % data.assets['main.css'], None)),
+}
+SKIPPED = {'static'}
+
+
+class BenchData(seed.Dataset):
+    """ Dataset plus throwaway venues for the DELETE route and the
+    manifest of the asset build. """
+
+    def __init__(self, engine, *args, **kwargs):
+        super(BenchData, self).__init__(*args, **kwargs)
+        self.engine = engine
+        self.show_slots = itertools.count()
+        self.assets = {}
+
+    def spare_venue_id(self):
+        from models import Venue
+
+        with self.engine.begin() as conn:
+            return conn.execute(Venue.__table__.insert().values(seed.venue_row(self.rnd, 0))).inserted_primary_key[0]
+
+
+def rss_mb():
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2.0 ** 20
+    except (OSError, ValueError):
+        # peak rather than current, but comparable between runs
+        return peak_rss_mb()
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2.0 ** 20 if sys.platform == 'darwin' else peak / 1024.0
+
+
+def summarize(latencies):
+    latencies = sorted(latencies)
+    return {
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+    }
+
+
+def bench_route(client, data, method, build, count):
+    latencies, queries, errors = [], [], 0
+    for number in range(WARMUP + count):
+        path, form = build(data)
+        started = time.perf_counter()
+        response = client.open(path, method=method, data=form)
+        elapsed = time.perf_counter() - started
+        response.close()
+        if number < WARMUP:
+            continue
+        latencies.append(elapsed)
+        if response.status_code >= 400:
+            errors += 1
+        match = SERVER_TIMING_QUERIES.search(response.headers.get('Server-Timing', ''))
+        queries.append(int(match.group(1)) if match else 0)
+    result = summarize(latencies)
+    result.update(queries=round(sum(queries) / float(len(queries)), 2), queries_max=max(queries),
+                  errors=errors, rss_mb=round(rss_mb(), 1))
+    return result
+
+
+def _http_worker(job):
+    url, paths, clients, duration = job
+    latencies, errors, _ = asyncio.run(load_test.drive(url, paths, clients, duration))
+    return latencies, len(errors)
+
+
+def bench_http(url, data, processes, clients, duration):
+    paths = []
+    for endpoint, (method, build) in sorted(ROUTES.items()):
+        if method == 'GET' and not endpoint.endswith('metrics_view'):
+            paths.extend(build(data)[0] for _ in range(20))
+    data.rnd.shuffle(paths)
+    with multiprocessing.Pool(processes) as pool:
+        results = pool.map(_http_worker, [(url, paths[number::processes], clients, duration)
+                                          for number in range(processes)])
+    latencies = [latency for result, _ in results for latency in result]
+    if not latencies:
+        raise RuntimeError('no responses from %s' % url)
+    result = summarize(latencies)
+    result.update(requests=len(latencies), rps=round(len(latencies) / duration, 1),
+                  errors=sum(errors for _, errors in results),
+                  processes=processes, clients=processes * clients)
+    return result
+
+
+def compare(baseline, current, threshold):
+    """ Regression messages, empty if none. """
+    regressions = []
+    for key in ('backend', 'shows', 'requests'):
+        if baseline['meta'].get(key) != current['meta'].get(key):
+            print('note: %s differs from the baseline (%s vs %s)' % (
+                key, current['meta'].get(key), baseline['meta'].get(key)))
+    pairs = [(endpoint, baseline['routes'][endpoint], result)
+             for endpoint, result in sorted(current['routes'].items()) if endpoint in baseline['routes']]
+    if 'http' in baseline and 'http' in current:
+        pairs.append(('http', baseline['http'], current['http']))
+    for name, before, after in pairs:
+        for key in COMPARED:
+            if after[key] > before[key] * (1 + threshold) and after[key] - before[key] > MIN_REGRESSION_MS:
+                regressions.append('%s %s %.1f -> %.1f' % (name, key, before[key], after[key]))
+        if after.get('queries_max', 0) > before.get('queries_max', 0):
+            regressions.append('%s queries %d -> %d' % (name, before['queries_max'], after['queries_max']))
+        if after['errors'] > before['errors']:
+            regressions.append('%s errors %d -> %d' % (name, before['errors'], after['errors']))
+    if current['rss_peak_mb'] > baseline['rss_peak_mb'] * (1 + threshold):
+        regressions.append('peak RSS %.0f -> %.0f MB' % (baseline['rss_peak_mb'], current['rss_peak_mb']))
+    return regressions
+
+
+def print_results(results):
+    print('%(backend)s  shows=%(shows)d venues=%(venues)d artists=%(artists)d  requests/route=%(requests)d'
+          % results['meta'])
+    print('%-26s %9s %9s %9s %8s %6s %8s' % ('route', 'p50 ms', 'p95 ms', 'p99 ms', 'queries', 'errors', 'rss MB'))
+    for endpoint, result in sorted(results['routes'].items()):
+        print('%-26s %9.2f %9.2f %9.2f %8.1f %6d %8.1f' % (
+            endpoint, result['p50_ms'], result['p95_ms'], result['p99_ms'],
+            result['queries'], result['errors'], result['rss_mb']))
+    if 'http' in results:
+        print('%-26s %9.2f %9.2f %9.2f %8s %6d  %.0f req/s' % (
+            'http (%d clients)' % results['http']['clients'], results['http']['p50_ms'], results['http']['p95_ms'],
+            results['http']['p99_ms'], '', results['http']['errors'], results['http']['rps']))
+    print('peak RSS %.1f MB' % results['rss_peak_mb'])
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--database-url', help='Defaults to a throwaway SQLite file.')
+    parser.add_argument('--reuse', action='store_true', help='Benchmark the data already in the database.')
+    parser.add_argument('--shows', type=int, default=seed.DEFAULT_SHOWS)
+    parser.add_argument('--seed', type=int, default=seed.DEFAULT_SEED)
+    parser.add_argument('--requests', type=int, default=DEFAULT_REQUESTS, help='Timed requests per route.')
+    parser.add_argument('--routes', help='Comma-separated endpoints, default all.')
+    parser.add_argument('--http', metavar='URL', help='Also load test a running server on the same database.')
+    parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--clients', type=int, default=50, help='Connections per load test process.')
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--out', help='Write the results to this JSON file.')
+    parser.add_argument('--compare', metavar='BASELINE', help='Exit 1 on regressions against this JSON file.')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    os.environ['DATABASE_URL'] = args.database_url or 'sqlite:///' + os.path.join(
+        tempfile.mkdtemp(prefix='fyyur-suite-'), 'suite.db')
+    # measure, don't enforce; and keep the per-request log lines out of the output
+    os.environ['QUERY_BUDGET_STRICT'] = '0'
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    os.environ.setdefault('METRICS_ENDPOINT', '1')
+    # the seeded image links point nowhere
+    os.environ.setdefault('CHECK_IMAGE_LINKS', '0')
+    os.environ.setdefault('ASSETS_DIR', tempfile.mkdtemp(prefix='fyyur-assets-'))
+
+    from sqlalchemy import func, select
+
+    from app import app, db
+    from assets import build_assets
+    from models import Artist, Show, Venue
+
+    with app.app_context():
+        engine = db.engine
+        if args.reuse:
+            counts = [db.session.execute(select(func.count()).select_from(model)).scalar()
+                      for model in (Show, Venue, Artist)]
+            data = BenchData(engine, counts[0], args.seed, venues=counts[1], artists=counts[2])
+        else:
+            if engine.dialect.name == 'sqlite':
+                db.create_all()
+            seeded = seed.generate(db.session, args.shows, args.seed)
+            data = BenchData(engine, seeded.shows, args.seed, venues=seeded.venues, artists=seeded.artists)
+        db.session.remove()
+        data.assets = build_assets(app)
+        app.extensions['assets'].reload()
+
+        endpoints = set(rule.endpoint for rule in app.url_map.iter_rules()) - SKIPPED
+        for endpoint in sorted(endpoints - set(ROUTES)):
+            print('warning: no benchmark for route %s, add it to ROUTES' % endpoint, file=sys.stderr)
+        if args.routes:
+            endpoints &= set(args.routes.split(','))
+
+        results = {'meta': dict(data.as_dict(), backend=engine.dialect.name, requests=args.requests,
+                                python=platform.python_version(), date=datetime.now().isoformat()),
+                   'routes': {}}
+        client = app.test_client()
+        for endpoint in sorted(endpoints & set(ROUTES)):
+            results['routes'][endpoint] = bench_route(client, data, *ROUTES[endpoint], count=args.requests)
+    errors = sum(result['errors'] for result in results['routes'].values())
+    if args.http:
+        results['http'] = bench_http(args.http, data, args.processes, args.clients, args.duration)
+    results['rss_peak_mb'] = round(peak_rss_mb(), 1)
+
+    print_results(results)
+    if args.out:
+        with open(args.out, 'w') as out:
+            json.dump(results, out, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as baseline:
+            regressions = compare(json.load(baseline), results, args.threshold)
+        for regression in regressions:
+            print('REGRESSION: ' + regression)
+        if regressions:
+            return 1
+        print('OK: no regressions against %s' % args.compare)
+    # a smoke test too: every route has to answer
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
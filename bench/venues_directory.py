@@ -0,0 +1,85 @@
+"""Query-count and latency benchmark for the /venues directory.
+
+Seeds a throwaway SQLite database at increasing venue counts and checks that
+the number of SQL statements issued by GET /venues stays constant.
+
+    python bench/venues_directory.py [100 1000 10000 100000]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+DB_PATH = os.path.join(tempfile.mkdtemp(prefix='fyyur-bench-'), 'bench.db')
+os.environ['DATABASE_URL'] = 'sqlite:///' + DB_PATH
+
+from sqlalchemy import event  # noqa: E402
+
+from app import app, db  # noqa: E402
+from models import Artist, Show, Venue  # noqa: E402
+from enums import State  # noqa: E402
+
+DEFAULT_SCALES = [100, 1000, 10000, 100000]
+SHOWS_PER_VENUE = 3
+
+
+def seed(engine, venue_count):
+    rnd = random.Random(venue_count)
+    states = [state.value for state in State]
+    now = datetime.today()
+    with engine.begin() as conn:
+        conn.execute(Show.__table__.delete())
+        conn.execute(Venue.__table__.delete())
+        conn.execute(Artist.__table__.delete())
+        conn.execute(Artist.__table__.insert(), [
+            {'id': i, 'name': 'Artist %d' % i} for i in range(1, 101)
+        ])
+        conn.execute(Venue.__table__.insert(), [
+            {'id': i,
+             'name': 'Venue %d' % i,
+             'city': 'City %d' % rnd.randrange(50),
+             'state': rnd.choice(states)}
+            for i in range(1, venue_count + 1)
+        ])
+        conn.execute(Show.__table__.insert(), [
+            {'venue_id': venue_id,
+             'artist_id': artist_id,
+             'start_time': now + timedelta(days=rnd.randrange(-365, 365))}
+            for venue_id in range(1, venue_count + 1)
+            for artist_id in rnd.sample(range(1, 101), SHOWS_PER_VENUE)
+        ])
+
+
+def main(scales):
+    with app.app_context():
+        engine = db.engine
+        Venue.metadata.create_all(engine)
+        statements = []
+        event.listen(engine, 'before_cursor_execute',
+                     lambda *args: statements.append(args[2]))
+        client = app.test_client()
+        counts = set()
+        for venue_count in scales:
+            seed(engine, venue_count)
+            del statements[:]
+            started = time.perf_counter()
+            response = client.get('/venues')
+            elapsed = (time.perf_counter() - started) * 1000
+            assert response.status_code == 200, response.status_code
+            counts.add(len(statements))
+            print('venues=%-7d queries=%d  %.1f ms' % (venue_count, len(statements), elapsed))
+    if len(counts) != 1:
+        print('FAIL: query count grew with venue count: %s' % sorted(counts))
+        return 1
+    print('OK: constant query count (%d)' % counts.pop())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main([int(arg) for arg in sys.argv[1:]] or DEFAULT_SCALES))
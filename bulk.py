@@ -0,0 +1,329 @@
+import csv
+import io
+import json
+import threading
+from collections import namedtuple
+from datetime import datetime
+from itertools import islice
+
+from sqlalchemy import select, text
+from werkzeug.datastructures import MultiDict
+
+from enums import Genre
+from forms import ArtistForm, ShowForm, VenueForm
+from counters import apply_shows, ensure_watermark
+from models import DEFAULT_SHOW_MINUTES, Artist, Show, Venue
+from geo import location_columns
+from scheduling import check_schedule
+
+#----------------------------------------------------------------------------#
+# Bulk import / export.
+#----------------------------------------------------------------------------#
+
+DEFAULT_CHUNK_SIZE = 1000
+
+Kind = namedtuple('Kind', 'model form columns')
+
+KINDS = {
+    'venues': Kind(Venue, VenueForm, ('id', 'name', 'city', 'state', 'address', 'phone', 'genres',
+                                      'image_link', 'facebook_link', 'website', 'seeking_talent',
+                                      'seeking_description')),
+    'artists': Kind(Artist, ArtistForm, ('id', 'name', 'city', 'state', 'phone', 'genres', 'image_link',
+                                         'facebook_link', 'website', 'seeking_venue', 'seeking_description')),
+    'shows': Kind(Show, ShowForm, ('id', 'venue_id', 'artist_id', 'start_time', 'duration_minutes')),
+}
+# model column -> form field, where they differ
+FORM_FIELDS = {'website': 'website_link'}
+LIST_SEPARATOR = ';'
+
+
+class RowError(object):
+
+    def __init__(self, line, errors):
+        self.line = line
+        self.errors = errors
+
+    def as_dict(self):
+        return {'line': self.line, 'errors': self.errors}
+
+
+#  Reading
+#  ----------------------------------------------------------------
+
+def read_csv_rows(stream):
+    reader = csv.DictReader(stream)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def read_jsonl_rows(stream):
+    for line, raw in enumerate(stream, 1):
+        if raw.strip():
+            try:
+                row = json.loads(raw)
+            except ValueError as error:
+                yield line, error
+                continue
+            yield line, row if isinstance(row, dict) else ValueError('Expected a JSON object.')
+
+
+def chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+#  Validation
+#  ----------------------------------------------------------------
+
+def _as_list(value):
+    if value is None or value == '':
+        return []
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return [item.strip() for item in str(value).split(LIST_SEPARATOR) if item.strip()]
+
+
+def _formdata(kind, row):
+    data = MultiDict()
+    for column in kind.columns:
+        value = row.get(column)
+        if value is None or column == 'id':
+            continue
+        field = FORM_FIELDS.get(column, column)
+        if column == 'genres':
+            # accept display values ("Hip-Hop") as well as choice keys ("HipHop")
+            for genre in _as_list(value):
+                try:
+                    data.add(field, Genre.lookup(genre).name)
+                except ValueError:
+                    # left for the form to reject
+                    data.add(field, genre)
+        elif isinstance(value, bool):
+            if value:
+                data.add(field, 'y')
+        elif str(value).lower() in ('false', 'no', 'n', '0') and column.startswith('seeking_'):
+            continue
+        else:
+            data.add(field, str(value))
+    return data
+
+
+_forms = threading.local()
+
+
+def _bound_form(kind, formdata):
+    # binding a form's fields costs more than validating them, so each
+    # thread keeps one instance per form class and reprocesses it per row
+    forms = _forms.__dict__.setdefault('forms', {})
+    form = forms.get(kind.form)
+    if form is None:
+        form = forms[kind.form] = kind.form(formdata=formdata)
+    else:
+        form.process(formdata=formdata)
+    return form
+
+
+def validate_row(kind, row):
+    """ Run a raw row through the kind's form; return (record, errors). """
+    form = _bound_form(kind, _formdata(kind, row))
+    if not form.validate():
+        return None, form.errors
+    record = {}
+    for column in kind.columns:
+        if column == 'id':
+            if row.get('id') not in (None, ''):
+                try:
+                    record['id'] = int(row['id'])
+                except ValueError:
+                    return None, {'id': ['Not a valid integer.']}
+            continue
+        record[column] = form.data[FORM_FIELDS.get(column, column)]
+    return record, None
+
+
+def _resolve_show_references(session, records, rows):
+    """ Fill venue_id / artist_id from venue_name / artist_name columns. """
+    lookups = (('venue', Venue), ('artist', Artist))
+    errors = {}
+    for prefix, model in lookups:
+        names = set(row.get(prefix + '_name') for _, row in rows
+                    if not row.get(prefix + '_id') and row.get(prefix + '_name'))
+        ids = dict(session.execute(select(model.name, model.id).where(model.name.in_(names))).all()) if names else {}
+        wanted = set(int(row[prefix + '_id']) for _, row in rows
+                     if str(row.get(prefix + '_id') or '').isdigit())
+        known = set(session.execute(select(model.id).where(model.id.in_(wanted))).scalars()) if wanted else set()
+        for index, (_, row) in enumerate(rows):
+            if records[index] is None:
+                continue
+            value = row.get(prefix + '_id')
+            if str(value or '').isdigit() and int(value) in known:
+                records[index][prefix + '_id'] = int(value)
+            elif not value and row.get(prefix + '_name') in ids:
+                records[index][prefix + '_id'] = ids[row[prefix + '_name']]
+            else:
+                errors.setdefault(index, {})[prefix] = ['Unknown %s %r.' % (prefix, value or row.get(prefix + '_name'))]
+    return errors
+
+
+#  Loading
+#  ----------------------------------------------------------------
+
+def _copy_value(value):
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple)):
+        # Postgres array literal
+        return '{' + ','.join('"%s"' % item.replace('\\', '\\\\').replace('"', '\\"') for item in value) + '}'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    return value
+
+
+def _copy(connection, table, columns, records):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for record in records:
+        writer.writerow([_copy_value(record.get(column)) for column in columns])
+    buffer.seek(0)
+    quoted = ', '.join('"%s"' % column for column in columns)
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert('COPY "%s" (%s) FROM STDIN WITH (FORMAT csv)' % (table.name, quoted), buffer)
+    finally:
+        cursor.close()
+
+
+def _load(connection, kind, records):
+    """ COPY on Postgres, executemany everywhere else. """
+    table = kind.model.__table__
+    if kind.model is Venue:
+        # COPY and executemany bypass geo's before_insert hook too
+        for record in records:
+            record.update(location_columns(record.get('city'), record.get('state')))
+    if kind.model is Show:
+        ensure_watermark(connection)
+    by_columns = {}
+    for record in records:
+        by_columns.setdefault(tuple(sorted(record)), []).append(record)
+    for columns, group in by_columns.items():
+        if connection.dialect.name == 'postgresql':
+            _copy(connection, table, columns, group)
+        else:
+            connection.execute(table.insert(), group)
+    if kind.model is Show:
+        # COPY and executemany bypass the ORM events that keep the counters
+        apply_shows(connection, [(record['venue_id'], record['artist_id'], record.get('start_time'))
+                                 for record in records])
+
+
+def _reset_sequence(connection, kind):
+    if connection.dialect.name == 'postgresql':
+        table = kind.model.__table__.name
+        connection.execute(text(
+            "SELECT setval(pg_get_serial_sequence('\"%s\"', 'id'), coalesce(max(id), 0) + 1, false) FROM \"%s\""
+            % (table, table)))
+
+
+def _touched(kind, record):
+    """ The (page kind, id) pairs a loaded record changes: the venue and
+    artist of a show, otherwise the row itself when its id was given. """
+    if kind.model is Show:
+        return (('venue', record['venue_id']), ('artist', record['artist_id']))
+    if record.get('id') is None:
+        return ()
+    return ((kind.model.__name__.lower(), record['id']),)
+
+
+def import_rows(session, kind_name, rows, chunk_size=DEFAULT_CHUNK_SIZE):
+    """ Validate and load (line, row) pairs in bounded chunks.
+
+    Invalid rows are reported and skipped. A chunk that the database
+    rejects is retried row by row so only the offending rows are lost.
+    Returns (loaded count, list of RowError, set of the (kind, id) pairs
+    the loaded rows touched, for cache invalidation).
+    """
+    kind = KINDS[kind_name]
+    loaded, errors, touched = 0, [], set()
+    engine = session.get_bind()
+    for chunk in chunks(rows, chunk_size):
+        records = []
+        for line, row in chunk:
+            if isinstance(row, Exception):
+                errors.append(RowError(line, {'row': [str(row)]}))
+                records.append(None)
+                continue
+            record, row_errors = validate_row(kind, row)
+            if row_errors:
+                errors.append(RowError(line, row_errors))
+            records.append(record)
+        if kind_name == 'shows':
+            valid_rows = [(line, row if not isinstance(row, Exception) else {}) for line, row in chunk]
+            for index, row_errors in _resolve_show_references(session, records, valid_rows).items():
+                errors.append(RowError(chunk[index][0], row_errors))
+                records[index] = None
+            # the whole chunk against the calendar and itself, in one pass
+            scheduled = [(index, record) for index, record in enumerate(records) if record is not None]
+            for _, record in scheduled:
+                record['duration_minutes'] = record.get('duration_minutes') or DEFAULT_SHOW_MINUTES
+            for position, row_errors in check_schedule(session, [record for _, record in scheduled]).items():
+                index = scheduled[position][0]
+                errors.append(RowError(chunk[index][0], row_errors))
+                records[index] = None
+
+        batch = [(line, record) for (line, _), record in zip(chunk, records) if record is not None]
+        try:
+            with engine.begin() as connection:
+                _load(connection, kind, [record for _, record in batch])
+            loaded += len(batch)
+            for _, record in batch:
+                touched.update(_touched(kind, record))
+        except Exception:
+            for line, record in batch:
+                try:
+                    with engine.begin() as connection:
+                        _load(connection, kind, [record])
+                    loaded += 1
+                    touched.update(_touched(kind, record))
+                except Exception as error:
+                    errors.append(RowError(line, {'database': [str(getattr(error, 'orig', error)).strip()]}))
+    with engine.begin() as connection:
+        _reset_sequence(connection, kind)
+    errors.sort(key=lambda error: error.line)
+    return loaded, errors, touched
+
+
+#  Export
+#  ----------------------------------------------------------------
+
+def _export_value(value):
+    if isinstance(value, datetime):
+        # the format ShowForm.start_time parses back
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    return value
+
+
+def export_rows(session, kind_name, chunk_size=DEFAULT_CHUNK_SIZE):
+    """ Yield row dicts straight off a server-side cursor. """
+    kind = KINDS[kind_name]
+    table = kind.model.__table__
+    query = select(*[table.c[column] for column in kind.columns]).order_by(table.c.id)
+    result = session.execute(query.execution_options(stream_results=True, yield_per=chunk_size))
+    for row in result:
+        yield dict((column, _export_value(value)) for column, value in zip(kind.columns, row))
+
+
+def write_rows(stream, kind_name, rows, format):
+    columns = KINDS[kind_name].columns
+    if format == 'csv':
+        writer = csv.writer(stream)
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow([LIST_SEPARATOR.join(value) if isinstance(value, list) else value
+                             for value in (row[column] for column in columns)])
+    else:
+        for row in rows:
+            stream.write(json.dumps(row) + '\n')
@@ -0,0 +1,194 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+try:
+    import redis
+except ImportError:  # optional backend
+    redis = None
+
+#----------------------------------------------------------------------------#
+# Cache backends.
+#----------------------------------------------------------------------------#
+
+class LRUCache(object):
+    """ Thread-safe in-process LRU with hit/miss/eviction counters.
+
+    Every worker process gets its own copy, so invalidation only reaches the
+    process that handled the write; use the Redis backend when running more
+    than one worker.
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        return {'backend': 'lru',
+                'entries': len(self._data),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions}
+
+
+class RedisCache(object):
+    """ Backend for any local Redis-compatible server, shared by all workers. """
+
+    def __init__(self, url, prefix='fyyur:'):
+        if redis is None:
+            raise RuntimeError('CACHE_BACKEND = "redis" needs the redis package installed')
+        self._client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self._client.get(self.prefix + key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return pickle.loads(value)
+
+    def set(self, key, value, ttl=None):
+        self._client.set(self.prefix + key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), ex=ttl)
+
+    def delete(self, *keys):
+        if keys:
+            self._client.delete(*[self.prefix + key for key in keys])
+
+    def clear(self):
+        keys = list(self._client.scan_iter(self.prefix + '*'))
+        if keys:
+            self._client.delete(*keys)
+
+    def stats(self):
+        return {'backend': 'redis',
+                'hits': self.hits,
+                'misses': self.misses,
+                # server-wide, redis does not track evictions per prefix
+                'evictions': self._client.info('stats').get('evicted_keys', 0)}
+
+
+#----------------------------------------------------------------------------#
+# Page cache.
+#----------------------------------------------------------------------------#
+
+PARTS = ('payload', 'html')
+
+
+class PageCache(object):
+    """ Detail payloads and rendered pages keyed by entity and "now" bucket.
+
+    Past and upcoming shows are split at the start of the current bucket,
+    so everything cached under a bucket key is consistent with it and
+    entries from earlier buckets simply stop being read.
+    """
+
+    def __init__(self, backend, bucket_seconds=300):
+        self.backend = backend
+        self.bucket_seconds = bucket_seconds
+
+    def now(self):
+        """ Start of the current bucket, to be used as the past/upcoming split. """
+        return datetime.fromtimestamp(self._bucket() * self.bucket_seconds)
+
+    def _bucket(self):
+        return int(time.time() // self.bucket_seconds)
+
+    def _key(self, kind, entity_id, part, bucket):
+        return '%s:%s:%s:%d' % (kind, entity_id, part, bucket)
+
+    def get(self, kind, entity_id, part):
+        return self.backend.get(self._key(kind, entity_id, part, self._bucket()))
+
+    def set(self, kind, entity_id, part, value):
+        # keep an entry around for one extra bucket in case of clock skew
+        self.backend.set(self._key(kind, entity_id, part, self._bucket()), value,
+                         ttl=2 * self.bucket_seconds)
+
+    def invalidate(self, kind, *entity_ids):
+        bucket = self._bucket()
+        self.backend.delete(*[self._key(kind, entity_id, part, bucket)
+                              for entity_id in entity_ids
+                              for part in PARTS])
+
+    def stats(self):
+        return self.backend.stats()
+
+
+#----------------------------------------------------------------------------#
+# Fragment cache.
+#----------------------------------------------------------------------------#
+
+class FragmentCache(object):
+    """ Rendered template fragments, see templating.FragmentCacheExtension.
+
+    Always in-process and only expired by TTL, so it holds no fragments of
+    venue, artist or show data; those pages are in the PageCache.
+    """
+
+    def __init__(self, max_entries=1024, default_ttl=300):
+        self.backend = LRUCache(max_entries)
+        self.default_ttl = default_ttl
+
+    def get(self, key):
+        entry = self.backend.get(key)
+        if entry is None:
+            return None
+        expires, html = entry
+        if expires < time.time():
+            self.backend.delete(key)
+            return None
+        return html
+
+    def set(self, key, html, ttl=None):
+        self.backend.set(key, (time.time() + (ttl or self.default_ttl), html))
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        return self.backend.stats()
+
+
+def make_page_cache(config):
+    if config.get('CACHE_BACKEND') == 'redis':
+        backend = RedisCache(config['CACHE_REDIS_URL'])
+    else:
+        backend = LRUCache(config.get('CACHE_MAX_ENTRIES', 1024))
+    return PageCache(backend, config.get('CACHE_NOW_BUCKET_SECONDS', 300))
@@ -0,0 +1,200 @@
+import json
+import multiprocessing
+import sys
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import bindparam, select
+
+from assets import build_assets
+from bulk import DEFAULT_CHUNK_SIZE, KINDS, export_rows, import_rows, read_csv_rows, read_jsonl_rows, write_rows
+from counters import check_counters, rollover
+from geo import location_columns
+from models import Venue
+from search import reset_index
+from snapshots import warm
+from templating import compile_templates
+
+#----------------------------------------------------------------------------#
+# flask fyyur ...
+#----------------------------------------------------------------------------#
+
+fyyur_cli = AppGroup('fyyur', help='Fyyur maintenance commands.')
+
+
+def _db():
+    return current_app.extensions['sqlalchemy']
+
+
+def _refresh_snapshots(kind):
+    # right away rather than enqueued: a job thread would die with the command.
+    # Seen by the web workers when SNAPSHOT_STORE is disk.
+    snapshots = current_app.extensions['snapshots']
+    names = snapshots.names_for(kind)
+    if names:
+        snapshots.refresh(names)
+
+
+def _format(path, format):
+    if format:
+        return format
+    return 'jsonl' if path.endswith(('.jsonl', '.json')) else 'csv'
+
+
+@fyyur_cli.command('import')
+@click.argument('kind', type=click.Choice(sorted(KINDS)))
+@click.argument('source', type=click.File('r', encoding='utf-8'))
+@click.option('--format', 'format', type=click.Choice(['csv', 'jsonl']), help='Defaults to the file extension.')
+@click.option('--chunk-size', default=DEFAULT_CHUNK_SIZE, show_default=True, help='Rows validated and loaded per batch.')
+@click.option('--errors', 'errors_file', type=click.File('w', encoding='utf-8'), help='Write per-row errors as JSONL here.')
+def import_command(kind, source, format, chunk_size, errors_file):
+    """Load venues, artists or shows from a CSV or JSONL file (- for stdin)."""
+    format = _format(source.name, format)
+    rows = read_csv_rows(source) if format == 'csv' else read_jsonl_rows(source)
+    loaded, errors, touched = import_rows(_db().session, kind, rows, chunk_size)
+
+    if kind == 'shows':
+        page_cache = current_app.extensions['page_cache']
+        for page_kind in ('venue', 'artist'):
+            page_cache.invalidate(page_kind, *[entity_id for touched_kind, entity_id in touched
+                                               if touched_kind == page_kind])
+    else:
+        reset_index(KINDS[kind].model)
+    _refresh_snapshots(kind[:-1])
+
+    for error in errors:
+        if errors_file is not None:
+            errors_file.write(json.dumps(error.as_dict()) + '\n')
+        else:
+            click.echo('line %d: %s' % (error.line, error.errors), err=True)
+    click.echo('%d %s imported, %d rejected' % (loaded, kind, len(errors)))
+    if errors and not loaded:
+        sys.exit(1)
+
+
+@fyyur_cli.command('export')
+@click.argument('kind', type=click.Choice(sorted(KINDS)))
+@click.argument('target', type=click.File('w', encoding='utf-8', lazy=False), default='-')
+@click.option('--format', 'format', type=click.Choice(['csv', 'jsonl']), help='Defaults to the file extension.')
+@click.option('--chunk-size', default=DEFAULT_CHUNK_SIZE, show_default=True, help='Rows fetched per round trip.')
+def export_command(kind, target, format, chunk_size):
+    """Stream venues, artists or shows to a CSV or JSONL file (default stdout)."""
+    format = _format(target.name, format)
+    write_rows(target, kind, export_rows(_db().session, kind, chunk_size), format)
+
+
+@fyyur_cli.command('rollover-counters')
+def rollover_counters_command():
+    """Move shows that have started from the upcoming to the past counters.
+
+    Run it from cron every few minutes; the first run counts all shows.
+    """
+    moved = rollover(_db().session)
+    if moved:
+        _refresh_snapshots('show')
+    click.echo('%d shows moved from upcoming to past' % moved)
+
+
+@fyyur_cli.command('check-counters')
+@click.option('--repair', is_flag=True, help='Overwrite drifted counters with the recount.')
+def check_counters_command(repair):
+    """Recount upcoming and past shows in bulk and report counter drift."""
+    drift, repaired = check_counters(_db().session, repair=repair)
+    for row in drift:
+        click.echo('%s %d: upcoming %d, expected %d; past %d, expected %d' % row, err=True)
+    click.echo('%d counters drifted%s' % (len(drift), ' and were repaired' if repaired and drift else ''))
+    if drift and not repaired:
+        sys.exit(1)
+
+
+@fyyur_cli.command('geocode')
+@click.option('--all', 'everything', is_flag=True, help='Recompute every venue, not only those without a location.')
+@click.option('--chunk-size', default=DEFAULT_CHUNK_SIZE, show_default=True, help='Venues updated per transaction.')
+def geocode_command(everything, chunk_size):
+    """Locate venues from their city and state with the bundled gazetteer."""
+    session = _db().session
+    table = Venue.__table__
+    query = select(table.c.id, table.c.city, table.c.state).order_by(table.c.id)
+    if not everything:
+        query = query.where(table.c.geohash.is_(None))
+    geocoded = missing = 0
+    last_id = 0
+    while True:
+        rows = session.execute(query.where(table.c.id > last_id).limit(chunk_size)).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        updates = []
+        for row in rows:
+            location = location_columns(row.city, row.state)
+            updates.append({'venue_id': row.id, 'lat': location['latitude'], 'lon': location['longitude'],
+                            'hash': location['geohash']})
+        missing += sum(1 for update in updates if update['hash'] is None)
+        geocoded += len(updates)
+        session.execute(table.update().where(table.c.id == bindparam('venue_id')).values(
+            latitude=bindparam('lat'), longitude=bindparam('lon'), geohash=bindparam('hash')), updates)
+        session.commit()
+    click.echo('%d venues geocoded, %d of them without a known state' % (geocoded, missing))
+
+
+@fyyur_cli.command('compile-templates')
+def compile_templates_command():
+    """Fill the template bytecode cache, e.g. at deploy time before workers start."""
+    names = compile_templates(current_app)
+    click.echo('%d templates compiled' % len(names))
+
+
+@fyyur_cli.command('build-assets')
+@click.option('--clean', is_flag=True, help='Delete earlier builds first.')
+def build_assets_command(clean):
+    """Fingerprint, bundle and compress static/ into ASSETS_DIR, at deploy time."""
+    files = build_assets(current_app, clean=clean)
+    current_app.extensions['assets'].reload()
+    click.echo('%d assets written to %s' % (len(files), current_app.config['ASSETS_DIR']))
+
+
+@fyyur_cli.command('warm')
+def warm_command():
+    """Build the page snapshots and compile the templates, at deploy time before workers start."""
+    for snapshot in warm(current_app):
+        click.echo('snapshot %s: version %s' % (snapshot.name, snapshot.version))
+
+
+def _work_in_child(app, burst):
+    with app.app_context():
+        # a forked worker must not share the parent's pooled connections
+        for engine in _db().engines.values():
+            engine.dispose(close=False)
+        current_app.extensions['jobs'].durable.work(burst=burst)
+
+
+@fyyur_cli.command('worker')
+@click.option('--processes', default=1, show_default=True, help='Worker processes polling the jobs table.')
+@click.option('--burst', is_flag=True, help='Exit once no job is due instead of polling.')
+@click.option('--retry-failed', is_flag=True, help='Requeue the jobs that used up their attempts, then work.')
+def worker_command(processes, burst, retry_failed):
+    """Run durable background jobs from the jobs table (JOB_QUEUE=database)."""
+    queue = current_app.extensions['jobs'].durable
+    if queue is None:
+        raise click.UsageError('JOB_QUEUE is %r; only JOB_QUEUE=database has jobs to work on.'
+                               % current_app.config['JOB_QUEUE'])
+    if processes > 1 and _db().engine.dialect.name != 'postgresql':
+        raise click.UsageError('--processes needs Postgres; other databases cannot SKIP LOCKED.')
+    if retry_failed:
+        click.echo('%d failed jobs requeued' % queue.retry_failed())
+    if processes == 1:
+        click.echo('%d jobs run' % queue.work(burst=burst))
+        return
+    # SKIP LOCKED keeps the processes from claiming the same job
+    context = multiprocessing.get_context('fork')
+    children = [context.Process(target=_work_in_child, args=(current_app._get_current_object(), burst))
+                for _ in range(processes)]
+    for child in children:
+        child.start()
+    try:
+        for child in children:
+            child.join()
+    except KeyboardInterrupt:
+        for child in children:
+            child.terminate()
@@ -0,0 +1,243 @@
+from collections import namedtuple
+from datetime import datetime
+from itertools import chain
+
+import dateutil.parser
+from sqlalchemy import and_, bindparam, case, delete, event, inspect, or_, select
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+
+from models import Artist, CounterState, DeleteCount, Show, Venue
+
+#----------------------------------------------------------------------------#
+# Upcoming / past show counters.
+#----------------------------------------------------------------------------#
+
+# Venue and Artist carry upcoming_shows_count and past_shows_count. They are
+# relative to one watermark, CounterState.rolled_at, rather than to "now":
+# a show counts as upcoming while start_time >= rolled_at. Inserts, updates
+# and deletes of shows adjust the counters in the same transaction, and
+# rollover() advances the watermark, moving the shows it passed from
+# upcoming to past. The watermark is set when counter_state is created (by
+# the migration, or by create_all) and, failing that, before the first
+# write to shows, which recounts everything against it.
+
+STATE_ID = 1
+SIDES = ((Venue, Show.venue_id), (Artist, Show.artist_id))
+
+CounterDrift = namedtuple('CounterDrift', 'table id upcoming expected_upcoming past expected_past')
+
+
+def rolled_at(connection, exclusive=False):
+    """ The watermark, locked against a concurrent rollover (FOR SHARE) or,
+    for the rollover itself, exclusively. None if never initialised. """
+    query = select(CounterState.rolled_at).where(CounterState.id == STATE_ID)
+    return connection.execute(query.with_for_update(read=not exclusive)).scalar()
+
+
+def recount(connection, watermark):
+    """ Set every counter from a bulk count of the shows against `watermark`. """
+    for model, column in SIDES:
+        table = model.__table__
+        shows = select(func.count()).select_from(Show).where(column == table.c.id)
+        connection.execute(table.update().values(
+            upcoming_shows_count=shows.where(Show.start_time >= watermark).scalar_subquery(),
+            past_shows_count=shows.where(Show.start_time < watermark).scalar_subquery()))
+
+
+def ensure_watermark(connection, now=None):
+    """ The watermark; when there is none yet, it is set to `now` and the
+    counters are recounted against it. Call it before changing shows. """
+    watermark = rolled_at(connection)
+    if watermark is None:
+        watermark = now or datetime.now()
+        connection.execute(CounterState.__table__.insert().values(id=STATE_ID, rolled_at=watermark))
+        recount(connection, watermark)
+    return watermark
+
+
+@event.listens_for(CounterState.__table__, 'after_create')
+def _counter_state_created(table, connection, **kw):
+    # create_all: the tables are empty, so every counter is right at zero
+    connection.execute(table.insert().values(id=STATE_ID, rolled_at=datetime.now()))
+
+
+def _as_datetime(value):
+    # the show form posts start_time as a string
+    return dateutil.parser.parse(value) if isinstance(value, str) else value
+
+
+def apply_shows(connection, shows, sign=1):
+    """ Count (venue_id, artist_id, start_time) shows in (+1) or out (-1). """
+    watermark = rolled_at(connection)
+    if watermark is None:
+        # a recount now would count these shows on top of their deltas
+        raise RuntimeError('no counter watermark; call ensure_watermark() before changing shows')
+    deltas = {}
+    for venue_id, artist_id, start_time in shows:
+        start_time = _as_datetime(start_time)
+        if start_time is None:
+            continue
+        column = 'upcoming_shows_count' if start_time >= watermark else 'past_shows_count'
+        for model, entity_id in ((Venue, venue_id), (Artist, artist_id)):
+            key = (model, column, int(entity_id))
+            deltas[key] = deltas.get(key, 0) + sign
+
+    by_column = {}
+    for (model, column, entity_id), delta in deltas.items():
+        if delta:
+            by_column.setdefault((model, column), []).append({'entity_id': entity_id, 'delta': delta})
+    for (model, column), params in by_column.items():
+        table = model.__table__
+        connection.execute(table.update().where(table.c.id == bindparam('entity_id'))
+                           .values({column: table.c[column] + bindparam('delta')}), params)
+
+
+def delete_shows(session, *criteria):
+    """ Delete the shows matching `criteria` in one statement, counting them
+    out first. Returns their (venue_id, artist_id, start_time) rows. """
+    connection = session.connection()
+    ensure_watermark(connection)
+    shows = connection.execute(select(Show.venue_id, Show.artist_id, Show.start_time).where(*criteria)).all()
+    if shows:
+        apply_shows(connection, shows, -1)
+        connection.execute(delete(Show).where(*criteria))
+        count_deletes(connection, Show, len(shows))
+    return shows
+
+
+@event.listens_for(Session, 'before_flush')
+def _before_show_flush(session, flush_context, instances):
+    # a first watermark recounts the shows, so it must come before the flush changes them
+    if any(isinstance(instance, Show) for instance in chain(session.new, session.dirty, session.deleted)):
+        ensure_watermark(session.connection())
+
+
+@event.listens_for(Show, 'after_insert')
+def _show_inserted(mapper, connection, show):
+    apply_shows(connection, [(show.venue_id, show.artist_id, show.start_time)])
+
+
+@event.listens_for(Show, 'after_delete')
+def _show_deleted(mapper, connection, show):
+    apply_shows(connection, [(show.venue_id, show.artist_id, show.start_time)], -1)
+
+
+@event.listens_for(Show, 'after_update')
+def _show_updated(mapper, connection, show):
+    state = inspect(show)
+    keys = ('venue_id', 'artist_id', 'start_time')
+    histories = [state.attrs[key].history for key in keys]
+    if not any(history.has_changes() for history in histories):
+        return
+    before = [history.deleted[0] if history.deleted else getattr(show, key)
+              for key, history in zip(keys, histories)]
+    apply_shows(connection, [tuple(before)], -1)
+    apply_shows(connection, [(show.venue_id, show.artist_id, show.start_time)])
+
+
+def rollover(session, now=None):
+    """ Advance the watermark to `now`, moving the shows that started in
+    between from upcoming to past. Returns the number of shows moved.
+
+    Run it periodically (flask fyyur rollover-counters); the first run
+    initialises the counters from scratch.
+    """
+    now = now or datetime.now()
+    connection = session.connection()
+    watermark = rolled_at(connection, exclusive=True)
+    if watermark is None:
+        return len(check_counters(session, repair=True, now=now)[0])
+    if now <= watermark:
+        session.rollback()
+        return 0
+
+    passed = and_(Show.start_time >= watermark, Show.start_time < now)
+    moved = session.execute(select(func.count()).select_from(Show).where(passed)).scalar()
+    if moved:
+        for model, column in SIDES:
+            table = model.__table__
+            shows = select(func.count()).select_from(Show).where(passed, column == table.c.id).scalar_subquery()
+            session.execute(table.update().where(table.c.id.in_(select(column).where(passed))).values(
+                upcoming_shows_count=table.c.upcoming_shows_count - shows,
+                past_shows_count=table.c.past_shows_count + shows))
+    session.execute(CounterState.__table__.update().where(CounterState.id == STATE_ID).values(rolled_at=now))
+    session.commit()
+    return moved
+
+
+def counter_drift(session, watermark):
+    """ Counters that differ from a bulk recount against `watermark`. """
+    drift = []
+    for model, column in SIDES:
+        upcoming = func.sum(case((Show.start_time >= watermark, 1), else_=0))
+        actual = select(column.label('id'),
+                        upcoming.label('upcoming'),
+                        (func.count() - upcoming).label('past')
+                        ).where(Show.start_time.isnot(None)).group_by(column).subquery()
+        expected_upcoming = func.coalesce(actual.c.upcoming, 0)
+        expected_past = func.coalesce(actual.c.past, 0)
+        query = select(model.id, model.upcoming_shows_count, expected_upcoming,
+                       model.past_shows_count, expected_past
+                       ).select_from(model).outerjoin(actual, actual.c.id == model.id
+                       ).where(or_(model.upcoming_shows_count != expected_upcoming,
+                                   model.past_shows_count != expected_past)
+                       ).order_by(model.id)
+        drift.extend(CounterDrift(model.__tablename__, *row) for row in session.execute(query))
+    return drift
+
+
+def check_counters(session, repair=False, now=None):
+    """ Recount every venue and artist and return (drifted counters,
+    whether they were repaired). They are overwritten when `repair` is set,
+    and always when there was no watermark yet. """
+    connection = session.connection()
+    watermark = rolled_at(connection, exclusive=True)
+    if watermark is None:
+        watermark, repair = now or datetime.now(), True
+        session.add(CounterState(id=STATE_ID, rolled_at=watermark))
+        session.flush()
+    drift = counter_drift(session, watermark)
+    if repair:
+        for model, _ in SIDES:
+            table = model.__table__
+            params = [{'entity_id': row.id, 'upcoming': row.expected_upcoming, 'past': row.expected_past}
+                      for row in drift if row.table == model.__tablename__]
+            if params:
+                session.execute(table.update().where(table.c.id == bindparam('entity_id')).values(
+                    upcoming_shows_count=bindparam('upcoming'), past_shows_count=bindparam('past')), params)
+        session.commit()
+    else:
+        session.rollback()
+    return drift, repair
+
+
+#----------------------------------------------------------------------------#
+# Delete counters.
+#----------------------------------------------------------------------------#
+
+# api.collection_version() sees inserts in max(id) and updates in
+# max(updated_at), both read off an index. Deletes move neither, so each
+# one bumps its table's row in delete_counts.
+
+COUNTED_DELETES = (Venue, Artist, Show)
+
+
+def count_deletes(connection, model, deletes=1):
+    table = DeleteCount.__table__
+    connection.execute(table.update().where(table.c.table_name == model.__tablename__)
+                       .values(deletes=table.c.deletes + deletes))
+
+
+@event.listens_for(DeleteCount.__table__, 'after_create')
+def _delete_counts_created(table, connection, **kw):
+    connection.execute(table.insert(), [{'table_name': model.__tablename__, 'deletes': 0}
+                                        for model in COUNTED_DELETES])
+
+
+def _row_deleted(mapper, connection, target):
+    count_deletes(connection, mapper.class_)
+
+
+for _model in COUNTED_DELETES:
+    event.listen(_model, 'after_delete', _row_deleted)
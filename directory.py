@@ -0,0 +1,41 @@
+from itertools import groupby
+
+from listings import DEFAULT_PER_PAGE, filter_entities, keyset_page
+from models import Venue, sort_text
+from read_models import VenueCard
+
+#----------------------------------------------------------------------------#
+# Venue directory.
+#----------------------------------------------------------------------------#
+
+def _areas(rows):
+    for (city, state), venues in groupby(rows, key=lambda row: (row.city, row.state)):
+        yield {
+            'city': city,
+            'state': state,
+            'venues': [VenueCard(venue.id, venue.name, city, state, venue.num_upcoming_shows)
+                       for venue in venues]
+        }
+
+
+def venue_directory(session, filters=None, cursor=None, per_page=DEFAULT_PER_PAGE, stream=False):
+    """ Build the area -> venues -> num_upcoming_shows tree for /venues.
+
+    num_upcoming_shows is the venue's denormalized counter (see
+    counters.py), so a page is a plain range scan over ix_venue_directory,
+    keyed on (state, city, name, id). Returns the areas and the KeysetPage behind
+    them, whose next_cursor is set once the areas have been iterated.
+    """
+    state = sort_text(Venue.state).label('sort_state')
+    city = sort_text(Venue.city).label('sort_city')
+    name = sort_text(Venue.name).label('sort_name')
+    query = session.query(Venue.city,
+                          Venue.state,
+                          Venue.id,
+                          Venue.name,
+                          state, city, name,
+                          Venue.upcoming_shows_count.label('num_upcoming_shows'))
+    query = filter_entities(session, query, Venue, filters or {})
+    page = keyset_page(query, [(state, str), (city, str), (name, str), (Venue.id, int)],
+                       cursor, per_page, stream)
+    return _areas(page), page
@@ -1,4 +1,5 @@
 from enum import Enum
+from functools import lru_cache
 
 class Genre(Enum):
     Alternative = 'Alternative'
@@ -22,9 +23,34 @@ class Genre(Enum):
     Other = 'Other'
     # add more fields
     @classmethod
+    @lru_cache(maxsize=None)
     def choices(cls):
-        """ Methods decorated with @classmethod can be called statically without having an instance of the class."""
-        return [(choice.name, choice.value) for choice in cls]
+        """ Methods decorated with @classmethod can be called statically without having an instance of the class.
+        Built once and shared by every form, hence a tuple. """
+        return tuple((choice.name, choice.value) for choice in cls)
+
+    @classmethod
+    @lru_cache(maxsize=None)
+    def _aliases(cls):
+        aliases = dict((genre.value.lower(), genre) for genre in cls)
+        aliases.update((genre.name.lower(), genre) for genre in cls)
+        return aliases
+
+    @classmethod
+    def lookup(cls, value):
+        """ The genre named ('HipHop') or labelled ('Hip-Hop') `value`, ignoring case. """
+        genre = cls._aliases().get(str(value).strip().lower())
+        if genre is None:
+            raise ValueError('%r is not a genre.' % (value,))
+        return genre
+
+    @classmethod
+    def normalize(cls, values):
+        """ Genre names for `values`, deduplicated, in declaration order. """
+        if isinstance(values, str):
+            values = [values]
+        found = set(cls.lookup(value) for value in values)
+        return [genre.name for genre in cls if genre in found]
 class State(Enum):
     AL = 'AL'
     AK = 'AK'
@@ -78,6 +104,8 @@ class State(Enum):
     WI = 'WI'
     WY = 'WY'
     @classmethod
+    @lru_cache(maxsize=None)
     def choices(cls):
-        """ Methods decorated with @classmethod can be called statically without having an instance of the class."""
-        return [(choice.name, choice.value) for choice in cls]
\ No newline at end of file
+        """ Methods decorated with @classmethod can be called statically without having an instance of the class.
+        Built once and shared by every form, hence a tuple. """
+        return tuple((choice.name, choice.value) for choice in cls)
\ No newline at end of file
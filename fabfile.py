@@ -7,7 +7,7 @@ from fabric.contrib.console import confirm
 def test():
     with settings(warn_only=True):
         result = local(
-            "python test_tasks.py -v && python test_users.py -v", capture=True
+            "python bench/suite.py --shows 1000 --requests 20", capture=True
         )
     if result.failed and not confirm("Tests failed. Continue?"):
         abort("Aborted at user request.")
@@ -22,6 +22,10 @@ def push():
     local("git push origin master")
 
 
+def assets():
+    local("flask fyyur build-assets")
+
+
 def prepare():
     test()
     commit()
@@ -40,7 +44,7 @@ def heroku():
 
 def heroku_test():
     local(
-        "heroku run python test_tasks.py -v && heroku run python test_users.py -v"
+        "heroku run python bench/suite.py --shows 1000 --requests 20"
     )
 
 
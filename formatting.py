@@ -0,0 +1,51 @@
+from datetime import timezone
+from functools import lru_cache
+
+import babel
+import babel.dates
+import dateutil.parser
+
+#----------------------------------------------------------------------------#
+# Date formatting.
+#----------------------------------------------------------------------------#
+
+PATTERNS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
+# babel's own named formats, looked up per locale instead of parsed
+BABEL_FORMATS = ('long', 'short')
+
+
+@lru_cache(maxsize=128)
+def compiled_format(format='medium', locale='en'):
+    """ Parsed babel pattern and locale for a (format, locale) pair. """
+    return babel.dates.parse_pattern(PATTERNS.get(format, format)), babel.Locale.parse(locale)
+
+
+def _as_datetime(value):
+    # rows used to carry to_char() strings; accept them rather than fail
+    if isinstance(value, str):
+        value = dateutil.parser.parse(value)
+    # babel treats naive values as UTC, which leaves the wall-clock time as is
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def format_datetime(value, format='medium', locale='en'):
+    if value is None:
+        return ''
+    if format in BABEL_FORMATS:
+        return babel.dates.format_datetime(_as_datetime(value), format, locale=locale)
+    pattern, locale = compiled_format(format, locale)
+    return pattern.apply(_as_datetime(value), locale)
+
+
+def format_datetimes(values, format='medium', locale='en'):
+    """ format_datetime over a whole column, compiling the pattern once. """
+    if format in BABEL_FORMATS:
+        return [format_datetime(value, format, locale) for value in values]
+    pattern, locale = compiled_format(format, locale)
+    apply = pattern.apply
+    return [apply(_as_datetime(value), locale) if value is not None else '' for value in values]
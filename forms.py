@@ -1,8 +1,56 @@
 from datetime import datetime
+from functools import lru_cache
 from flask_wtf import Form
-from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField
-from wtforms.validators import DataRequired, AnyOf, URL
+from markupsafe import Markup
+from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField, IntegerField
+from wtforms.validators import DataRequired, AnyOf, URL, NumberRange, Optional
+from wtforms.widgets import Select, html_params
 from enums import Genre, State
+from models import DEFAULT_SHOW_MINUTES, MAX_SHOW_MINUTES
+
+
+@lru_cache(maxsize=256)
+def _render_options(choices, selected):
+    return Markup(''.join(Select.render_option(value, label, value in selected) for value, label in choices))
+
+
+class CachedSelect(Select):
+    """ Select widget rendering the <option> list of a shared choices tuple
+    once per selection instead of on every page view. """
+
+    def __call__(self, field, **kwargs):
+        if not isinstance(field.choices, tuple):
+            return super(CachedSelect, self).__call__(field, **kwargs)
+        kwargs.setdefault('id', field.id)
+        if self.multiple:
+            kwargs['multiple'] = True
+        for flag in self.validation_attrs:
+            if flag not in kwargs and getattr(field.flags, flag, False):
+                kwargs[flag] = True
+        selected = frozenset(field.data or ()) if self.multiple else frozenset([field.data])
+        return Markup('<select %s>%s</select>' % (html_params(name=field.name, **kwargs),
+                                                  _render_options(field.choices, selected)))
+
+
+class FrozenSelectField(SelectField):
+    """ SelectField keeping a shared choices tuple instead of copying it
+    into a new list for every form instance. """
+    widget = CachedSelect()
+
+    def __init__(self, label=None, validators=None, choices=None, **kwargs):
+        super(FrozenSelectField, self).__init__(label, validators, choices=choices, **kwargs)
+        if isinstance(choices, tuple):
+            self.choices = choices
+
+
+class FrozenSelectMultipleField(SelectMultipleField):
+    widget = CachedSelect(multiple=True)
+
+    def __init__(self, label=None, validators=None, choices=None, **kwargs):
+        super(FrozenSelectMultipleField, self).__init__(label, validators, choices=choices, **kwargs)
+        if isinstance(choices, tuple):
+            self.choices = choices
+
 
 class ShowForm(Form):
     artist_id = StringField(
@@ -14,7 +62,13 @@ class ShowForm(Form):
     start_time = DateTimeField(
         'start_time',
         validators=[DataRequired()],
-        default= datetime.today()
+        # called per form, not frozen at import
+        default=datetime.today
+    )
+    duration_minutes = IntegerField(
+        'duration_minutes',
+        validators=[Optional(), NumberRange(min=1, max=MAX_SHOW_MINUTES)],
+        default=DEFAULT_SHOW_MINUTES
     )
 
 class VenueForm(Form):
@@ -24,7 +78,7 @@ class VenueForm(Form):
     city = StringField(
         'city', validators=[DataRequired()]
     )
-    state = SelectField(
+    state = FrozenSelectField(
         'state', validators=[DataRequired()],
         choices= State.choices()
     )
@@ -37,7 +91,7 @@ class VenueForm(Form):
     image_link = StringField(
         'image_link'
     )
-    genres = SelectMultipleField(
+    genres = FrozenSelectMultipleField(
         # TODO implement enum restriction
         'genres', validators=[DataRequired()],
         choices= Genre.choices()
@@ -64,7 +118,7 @@ class ArtistForm(Form):
     city = StringField(
         'city', validators=[DataRequired()]
     )
-    state = SelectField(
+    state = FrozenSelectField(
         'state', validators=[DataRequired()],
         choices=State.choices()
     )
@@ -75,7 +129,7 @@ class ArtistForm(Form):
     image_link = StringField(
         'image_link'
     )
-    genres = SelectMultipleField(
+    genres = FrozenSelectMultipleField(
         'genres', validators=[DataRequired()],
         choices= Genre.choices()
      )
@@ -0,0 +1,229 @@
+import csv
+import math
+import os
+from datetime import datetime, time, timedelta
+from functools import lru_cache
+
+from sqlalchemy import and_, event, or_, select
+
+from models import Artist, Show, Venue
+
+#----------------------------------------------------------------------------#
+# Venue locations.
+#----------------------------------------------------------------------------#
+
+# Venues are geocoded offline from their city and state against the bundled
+# gazetteer, falling back to the centre of the state. Each venue also gets
+# an integer geohash: 26 bits of longitude and 26 of latitude, interleaved,
+# so every geohash cell is one contiguous range of values. A radius query
+# reads the few cells covering the circle's bounding box as range scans of
+# ix_venue_location, prefilters them by a flat-earth distance on the same
+# index and computes exact distances in Python for the rows it returns.
+
+GAZETTEER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'gazetteer.csv')
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+GEOHASH_BITS = 52
+# a radius query is at most this many range scans
+MAX_CELLS = 16
+DEFAULT_RADIUS_KM = 25
+MAX_RADIUS_KM = 500
+DEFAULT_LIMIT = 100
+# slack for the flat-earth prefilter, which must never drop a venue in range
+APPROXIMATION_MARGIN = 1.02
+
+
+#  Gazetteer
+#  ----------------------------------------------------------------
+
+def _place_key(city):
+    words = (city or '').lower().replace('.', ' ').replace('-', ' ').split()
+    return ' '.join('st' if word == 'saint' else word for word in words)
+
+
+@lru_cache(maxsize=None)
+def gazetteer():
+    """ {(city key, state): (latitude, longitude)}; city key '' is the state. """
+    places = {}
+    with open(GAZETTEER, newline='', encoding='utf-8') as source:
+        for row in csv.DictReader(source):
+            places[(_place_key(row['city']), row['state'])] = (float(row['latitude']), float(row['longitude']))
+    return places
+
+
+def geocode(city, state):
+    """ (latitude, longitude) of the city, else of its state, else None. """
+    places = gazetteer()
+    return places.get((_place_key(city), state)) or places.get(('', state))
+
+
+def location_columns(city, state):
+    """ latitude, longitude and geohash values for a venue in city, state. """
+    point = geocode(city, state)
+    if point is None:
+        return {'latitude': None, 'longitude': None, 'geohash': None}
+    return {'latitude': point[0], 'longitude': point[1], 'geohash': encode(*point)}
+
+
+@event.listens_for(Venue, 'before_insert')
+@event.listens_for(Venue, 'before_update')
+def _locate_venue(mapper, connection, venue):
+    for name, value in location_columns(venue.city, venue.state).items():
+        setattr(venue, name, value)
+
+
+#  Geohash
+#  ----------------------------------------------------------------
+
+def _cell(lat, lon, bits):
+    """ Longitude and latitude cell numbers at `bits` of precision. """
+    lon_bits, lat_bits = (bits + 1) // 2, bits // 2
+    x = int((lon + 180.0) / 360.0 * (1 << lon_bits))
+    y = int((lat + 90.0) / 180.0 * (1 << lat_bits))
+    return min(x, (1 << lon_bits) - 1), min(max(y, 0), (1 << lat_bits) - 1)
+
+
+def _interleave(x, y, bits):
+    # longitude first, as in text geohashes
+    lon_bits, lat_bits = (bits + 1) // 2, bits // 2
+    value = 0
+    for position in range(bits):
+        if position % 2 == 0:
+            bit = (x >> (lon_bits - 1 - position // 2)) & 1
+        else:
+            bit = (y >> (lat_bits - 1 - position // 2)) & 1
+        value = (value << 1) | bit
+    return value
+
+
+def encode(lat, lon):
+    return _interleave(*_cell(lat, lon, GEOHASH_BITS), bits=GEOHASH_BITS)
+
+
+def cover(lat, lon, radius_km):
+    """ Merged (low, high) geohash ranges of at most MAX_CELLS cells that
+    cover the circle's bounding box, using the finest cells that fit. """
+    dlat = radius_km / KM_PER_DEGREE
+    dlon = dlat / max(math.cos(math.radians(lat)), 0.01)
+    south, north = max(lat - dlat, -90.0), min(lat + dlat, 90.0)
+    west, east = (lon - dlon, lon + dlon) if dlon < 180 else (-180.0, 180.0 - 1e-9)
+    for bits in range(GEOHASH_BITS, 0, -1):
+        lon_cells = 1 << ((bits + 1) // 2)
+        # west/east may lie beyond the antimeridian; cells wrap around
+        x0 = int(math.floor((west + 180.0) / 360.0 * lon_cells))
+        x1 = min(int(math.floor((east + 180.0) / 360.0 * lon_cells)), x0 + lon_cells - 1)
+        (_, y0), (_, y1) = _cell(south, 0, bits), _cell(north, 0, bits)
+        if (x1 - x0 + 1) * (y1 - y0 + 1) <= MAX_CELLS:
+            break
+    shift = GEOHASH_BITS - bits
+    prefixes = sorted(set(_interleave(x % lon_cells, y, bits)
+                          for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)))
+    ranges = []
+    for prefix in prefixes:
+        low, high = prefix << shift, ((prefix + 1) << shift) - 1
+        if ranges and low == ranges[-1][1] + 1:
+            ranges[-1] = (ranges[-1][0], high)
+        else:
+            ranges.append((low, high))
+    return ranges
+
+
+def distance_km(lat1, lon1, lat2, lon2):
+    """ Great-circle distance (haversine). """
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2 +
+         math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+#  Queries
+#  ----------------------------------------------------------------
+
+def parse_point(args):
+    """ (lat, lon, radius_km) from request args; ValueError with a message
+    fit for the user when they are missing or out of range. """
+    try:
+        lat, lon = float(args['lat']), float(args['lon'])
+        radius = float(args.get('radius') or DEFAULT_RADIUS_KM)
+    except (KeyError, ValueError):
+        raise ValueError('lat and lon are required and, like radius, must be numbers.')
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError('lat must be within -90..90 and lon within -180..180.')
+    if not 0 < radius <= MAX_RADIUS_KM:
+        raise ValueError('radius must be between 0 and %d km.' % MAX_RADIUS_KM)
+    return lat, lon, radius
+
+
+def near(lat, lon, radius_km):
+    """ Venues in the geohash cells around (lat, lon) whose equirectangular
+    distance is within the radius; a superset of the venues truly within it
+    that the database can check on ix_venue_location alone. """
+    dlat = radius_km / KM_PER_DEGREE
+    # the narrowest longitude scale over the band underestimates distances
+    scale = max(math.cos(math.radians(min(abs(lat) + dlat, 90.0))), 0.0)
+    bound = (dlat * APPROXIMATION_MARGIN) ** 2
+    return and_(or_(*[Venue.geohash.between(low, high) for low, high in cover(lat, lon, radius_km)]),
+                _approximate_distance(lat, lon, scale) <= bound)
+
+
+def _approximate_distance(lat, lon, scale):
+    # squared degrees; plain arithmetic, so any database can evaluate it
+    dlat, dlon = Venue.latitude - lat, (Venue.longitude - lon) * scale
+    return dlat * dlat + dlon * dlon
+
+
+def venues_nearby(session, lat, lon, radius_km, limit=DEFAULT_LIMIT):
+    """ Venues within radius_km of (lat, lon), nearest first, as dicts with
+    a distance_km key.
+
+    The database picks the nearest candidates by approximate distance, in
+    one pass over the index; exact distances are computed for those only.
+    """
+    scale = math.cos(math.radians(lat))
+    nearest = select(Venue.id).where(near(lat, lon, radius_km)
+                     ).order_by(_approximate_distance(lat, lon, scale)
+                     ).limit(limit * 2).subquery()
+    query = select(Venue.id, Venue.name, Venue.city, Venue.state, Venue.latitude, Venue.longitude,
+                   Venue.upcoming_shows_count.label('num_upcoming_shows')
+                   ).join(nearest, nearest.c.id == Venue.id)
+    venues = []
+    for row in session.execute(query):
+        distance = distance_km(lat, lon, row.latitude, row.longitude)
+        if distance <= radius_km:
+            venues.append(dict(row._asdict(), distance_km=round(distance, 1)))
+    venues.sort(key=lambda venue: (venue['distance_km'], venue['id']))
+    return venues[:limit]
+
+
+def weekend(now):
+    """ [start, end) of this weekend: Saturday 00:00, or `now` once it has
+    begun, to Monday 00:00. """
+    monday = datetime.combine(now.date() - timedelta(days=now.weekday()), time.min)
+    return max(now, monday + timedelta(days=5)), monday + timedelta(days=7)
+
+
+def shows_nearby(session, lat, lon, radius_km, start, end, limit=DEFAULT_LIMIT):
+    """ Shows in [start, end) at venues within radius_km, soonest first.
+
+    The shows are picked from the two covering indexes alone; names and
+    images are fetched for the `limit` kept ones afterwards.
+    """
+    candidates = select(Show.id, Venue.latitude, Venue.longitude
+                        ).join(Venue, Venue.id == Show.venue_id
+                        ).where(near(lat, lon, radius_km), Show.start_time >= start, Show.start_time < end
+                        ).order_by(Show.start_time, Show.id)
+    distances = {}
+    for row in session.execute(candidates):
+        distance = distance_km(lat, lon, row.latitude, row.longitude)
+        if distance <= radius_km:
+            distances[row.id] = round(distance, 1)
+            if len(distances) == limit:
+                break
+    if not distances:
+        return []
+    query = select(Show.id, Show.start_time, Show.venue_id, Venue.name.label('venue_name'),
+                   Show.artist_id, Artist.name.label('artist_name'), Artist.image_link.label('artist_image_link')
+                   ).join(Venue, Venue.id == Show.venue_id).join(Artist, Artist.id == Show.artist_id
+                   ).where(Show.id.in_(list(distances))
+                   ).order_by(Show.start_time, Show.id)
+    return [dict(row._asdict(), distance_km=distances[row.id]) for row in session.execute(query)]
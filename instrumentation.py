@@ -0,0 +1,147 @@
+import json
+import logging
+import re
+import sys
+import time
+from collections import Counter
+
+from flask import g, has_app_context, request
+from flask.logging import default_handler
+from sqlalchemy import event
+
+#----------------------------------------------------------------------------#
+# Structured logging.
+#----------------------------------------------------------------------------#
+
+request_logger = logging.getLogger('fyyur.requests')
+
+
+class JsonFormatter(logging.Formatter):
+    """ One JSON object per line; extra={'fields': {...}} adds keys. """
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def setup_logging(app):
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JsonFormatter())
+    app.logger.removeHandler(default_handler)
+    for logger in (app.logger, logging.getLogger('fyyur')):
+        logger.addHandler(handler)
+        logger.setLevel(app.config['LOG_LEVEL'])
+        logger.propagate = False
+
+
+#----------------------------------------------------------------------------#
+# Per-request SQL statistics.
+#----------------------------------------------------------------------------#
+
+class QueryBudgetExceeded(RuntimeError):
+    pass
+
+
+# bound parameter lists, e.g. an expanded IN (?, ?, ?), count as one shape
+PARAMETER_LIST = re.compile(r'\(\s*(\?|%\(\w+\)s|%s|:\w+)(\s*,\s*(\?|%\(\w+\)s|%s|:\w+))*\s*\)')
+WHITESPACE = re.compile(r'\s+')
+
+
+def fingerprint(statement):
+    """ Statement shape: literals are bound parameters already, so only
+    whitespace and parameter lists need folding. """
+    return PARAMETER_LIST.sub('(?)', WHITESPACE.sub(' ', statement).strip())
+
+
+class QueryStats(object):
+    """ Statements a request ran and the time spent in them. """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+
+    def record(self, statement, seconds):
+        self.count += 1
+        self.seconds += seconds
+        self.shapes[fingerprint(statement)] += 1
+
+    def repeated(self, limit):
+        """ (shape, count) for the shapes run more than `limit` times. """
+        return [(shape, count) for shape, count in self.shapes.most_common() if count > limit]
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - conn.info['query_started'].pop()
+    # statements outside a request (commands, the ASGI loop) are not tracked
+    stats = g.get('query_stats') if has_app_context() else None
+    if stats is not None:
+        stats.record(statement, seconds)
+
+
+def _handle_error(context):
+    # a statement that raised never reaches after_cursor_execute
+    started = context.connection.info.get('query_started') if context.connection is not None else None
+    if context.execution_context is not None and started:
+        started.pop()
+
+
+def track_queries(engine):
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(engine, 'handle_error', _handle_error)
+
+
+def _start_request():
+    g.request_started = time.perf_counter()
+    g.query_stats = QueryStats()
+
+
+def _finish_request(app, response):
+    # for streamed listings this is before the rows are fetched
+    stats = g.pop('query_stats', None)
+    if stats is None:
+        return response
+    elapsed = time.perf_counter() - g.request_started
+    response.headers['Server-Timing'] = 'db;dur=%.1f;desc="%d queries", app;dur=%.1f' % (
+        stats.seconds * 1000, stats.count, elapsed * 1000)
+
+    budget, limit = app.config['QUERY_BUDGET'], app.config['QUERY_REPEAT_LIMIT']
+    repeated = stats.repeated(limit) if limit else []
+    over_budget = bool(budget) and stats.count > budget
+    request_logger.log(logging.WARNING if over_budget or repeated else logging.INFO, 'request', extra={'fields': {
+        'method': request.method,
+        'path': request.path,
+        'endpoint': request.endpoint,
+        'status': response.status_code,
+        'duration_ms': round(elapsed * 1000, 3),
+        'queries': stats.count,
+        'db_ms': round(stats.seconds * 1000, 3),
+        'over_budget': over_budget,
+        'repeated': [{'statement': shape, 'count': count} for shape, count in repeated],
+    }})
+    if app.config['QUERY_BUDGET_STRICT'] and (over_budget or repeated):
+        problems = ['%d queries, budget %d' % (stats.count, budget)] if over_budget else []
+        problems.extend('%dx %s' % (count, shape) for shape, count in repeated)
+        raise QueryBudgetExceeded('%s %s: %s' % (request.method, request.path, '; '.join(problems)))
+    return response
+
+
+def setup_instrumentation(app):
+    """ Server-Timing header, a structured log line per request and the
+    query budget / N+1 checks (QUERY_BUDGET, QUERY_REPEAT_LIMIT). """
+    setup_logging(app)
+    app.before_request(_start_request)
+    app.after_request(lambda response: _finish_request(app, response))
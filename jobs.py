@@ -0,0 +1,418 @@
+import ipaddress
+import logging
+import queue
+import socket
+import threading
+import time
+import traceback
+import urllib.error
+import urllib.request
+from collections import Counter, namedtuple
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+
+from flask import current_app
+from sqlalchemy import and_, delete, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.sql import func
+
+from models import Job, Show, db
+
+#----------------------------------------------------------------------------#
+# Background jobs.
+#----------------------------------------------------------------------------#
+
+# Follow-up work of a write that the response does not have to wait for.
+# Handlers commit, then enqueue() a registered task by name with JSON-able
+# keyword arguments. JOB_QUEUE picks where tasks run:
+#
+#   thread    a pool of JOB_WORKERS threads in each web process (default)
+#   database  durable tasks are rows in the jobs table, claimed with
+#             FOR UPDATE SKIP LOCKED by `flask fyyur worker`; the others
+#             still run on the thread pool
+#   inline    right away, in the enqueuing thread (tests)
+#
+# A dedup key collapses jobs that are still waiting into one. Failed jobs
+# are retried with exponential backoff up to the task's max_attempts.
+
+logger = logging.getLogger('fyyur.jobs')
+
+Task = namedtuple('Task', 'name function max_attempts durable')
+
+TASKS = {}
+
+
+def task(name, max_attempts=3, durable=False):
+    """ Register a job function. Durable tasks survive restarts when
+    JOB_QUEUE is 'database'; keep tasks whose effect is per process, such
+    as dropping in-process cache entries, non-durable. """
+    def register(function):
+        TASKS[name] = Task(name, function, max_attempts, durable)
+        return function
+    return register
+
+
+def retry_delay(app, attempts):
+    return min(app.config['JOB_RETRY_SECONDS'] * 2 ** (attempts - 1), 3600)
+
+
+def run_task(app, name, kwargs):
+    # every job gets its own app context, hence its own db.session
+    with app.app_context():
+        TASKS[name].function(**kwargs)
+
+
+class JobStats(object):
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = Counter()
+
+    def count(self, event, name):
+        with self._lock:
+            self.counts[event] += 1
+            self.counts['%s.%s' % (name, event)] += 1
+
+    def as_dict(self):
+        with self._lock:
+            return dict(self.counts)
+
+
+#  In-process queues
+#  ----------------------------------------------------------------
+
+class InlineQueue(object):
+    """ Runs each job as it is enqueued; failures are logged, not retried. """
+
+    def __init__(self, app):
+        self.app = app
+        self.stats = JobStats()
+
+    def enqueue(self, name, kwargs, dedup_key=None):
+        try:
+            run_task(self.app, name, kwargs)
+            self.stats.count('done', name)
+        except Exception:
+            self.stats.count('failed', name)
+            logger.exception('job %s failed', name)
+        return True
+
+    def join(self, timeout=None):
+        return True
+
+
+class ThreadQueue(object):
+    """ Jobs handed to a pool of daemon threads, started on first use so
+    that forking servers start them in each worker process. """
+
+    def __init__(self, app, workers=2):
+        self.app = app
+        self.workers = workers
+        self.stats = JobStats()
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._waiting = set()
+        self._threads = []
+
+    def enqueue(self, name, kwargs, dedup_key=None, attempts=0):
+        with self._lock:
+            if dedup_key is not None:
+                if dedup_key in self._waiting:
+                    self.stats.count('deduplicated', name)
+                    return False
+                self._waiting.add(dedup_key)
+            if not self._threads:
+                for number in range(self.workers):
+                    thread = threading.Thread(target=self._work, name='fyyur-job-%d' % number, daemon=True)
+                    thread.start()
+                    self._threads.append(thread)
+        self._queue.put((name, kwargs, dedup_key, attempts))
+        self.stats.count('enqueued', name)
+        return True
+
+    def _work(self):
+        while True:
+            name, kwargs, dedup_key, attempts = self._queue.get()
+            # from here on a new enqueue with the key schedules another run
+            with self._lock:
+                self._waiting.discard(dedup_key)
+            attempts += 1
+            try:
+                run_task(self.app, name, kwargs)
+                self.stats.count('done', name)
+            except Exception:
+                if attempts < TASKS[name].max_attempts:
+                    self.stats.count('retried', name)
+                    logger.warning('job %s failed (attempt %d), retrying', name, attempts, exc_info=True)
+                    retry = threading.Timer(retry_delay(self.app, attempts), self.enqueue,
+                                            (name, kwargs, dedup_key, attempts))
+                    retry.daemon = True
+                    retry.start()
+                else:
+                    self.stats.count('failed', name)
+                    logger.exception('job %s failed after %d attempts', name, attempts)
+            finally:
+                self._queue.task_done()
+
+    def join(self, timeout=None):
+        """ Wait until every queued job has run (retries still pending aside). """
+        deadline = None if timeout is None else time.time() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.time() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+
+#  Durable queue
+#  ----------------------------------------------------------------
+
+class DatabaseQueue(object):
+    """ Jobs stored in the jobs table and run by `flask fyyur worker`.
+
+    Workers claim due jobs with SELECT ... FOR UPDATE SKIP LOCKED, so any
+    number of them can poll the table without handing out a job twice. A
+    job left 'running' for JOB_LOCK_TIMEOUT_SECONDS by a worker that died
+    is claimed again.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.stats = JobStats()
+
+    def _engine(self):
+        with self.app.app_context():
+            return db.engine
+
+    def enqueue(self, name, kwargs, dedup_key=None):
+        now = datetime.utcnow()
+        try:
+            with self._engine().begin() as connection:
+                connection.execute(Job.__table__.insert().values(
+                    name=name, args=kwargs, dedup_key=dedup_key, status='pending', attempts=0,
+                    max_attempts=TASKS[name].max_attempts, run_at=now, created_at=now))
+        except IntegrityError:
+            # ix_jobs_pending_dedup_key: the same job is already waiting
+            self.stats.count('deduplicated', name)
+            return False
+        self.stats.count('enqueued', name)
+        return True
+
+    def claim(self, limit=10):
+        """ Mark up to `limit` due jobs as running and return them. """
+        now = datetime.utcnow()
+        stale = now - timedelta(seconds=self.app.config['JOB_LOCK_TIMEOUT_SECONDS'])
+        jobs = Job.__table__
+        with self._engine().begin() as connection:
+            rows = connection.execute(
+                select(jobs.c.id, jobs.c.name, jobs.c.args, jobs.c.attempts, jobs.c.max_attempts)
+                .where(or_(and_(jobs.c.status == 'pending', jobs.c.run_at <= now),
+                           and_(jobs.c.status == 'running', jobs.c.locked_at < stale)))
+                .order_by(jobs.c.run_at).limit(limit)
+                .with_for_update(skip_locked=True)).all()
+            if rows:
+                connection.execute(update(jobs).where(jobs.c.id.in_([row.id for row in rows]))
+                                   .values(status='running', locked_at=now, attempts=jobs.c.attempts + 1))
+        return rows
+
+    def _finish(self, row, error=None):
+        jobs = Job.__table__
+        attempts = row.attempts + 1
+        with self._engine().begin() as connection:
+            if error is None:
+                connection.execute(delete(jobs).where(jobs.c.id == row.id))
+                self.stats.count('done', row.name)
+                return
+            if attempts >= row.max_attempts:
+                # kept for inspection; `flask fyyur worker --retry-failed` requeues them
+                connection.execute(update(jobs).where(jobs.c.id == row.id).values(
+                    status='failed', locked_at=None, last_error=error))
+                self.stats.count('failed', row.name)
+                return
+        try:
+            with self._engine().begin() as connection:
+                connection.execute(update(jobs).where(jobs.c.id == row.id).values(
+                    status='pending', locked_at=None, last_error=error,
+                    run_at=datetime.utcnow() + timedelta(seconds=retry_delay(self.app, attempts))))
+        except IntegrityError:
+            # ix_jobs_pending_dedup_key: the same job was enqueued again while
+            # this attempt ran, and the waiting one stands in for the retry
+            with self._engine().begin() as connection:
+                connection.execute(delete(jobs).where(jobs.c.id == row.id))
+            self.stats.count('deduplicated', row.name)
+            return
+        self.stats.count('retried', row.name)
+
+    def run(self, row):
+        try:
+            run_task(self.app, row.name, row.args or {})
+        except Exception:
+            logger.exception('job %s %d failed (attempt %d)', row.name, row.id, row.attempts + 1)
+            self._finish(row, traceback.format_exc())
+            return False
+        self._finish(row)
+        return True
+
+    def work(self, burst=False, stop=None):
+        """ Claim and run jobs until `stop` is set or, with `burst`, until
+        none is due. Returns the number of jobs run. """
+        ran = 0
+        while stop is None or not stop.is_set():
+            rows = self.claim(self.app.config['JOB_CLAIM_BATCH'])
+            if not rows:
+                if burst:
+                    break
+                time.sleep(self.app.config['JOB_POLL_SECONDS'])
+                continue
+            for row in rows:
+                self.run(row)
+                ran += 1
+        return ran
+
+    def retry_failed(self):
+        """ Requeue the failed jobs and return how many. A failed job whose
+        dedup key is already waiting is deleted instead, as are all but the
+        latest of several failed jobs sharing a key. """
+        jobs = Job.__table__
+        other = jobs.alias('other')
+        with self._engine().begin() as connection:
+            connection.execute(delete(jobs).where(
+                jobs.c.status == 'failed',
+                jobs.c.dedup_key.in_(select(other.c.dedup_key).where(other.c.status == 'pending'))))
+            connection.execute(delete(jobs).where(
+                jobs.c.status == 'failed', jobs.c.dedup_key.isnot(None),
+                jobs.c.id.notin_(select(func.max(other.c.id)).where(
+                    other.c.status == 'failed', other.c.dedup_key.isnot(None)).group_by(other.c.dedup_key))))
+            return connection.execute(update(jobs).where(jobs.c.status == 'failed').values(
+                status='pending', attempts=0, run_at=datetime.utcnow())).rowcount
+
+    def join(self, timeout=None):
+        return True
+
+
+class JobQueue(object):
+    """ Routes each job to the durable queue or the in-process one. """
+
+    def __init__(self, app):
+        backend = app.config['JOB_QUEUE']
+        if backend == 'inline':
+            self.local = InlineQueue(app)
+        elif backend in ('thread', 'database'):
+            self.local = ThreadQueue(app, app.config['JOB_WORKERS'])
+        else:
+            raise RuntimeError('unknown JOB_QUEUE %r' % backend)
+        self.durable = DatabaseQueue(app) if backend == 'database' else None
+
+    def enqueue(self, name, dedup_key=None, **kwargs):
+        if name not in TASKS:
+            raise KeyError('no task named %r' % name)
+        target = self.durable if TASKS[name].durable and self.durable is not None else self.local
+        return target.enqueue(name, kwargs, dedup_key=dedup_key)
+
+    def join(self, timeout=None):
+        return self.local.join(timeout)
+
+    def stats(self):
+        stats = {'local': self.local.stats.as_dict()}
+        if self.durable is not None:
+            stats['durable'] = self.durable.stats.as_dict()
+        return stats
+
+
+def setup_jobs(app):
+    app.extensions['jobs'] = JobQueue(app)
+    return app.extensions['jobs']
+
+
+def enqueue(name, dedup_key=None, **kwargs):
+    """ Run task `name` in the background; call it after the commit whose
+    follow-up work it is. False if an identical job was already waiting. """
+    return current_app.extensions['jobs'].enqueue(name, dedup_key=dedup_key, **kwargs)
+
+
+#----------------------------------------------------------------------------#
+# Tasks.
+#----------------------------------------------------------------------------#
+
+# the pages of the other side of each show embed the venue or artist
+RELATED = {'venue': ('artist', Show.venue_id, Show.artist_id),
+           'artist': ('venue', Show.artist_id, Show.venue_id)}
+
+
+@task('invalidate')
+def invalidate(kind, entity_ids):
+    current_app.extensions['page_cache'].invalidate(kind, *entity_ids)
+
+
+@task('invalidate_related')
+def invalidate_related(kind, entity_id):
+    """ Drop the cached pages that show this venue or artist's name and image. """
+    other, column, other_column = RELATED[kind]
+    ids = db.session.execute(select(other_column).where(column == entity_id).distinct()).scalars().all()
+    if ids:
+        current_app.extensions['page_cache'].invalidate(other, *ids)
+
+
+@task('refresh_snapshots')
+def refresh_snapshots(names=None, kind=None):
+    """ Rebuild the named page snapshots, or those listing `kind`. """
+    snapshots = current_app.extensions['snapshots']
+    names = names or snapshots.names_for(kind)
+    if names:
+        snapshots.refresh(names)
+
+
+class UnsafeLink(ValueError):
+    pass
+
+
+def check_public_url(url):
+    """ Raise UnsafeLink unless `url` is http(s) and its host resolves only
+    to public addresses: image links are user input, and fetching them must
+    not reach the loopback interface, the private network or the cloud
+    metadata service. """
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise UnsafeLink('not an http(s) URL')
+    try:
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+        addresses = socket.getaddrinfo(parts.hostname, port, proto=socket.IPPROTO_TCP)
+    except (socket.gaierror, ValueError) as error:
+        raise UnsafeLink('cannot resolve %s: %s' % (parts.hostname, error))
+    for address in addresses:
+        ip = ipaddress.ip_address(address[4][0].split('%', 1)[0])
+        if not ip.is_global or ip.is_multicast:
+            raise UnsafeLink('%s resolves to non-public address %s' % (parts.hostname, ip))
+
+
+class _PublicRedirectHandler(urllib.request.HTTPRedirectHandler):
+    """ Follows a redirect only to another public http(s) URL. """
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        check_public_url(newurl)
+        return super(_PublicRedirectHandler, self).redirect_request(req, fp, code, msg, headers, newurl)
+
+
+# http(s) only: no file:, ftp: or data: handlers, and no proxies from the environment
+_link_opener = urllib.request.OpenerDirector()
+for _handler in (urllib.request.UnknownHandler(), urllib.request.HTTPHandler(), urllib.request.HTTPSHandler(),
+                 urllib.request.HTTPDefaultErrorHandler(), _PublicRedirectHandler(),
+                 urllib.request.HTTPErrorProcessor()):
+    _link_opener.add_handler(_handler)
+
+
+@task('check_image_link', max_attempts=5, durable=True)
+def check_image_link(kind, entity_id, url):
+    """ Log image links that are gone; network errors and 5xx are retried.
+    Links to anything but a public http(s) host are logged, not fetched. """
+    try:
+        check_public_url(url)
+        request = urllib.request.Request(url, method='HEAD', headers={'User-Agent': 'fyyur-link-check'})
+        with _link_opener.open(request, timeout=current_app.config['IMAGE_LINK_TIMEOUT_SECONDS']):
+            pass
+    except UnsafeLink as error:
+        logger.warning('%s %s image link %s is not checked: %s', kind, entity_id, url, error)
+    except urllib.error.HTTPError as error:
+        if error.code >= 500:
+            raise
+        logger.warning('%s %s image link %s is broken: HTTP %d', kind, entity_id, url, error.code)
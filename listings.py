@@ -0,0 +1,185 @@
+import base64
+import json
+from datetime import date, datetime
+
+from sqlalchemy import String, and_, cast, or_, tuple_
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.sql import func
+
+from enums import Genre
+from models import GENRE_ENUM, Artist, Show, Venue, sort_text
+
+#----------------------------------------------------------------------------#
+# Keyset pagination.
+#----------------------------------------------------------------------------#
+
+DEFAULT_PER_PAGE = 100
+MAX_PER_PAGE = 500
+# rows fetched per round trip when a page is streamed
+STREAM_BATCH = 50
+
+
+def encode_cursor(values):
+    payload = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor, types):
+    """ Turn a cursor back into key values, or None if it is malformed. """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+        if len(values) != len(types):
+            return None
+        return [datetime.fromisoformat(value) if kind is datetime else kind(value)
+                for kind, value in zip(types, values)]
+    except (TypeError, ValueError, UnicodeError):
+        return None
+
+
+class KeysetPage(object):
+    """ One page of rows plus the cursor of the page after it.
+
+    Rows may be a lazy result; next_cursor is then only known once the
+    rows have been iterated, which suits templates that render the pager
+    after the list.
+    """
+
+    def __init__(self, rows, key, per_page, cursor=None):
+        self._rows = rows
+        self._key = key
+        self.per_page = per_page
+        self.cursor = cursor
+        self.next_cursor = None
+
+    def __iter__(self):
+        last = None
+        for count, row in enumerate(self._rows):
+            # the query asks for one row more than a page to detect a next page
+            if count == self.per_page:
+                self.next_cursor = encode_cursor(self._key(last))
+                break
+            last = row
+            yield row
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def keyset_page(query, keys, cursor=None, per_page=DEFAULT_PER_PAGE, stream=False):
+    """ Page through `query` ordered by `keys`, a list of (expression, type).
+
+    The cursor holds the key of the last row of the previous page, so a page
+    starts where the last one ended instead of after an OFFSET over all
+    prior rows. Each listing's keys have a matching index in models.py, so
+    an unfiltered page reads only its own rows from the index; filters may
+    make the database skip rows along the way, or pick another plan.
+    """
+    per_page = min(max(int(per_page), 1), MAX_PER_PAGE)
+    columns = [column for column, _ in keys]
+    query = query.order_by(*columns)
+    if cursor:
+        values = decode_cursor(cursor, [kind for _, kind in keys])
+        if values is not None:
+            query = query.filter(tuple_(*columns) > tuple_(*values))
+    query = query.limit(per_page + 1)
+    names = [column.key for column in columns]
+    rows = query.yield_per(STREAM_BATCH) if stream else query.all()
+    return KeysetPage(rows, lambda row: [getattr(row, name) for name in names], per_page, cursor)
+
+
+#----------------------------------------------------------------------------#
+# Filters.
+#----------------------------------------------------------------------------#
+
+def _parse_date(value):
+    try:
+        return datetime.combine(date.fromisoformat(value), datetime.min.time()) if value else None
+    except ValueError:
+        return None
+
+
+def _parse_genres(values):
+    # ?genre=Jazz&genre=Hip-Hop or ?genre=Jazz,Hip-Hop; unknown genres are ignored
+    found = set()
+    for value in values:
+        for part in value.split(','):
+            try:
+                found.add(Genre.lookup(part))
+            except ValueError:
+                pass
+    return [genre.name for genre in Genre if genre in found]
+
+
+def listing_filters(args):
+    """ Filters shared by the listing pages, read from the query string. """
+    return {
+        'date_from': _parse_date(args.get('from')),
+        'date_to': _parse_date(args.get('to')),
+        'city': args.get('city') or None,
+        'genres': _parse_genres(args.getlist('genre')),
+        'genre_match': 'all' if args.get('genre_match') == 'all' else 'any',
+        'min_upcoming': args.get('min_upcoming', type=int),
+    }
+
+
+def genre_filter(session, column, genres, match='any'):
+    """ Rows having any (or with match='all', every one) of `genres`. """
+    if session.get_bind().dialect.name == 'postgresql':
+        # && and @> on the genre[] column, both served by its GIN index
+        wanted = cast(postgresql.array(genres), postgresql.ARRAY(GENRE_ENUM))
+        return column.op('@>' if match == 'all' else '&&')(wanted)
+    # JSON-encoded list elsewhere
+    tests = [cast(column, String).like('%' + json.dumps(genre) + '%') for genre in genres]
+    return and_(*tests) if match == 'all' else or_(*tests)
+
+
+def filter_entities(session, query, model, filters):
+    if filters.get('city'):
+        query = query.filter(func.lower(model.city) == filters['city'].lower())
+    if filters.get('genres'):
+        query = query.filter(genre_filter(session, model.genres, filters['genres'], filters.get('genre_match')))
+    if filters.get('min_upcoming'):
+        query = query.filter(model.upcoming_shows_count >= filters['min_upcoming'])
+    return query
+
+
+#----------------------------------------------------------------------------#
+# Listings.
+#----------------------------------------------------------------------------#
+
+def shows_page(session, filters, cursor=None, per_page=DEFAULT_PER_PAGE, stream=False):
+    """ Shows keyed on (start_time, id), filterable by date range, venue
+    city and artist genre. """
+    query = session.query(Venue.id.label('venue_id'),
+                          Venue.name.label('venue_name'),
+                          Artist.id.label('artist_id'),
+                          Artist.name.label('artist_name'),
+                          Artist.image_link.label('artist_image_link'),
+                          Show.start_time,
+                          Show.id
+                          ).select_from(Show
+                          ).join(Artist, Show.artist_id == Artist.id
+                          ).join(Venue, Show.venue_id == Venue.id
+                          ).filter(Show.start_time.isnot(None))
+    if filters.get('date_from'):
+        query = query.filter(Show.start_time >= filters['date_from'])
+    if filters.get('date_to'):
+        query = query.filter(Show.start_time < filters['date_to'])
+    if filters.get('city'):
+        query = query.filter(func.lower(Venue.city) == filters['city'].lower())
+    if filters.get('genres'):
+        query = query.filter(genre_filter(session, Artist.genres, filters['genres'], filters.get('genre_match')))
+    return keyset_page(query, [(Show.start_time, datetime), (Show.id, int)], cursor, per_page, stream)
+
+
+def artists_page(session, filters, cursor=None, per_page=DEFAULT_PER_PAGE, stream=False, sort=None):
+    """ Artists keyed on (name, id), or on (-upcoming shows, id) with
+    sort='popular', filterable by city, genre and upcoming show count. """
+    if sort == 'popular':
+        key = (-Artist.upcoming_shows_count).label('sort_popularity')
+    else:
+        key = sort_text(Artist.name).label('sort_name')
+    query = session.query(Artist.id, Artist.name, Artist.upcoming_shows_count, key)
+    query = filter_entities(session, query, Artist, filters)
+    return keyset_page(query, [(key, int if sort == 'popular' else str), (Artist.id, int)], cursor, per_page, stream)
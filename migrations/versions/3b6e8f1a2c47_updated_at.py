@@ -0,0 +1,33 @@
+"""updated_at on Venue, Artist and Show for API ETags
+
+Revision ID: 3b6e8f1a2c47
+Revises: 9e4b7c2d1f08
+Create Date: 2026-10-18 13:40:05.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b6e8f1a2c47'
+down_revision = '9e4b7c2d1f08'
+branch_labels = None
+depends_on = None
+
+TABLES = ('Venue', 'Artist', 'Show')
+
+
+def upgrade():
+    # the models fill updated_at in Python with utcnow(); the server default
+    # covers existing rows and rows loaded with COPY
+    for table in TABLES:
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), nullable=False,
+                                       server_default=sa.text("(now() at time zone 'utc')")))
+        op.create_index('ix_%s_updated_at' % table, table, ['updated_at'], unique=False)
+
+
+def downgrade():
+    for table in reversed(TABLES):
+        op.drop_index('ix_%s_updated_at' % table, table_name=table)
+        op.drop_column(table, 'updated_at')
@@ -0,0 +1,71 @@
+"""search vectors and trigram indexes for venues and artists
+
+Revision ID: 5d1f3a9c7b21
+Revises: b788d65e5cee
+Create Date: 2026-10-18 10:12:41.204317
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '5d1f3a9c7b21'
+down_revision = 'b788d65e5cee'
+branch_labels = None
+depends_on = None
+
+
+# Weights must stay in line with search._document().
+DOCUMENT = """
+    setweight(to_tsvector('simple', coalesce(NEW.name, '')), 'A') ||
+    setweight(to_tsvector('simple', coalesce(NEW.city, '') || ' ' || coalesce(NEW.state, '')), 'B') ||
+    setweight(to_tsvector('simple', coalesce(array_to_string(NEW.genres, ' '), '')), 'C')
+"""
+TABLES = ('Venue', 'Artist')
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        # search.py falls back to an in-memory index everywhere else
+        for table in TABLES:
+            op.add_column(table, sa.Column('search_vector', sa.Text(), nullable=True))
+        return
+
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table in TABLES:
+        name = table.lower()
+        op.add_column(table, sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+        op.execute("""
+            CREATE FUNCTION {name}_search_vector() RETURNS trigger AS $$
+            BEGIN
+                NEW.search_vector := {document};
+                RETURN NEW;
+            END
+            $$ LANGUAGE plpgsql
+        """.format(name=name, document=DOCUMENT))
+        op.execute("""
+            CREATE TRIGGER {name}_search_vector_update
+            BEFORE INSERT OR UPDATE OF name, city, state, genres ON "{table}"
+            FOR EACH ROW EXECUTE PROCEDURE {name}_search_vector()
+        """.format(name=name, table=table))
+        # fire the trigger once to backfill existing rows
+        op.execute('UPDATE "{table}" SET name = name'.format(table=table))
+        op.create_index('ix_{name}_search_vector'.format(name=name), table,
+                        ['search_vector'], postgresql_using='gin')
+        op.create_index('ix_{name}_name_trgm'.format(name=name), table,
+                        [sa.text('lower(name) gin_trgm_ops')], postgresql_using='gin')
+
+
+def downgrade():
+    bind = op.get_bind()
+    for table in TABLES:
+        name = table.lower()
+        if bind.dialect.name == 'postgresql':
+            op.drop_index('ix_{name}_name_trgm'.format(name=name), table_name=table)
+            op.drop_index('ix_{name}_search_vector'.format(name=name), table_name=table)
+            op.execute('DROP TRIGGER {name}_search_vector_update ON "{table}"'.format(name=name, table=table))
+            op.execute('DROP FUNCTION {name}_search_vector()'.format(name=name))
+        op.drop_column(table, 'search_vector')
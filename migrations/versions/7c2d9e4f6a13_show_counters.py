@@ -0,0 +1,50 @@
+"""denormalized upcoming/past show counters on Venue and Artist
+
+Revision ID: 7c2d9e4f6a13
+Revises: 3b6e8f1a2c47
+Create Date: 2026-10-18 15:21:48.602913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c2d9e4f6a13'
+down_revision = '3b6e8f1a2c47'
+branch_labels = None
+depends_on = None
+
+SIDES = (('Venue', 'venue_id'), ('Artist', 'artist_id'))
+
+
+def upgrade():
+    op.create_table('counter_state',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('rolled_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    # the app compares against naive local datetime.now()
+    op.execute('INSERT INTO counter_state (id, rolled_at) VALUES (1, LOCALTIMESTAMP)')
+
+    for table, column in SIDES:
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(), nullable=False, server_default='0'))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(), nullable=False, server_default='0'))
+        op.execute('''
+            UPDATE "{table}" SET
+                upcoming_shows_count = (SELECT count(*) FROM "Show" s
+                                        WHERE s.{column} = "{table}".id
+                                          AND s.start_time >= (SELECT rolled_at FROM counter_state)),
+                past_shows_count = (SELECT count(*) FROM "Show" s
+                                    WHERE s.{column} = "{table}".id
+                                      AND s.start_time < (SELECT rolled_at FROM counter_state))
+        '''.format(table=table, column=column))
+    op.create_index('ix_artist_popularity', 'Artist', [sa.text('(-upcoming_shows_count)'), 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_artist_popularity', table_name='Artist')
+    for table, _ in reversed(SIDES):
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'upcoming_shows_count')
+    op.drop_table('counter_state')
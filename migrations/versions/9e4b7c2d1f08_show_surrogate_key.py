@@ -0,0 +1,188 @@
+"""surrogate key and start_time indexes for Show, optional monthly partitions
+
+Revision ID: 9e4b7c2d1f08
+Revises: 5d1f3a9c7b21
+Create Date: 2026-10-18 11:02:17.530914
+
+Partitioning is opt-in on Postgres:
+
+    flask db upgrade -x partition_shows=true
+
+The downgrade restores the (venue_id, artist_id) key, so it stops when an
+artist has more than one show at a venue. To keep the lowest id of each pair
+and delete the rest:
+
+    flask db downgrade -x drop_duplicate_shows=true
+
+"""
+from datetime import date
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e4b7c2d1f08'
+down_revision = '5d1f3a9c7b21'
+branch_labels = None
+depends_on = None
+
+# monthly partitions created ahead of today; later rows land in Show_default
+MONTHS_AHEAD = 24
+
+INDEXES = (
+    ('ix_show_venue_id_start_time', ['venue_id', 'start_time']),
+    ('ix_show_artist_id_start_time', ['artist_id', 'start_time']),
+)
+
+
+def _x_flag(name):
+    value = context.get_x_argument(as_dictionary=True).get(name, '')
+    return value.lower() in ('1', 'true', 'yes')
+
+
+def _add_month(day):
+    return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+
+
+def _partition_shows(bind):
+    first = bind.execute(sa.text('SELECT min(start_time) FROM "Show"')).scalar()
+    op.execute('ALTER TABLE "Show" RENAME TO "Show_unpartitioned"')
+    op.execute('ALTER TABLE "Show_unpartitioned" RENAME CONSTRAINT "Show_pkey" TO "Show_unpartitioned_pkey"')
+    op.execute('ALTER INDEX ix_show_venue_id_start_time RENAME TO ix_show_unpartitioned_venue_id_start_time')
+    op.execute('ALTER INDEX ix_show_artist_id_start_time RENAME TO ix_show_unpartitioned_artist_id_start_time')
+    op.execute('''
+        CREATE TABLE "Show" (
+            id SERIAL,
+            start_time TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            venue_id INTEGER NOT NULL REFERENCES "Venue" (id),
+            artist_id INTEGER NOT NULL REFERENCES "Artist" (id),
+            PRIMARY KEY (id, start_time)
+        ) PARTITION BY RANGE (start_time)
+    ''')
+
+    today = date.today().replace(day=1)
+    month = first.date().replace(day=1) if first is not None else today
+    last = today
+    for _ in range(MONTHS_AHEAD):
+        last = _add_month(last)
+    while month < last:
+        following = _add_month(month)
+        op.execute('''
+            CREATE TABLE "Show_{suffix}" PARTITION OF "Show"
+            FOR VALUES FROM ('{start}') TO ('{end}')
+        '''.format(suffix=month.strftime('%Y_%m'), start=month, end=following))
+        month = following
+    op.execute('CREATE TABLE "Show_default" PARTITION OF "Show" DEFAULT')
+
+    for name, columns in INDEXES:
+        op.create_index(name, 'Show', columns)
+    op.execute('''
+        INSERT INTO "Show" (id, start_time, venue_id, artist_id)
+        SELECT id, start_time, venue_id, artist_id FROM "Show_unpartitioned"
+    ''')
+    op.execute('''
+        SELECT setval(pg_get_serial_sequence('"Show"', 'id'), coalesce(max(id), 0) + 1, false)
+        FROM "Show"
+    ''')
+    op.execute('DROP TABLE "Show_unpartitioned"')
+
+
+def _unpartition_shows():
+    op.execute('ALTER TABLE "Show" RENAME TO "Show_partitioned"')
+    op.execute('ALTER TABLE "Show_partitioned" RENAME CONSTRAINT "Show_pkey" TO "Show_partitioned_pkey"')
+    op.execute('''
+        CREATE TABLE "Show" (
+            id SERIAL PRIMARY KEY,
+            start_time TIMESTAMP WITHOUT TIME ZONE,
+            venue_id INTEGER NOT NULL REFERENCES "Venue" (id),
+            artist_id INTEGER NOT NULL REFERENCES "Artist" (id)
+        )
+    ''')
+    op.execute('''
+        INSERT INTO "Show" (id, start_time, venue_id, artist_id)
+        SELECT id, start_time, venue_id, artist_id FROM "Show_partitioned"
+    ''')
+    op.execute('''
+        SELECT setval(pg_get_serial_sequence('"Show"', 'id'), coalesce(max(id), 0) + 1, false)
+        FROM "Show"
+    ''')
+    # dropping the parent drops every partition and its indexes
+    op.execute('DROP TABLE "Show_partitioned"')
+
+
+def _rebuild_sqlite_shows(key):
+    # SQLite cannot change a primary key in place, so the table is copied;
+    # with the surrogate key every copied row gets the next rowid as its id
+    op.execute('''
+        CREATE TABLE "Show_rebuilt" (
+            {id}
+            start_time DATETIME,
+            venue_id INTEGER NOT NULL REFERENCES "Venue" (id),
+            artist_id INTEGER NOT NULL REFERENCES "Artist" (id),
+            PRIMARY KEY ({key})
+        )
+    '''.format(id='id INTEGER,' if key == 'id' else '', key=key))
+    op.execute('''
+        INSERT INTO "Show_rebuilt" (start_time, venue_id, artist_id)
+        SELECT start_time, venue_id, artist_id FROM "Show"
+    ''')
+    op.execute('DROP TABLE "Show"')
+    op.execute('ALTER TABLE "Show_rebuilt" RENAME TO "Show"')
+
+
+def _drop_duplicate_shows(bind):
+    duplicates = bind.execute(sa.text('''
+        SELECT count(*) FROM "Show"
+        WHERE id NOT IN (SELECT min(id) FROM "Show" GROUP BY venue_id, artist_id)
+    ''')).scalar()
+    if not duplicates:
+        return
+    if not _x_flag('drop_duplicate_shows'):
+        raise RuntimeError(
+            '%d shows repeat an earlier (venue_id, artist_id) pair and would break the '
+            'composite primary key; remove them, or rerun with -x drop_duplicate_shows=true '
+            'to keep the lowest id of each pair' % duplicates)
+    op.execute('''
+        DELETE FROM "Show"
+        WHERE id NOT IN (SELECT min(id) FROM "Show" GROUP BY venue_id, artist_id)
+    ''')
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        _rebuild_sqlite_shows('id')
+        for name, columns in INDEXES:
+            op.create_index(name, 'Show', columns)
+        return
+
+    op.drop_constraint('Show_pkey', 'Show', type_='primary')
+    op.execute('ALTER TABLE "Show" ADD COLUMN id SERIAL PRIMARY KEY')
+    for name, columns in INDEXES:
+        op.create_index(name, 'Show', columns)
+    if _x_flag('partition_shows'):
+        _partition_shows(bind)
+
+
+def downgrade():
+    # artists may have played the same venue twice since the upgrade; those
+    # duplicates go, or the downgrade stops, before the composite key comes back
+    bind = op.get_bind()
+    _drop_duplicate_shows(bind)
+    if bind.dialect.name != 'postgresql':
+        for name, _ in INDEXES:
+            op.drop_index(name, table_name='Show')
+        _rebuild_sqlite_shows('venue_id, artist_id')
+        return
+
+    partitioned = bind.execute(sa.text(
+        "SELECT relkind = 'p' FROM pg_class WHERE relname = 'Show'")).scalar()
+    if partitioned:
+        _unpartition_shows()
+    else:
+        for name, _ in INDEXES:
+            op.drop_index(name, table_name='Show')
+    op.drop_constraint('Show_pkey', 'Show', type_='primary')
+    op.drop_column('Show', 'id')
+    op.create_primary_key('Show_pkey', 'Show', ['venue_id', 'artist_id'])
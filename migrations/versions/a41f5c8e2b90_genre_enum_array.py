@@ -0,0 +1,112 @@
+"""genres as a genre[] enum array with GIN indexes, backfilled from free strings
+
+Revision ID: a41f5c8e2b90
+Revises: 7c2d9e4f6a13
+Create Date: 2026-10-18 16:54:30.771342
+
+Existing values are matched against the genre names ('HipHop') and labels
+('Hip-Hop') ignoring case and surrounding blanks; anything else becomes
+'Other'. Columns still declared as plain strings by the early migrations
+are read as '{a,b}' or 'a,b' lists.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a41f5c8e2b90'
+down_revision = '7c2d9e4f6a13'
+branch_labels = None
+depends_on = None
+
+# enums.Genre as of this revision: name -> label
+GENRES = (
+    ('Alternative', 'Alternative'),
+    ('Blues', 'Blues'),
+    ('Classical', 'Classical'),
+    ('Country', 'Country'),
+    ('Electronic', 'Electronic'),
+    ('Folk', 'Folk'),
+    ('Funk', 'Funk'),
+    ('HipHop', 'Hip-Hop'),
+    ('HeavyMetal', 'Heavy Metal'),
+    ('Instrumental', 'Instrumental'),
+    ('Jazz', 'Jazz'),
+    ('MusicalTheatre', 'Musical Theatre'),
+    ('Pop', 'Pop'),
+    ('Punk', 'Punk'),
+    ('R_B', 'R&B'),
+    ('Reggae', 'Reggae'),
+    ('Rock_n_Roll', 'Rock n Roll'),
+    ('Soul', 'Soul'),
+    ('Other', 'Other'),
+)
+TABLES = ('Venue', 'Artist')
+# the search_vector triggers list genres in UPDATE OF, which blocks ALTER TYPE
+TRIGGER = """
+    CREATE TRIGGER {name}_search_vector_update
+    BEFORE INSERT OR UPDATE OF name, city, state, genres ON "{table}"
+    FOR EACH ROW EXECUTE PROCEDURE {name}_search_vector()
+"""
+
+
+def _quote(value):
+    return "'%s'" % value.replace("'", "''")
+
+
+def _aliases():
+    rows = set()
+    for name, label in GENRES:
+        rows.add((name.lower(), name))
+        rows.add((label.lower(), name))
+    return ', '.join('(%s, %s::genre)' % (_quote(alias), _quote(name)) for alias, name in sorted(rows))
+
+
+def _is_array(bind, table):
+    return bind.execute(sa.text(
+        "SELECT data_type FROM information_schema.columns WHERE table_name = :table AND column_name = 'genres'"
+    ), {'table': table}).scalar() == 'ARRAY'
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        # JSON lists of genre names elsewhere; models.GenreArray normalizes writes
+        return
+
+    op.execute('CREATE TYPE genre AS ENUM (%s)' % ', '.join(_quote(name) for name, _ in GENRES))
+    # ALTER ... USING cannot hold a subquery, so the lookup lives in a function
+    op.execute("""
+        CREATE FUNCTION fyyur_normalize_genres(text[]) RETURNS genre[] AS $$
+            SELECT coalesce(array_agg(DISTINCT coalesce(alias.name, 'Other') ORDER BY coalesce(alias.name, 'Other')),
+                            '{}')
+            FROM unnest($1) AS raw(value)
+            LEFT JOIN (VALUES %s) AS alias(key, name) ON alias.key = lower(trim(raw.value))
+            WHERE trim(raw.value) <> ''
+        $$ LANGUAGE sql IMMUTABLE
+    """ % _aliases())
+    for table in TABLES:
+        name = table.lower()
+        source = 'genres::text[]' if _is_array(bind, table) else \
+            "string_to_array(trim(both '{}' from genres), ',')"
+        op.execute('DROP TRIGGER {name}_search_vector_update ON "{table}"'.format(name=name, table=table))
+        op.execute('ALTER TABLE "{table}" ALTER COLUMN genres TYPE genre[] USING fyyur_normalize_genres({source})'
+                   .format(table=table, source=source))
+        op.execute(TRIGGER.format(name=name, table=table))
+        op.create_index('ix_{name}_genres'.format(name=name), table, ['genres'], postgresql_using='gin')
+    op.execute('DROP FUNCTION fyyur_normalize_genres(text[])')
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return
+    for table in TABLES:
+        name = table.lower()
+        op.drop_index('ix_{name}_genres'.format(name=name), table_name=table)
+        op.execute('DROP TRIGGER {name}_search_vector_update ON "{table}"'.format(name=name, table=table))
+        op.execute('ALTER TABLE "{table}" ALTER COLUMN genres TYPE varchar(120)[] USING genres::varchar(120)[]'
+                   .format(table=table))
+        op.execute(TRIGGER.format(name=name, table=table))
+    op.execute('DROP TYPE genre')
@@ -0,0 +1,31 @@
+"""delete counters for the API's collection versions
+
+Revision ID: a5c9e3f7d2b4
+Revises: d8e2a6f4b1c3
+Create Date: 2026-10-19 09:14:37.268410
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a5c9e3f7d2b4'
+down_revision = 'd8e2a6f4b1c3'
+branch_labels = None
+depends_on = None
+
+TABLES = ('Venue', 'Artist', 'Show')
+
+
+def upgrade():
+    delete_counts = op.create_table('delete_counts',
+    sa.Column('table_name', sa.String(length=50), nullable=False),
+    sa.Column('deletes', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('table_name')
+    )
+    op.bulk_insert(delete_counts, [{'table_name': table, 'deletes': 0} for table in TABLES])
+
+
+def downgrade():
+    op.drop_table('delete_counts')
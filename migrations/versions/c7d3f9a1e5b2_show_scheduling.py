@@ -0,0 +1,65 @@
+"""show durations and non-overlapping bookings per venue and per artist
+
+Revision ID: c7d3f9a1e5b2
+Revises: a41f5c8e2b90
+Create Date: 2026-10-18 21:12:40.318825
+
+Existing shows get the default length of 120 minutes. On Postgres the
+overlap rule becomes an exclusion constraint over tsrange(start, end),
+which needs btree_gist for the = on the id column. The upgrade stops,
+naming a few of them, if existing shows already overlap.
+
+A partitioned "Show" table (see 9e4b7c2d1f08) cannot carry these
+constraints, so there only scheduling.check_schedule() applies.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7d3f9a1e5b2'
+down_revision = 'a41f5c8e2b90'
+branch_labels = None
+depends_on = None
+
+DEFAULT_SHOW_MINUTES = 120
+CONSTRAINTS = (('show_venue_no_overlap', 'venue_id'), ('show_artist_no_overlap', 'artist_id'))
+
+
+def _booked(alias=''):
+    return "tsrange({alias}start_time, {alias}start_time + {alias}duration_minutes * interval '1 minute')".format(
+        alias=alias + '.' if alias else '')
+
+
+def _partitioned(bind):
+    return bind.execute(sa.text("SELECT relkind = 'p' FROM pg_class WHERE relname = 'Show'")).scalar()
+
+
+def upgrade():
+    op.add_column('Show', sa.Column('duration_minutes', sa.Integer(), nullable=False,
+                                    server_default=str(DEFAULT_SHOW_MINUTES)))
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql' or _partitioned(bind):
+        return
+
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    for name, column in CONSTRAINTS:
+        overlaps = bind.execute(sa.text('''
+            SELECT a.id, b.id FROM "Show" a JOIN "Show" b
+              ON a.{column} = b.{column} AND a.id < b.id AND {a} && {b}
+            ORDER BY a.id, b.id LIMIT 10
+        '''.format(column=column, a=_booked('a'), b=_booked('b')))).all()
+        if overlaps:
+            raise RuntimeError('shows overlap on %s, move or shorten them first: %s' % (
+                column, ', '.join('%d/%d' % pair for pair in overlaps)))
+        op.execute('ALTER TABLE "Show" ADD CONSTRAINT {name} EXCLUDE USING gist ({column} WITH =, {booked} WITH &&)'
+                   .format(name=name, column=column, booked=_booked()))
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql' and not _partitioned(bind):
+        for name, _ in reversed(CONSTRAINTS):
+            op.drop_constraint(name, 'Show', type_='exclude')
+    op.drop_column('Show', 'duration_minutes')
@@ -0,0 +1,33 @@
+"""indexes matching the keyset order of the listings
+
+Revision ID: d8e2a6f4b1c3
+Revises: f1b6d2e8a4c9
+Create Date: 2026-10-18 23:42:05.118270
+
+/shows pages on (start_time, id), /venues on (coalesce(state, ''),
+coalesce(city, ''), coalesce(name, ''), id) and /artists on
+(coalesce(name, ''), id); see listings.keyset_page.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd8e2a6f4b1c3'
+down_revision = 'f1b6d2e8a4c9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_show_start_time_id', 'Show', ['start_time', 'id'], unique=False)
+    op.create_index('ix_venue_directory', 'Venue', [sa.text("coalesce(state, '')"), sa.text("coalesce(city, '')"),
+                                                    sa.text("coalesce(name, '')"), 'id'], unique=False)
+    op.create_index('ix_artist_name', 'Artist', [sa.text("coalesce(name, '')"), 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_artist_name', table_name='Artist')
+    op.drop_index('ix_venue_directory', table_name='Venue')
+    op.drop_index('ix_show_start_time_id', table_name='Show')
@@ -0,0 +1,34 @@
+"""venue latitude/longitude and integer geohash
+
+Revision ID: f1b6d2e8a4c9
+Revises: e4a8c1d7b3f6
+Create Date: 2026-10-18 23:10:27.916344
+
+The columns start out empty; flask fyyur geocode fills them in for the
+existing venues from the bundled gazetteer.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1b6d2e8a4c9'
+down_revision = 'e4a8c1d7b3f6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('Venue', sa.Column('latitude', sa.Float(), nullable=True))
+    op.add_column('Venue', sa.Column('longitude', sa.Float(), nullable=True))
+    op.add_column('Venue', sa.Column('geohash', sa.BigInteger(), nullable=True))
+    # covering, so the radius prefilter never touches the table
+    op.create_index('ix_venue_location', 'Venue', ['geohash', 'latitude', 'longitude', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_venue_location', table_name='Venue')
+    op.drop_column('Venue', 'geohash')
+    op.drop_column('Venue', 'longitude')
+    op.drop_column('Venue', 'latitude')
@@ -1,14 +1,59 @@
+from datetime import datetime
 
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import func, literal_column
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import TSVECTOR
 
-db = SQLAlchemy()
+from enums import Genre
+from instrumentation import track_queries
+from pooling import engine_options, instrument
+from routing import RoutingSession, replica_binds
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 def setup_db(app):
-    db.app = app
+    # the one engine and pool shared by models, views and commands; db.session
+    # is scoped to the app context and removed when each request tears down
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
+    # read replicas are extra binds that only RoutingSession hands out
+    app.config.setdefault('SQLALCHEMY_BINDS', {}).update(replica_binds(app.config['SQLALCHEMY_REPLICA_URIS']))
+    db.init_app(app)
+    with app.app_context():
+        for engine in db.engines.values():
+            instrument(engine)
+            track_queries(engine)
+#----------------------------------------------------------------------------#
+# Types.
+#----------------------------------------------------------------------------#
+
+# created by the genre enum migration
+GENRE_ENUM = postgresql.ENUM(*[genre.name for genre in Genre], name='genre', create_type=False)
+
+class GenreArray(db.TypeDecorator):
+    """ Genre names normalized against enums.Genre: a genre[] enum array on
+    Postgres, a JSON list elsewhere. Unknown genres raise ValueError. """
+    impl = db.JSON
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == 'postgresql':
+            return dialect.type_descriptor(postgresql.ARRAY(GENRE_ENUM))
+        return dialect.type_descriptor(db.JSON())
+
+    def process_bind_param(self, value, dialect):
+        return Genre.normalize(value) if value is not None else None
+
 #----------------------------------------------------------------------------#
 # Models.
 #----------------------------------------------------------------------------#
 class Venue(db.Model):
     __tablename__ = 'Venue'
+    # genre any/all filters use && and @>
+    __table_args__ = (
+        db.Index('ix_venue_genres', 'genres', postgresql_using='gin'),
+        # covering index for radius queries, see geo.near
+        db.Index('ix_venue_location', 'geohash', 'latitude', 'longitude', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
@@ -21,25 +66,112 @@ class Venue(db.Model):
     seeking_talent = db.Column(db.Boolean())
     seeking_description = db.Column(db.String(500))
     website = db.Column(db.String(200))
-    genres = db.Column(db.ARRAY(db.String(120)))
+    genres = db.Column(GenreArray)
+    # geocoded from city and state, see geo.py; radius queries scan geohash ranges
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    geohash = db.deferred(db.Column(db.BigInteger))
+    # maintained by the venue_search_vector trigger, see search.py
+    search_vector = db.deferred(db.Column(TSVECTOR().with_variant(db.Text, 'sqlite')))
+    # shows from / before CounterState.rolled_at, maintained by counters.py
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # bumped on every ORM write; the API derives its ETags from it
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
 
 class Artist(db.Model):
     __tablename__ = 'Artist'
+    __table_args__ = (
+        db.Index('ix_artist_genres', 'genres', postgresql_using='gin'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(db.ARRAY(db.String(120)))
+    genres = db.Column(GenreArray)
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean())
     seeking_description = db.Column(db.String(500))
     website = db.Column(db.String(120))
+    # maintained by the artist_search_vector trigger, see search.py
+    search_vector = db.deferred(db.Column(TSVECTOR().with_variant(db.Text, 'sqlite')))
+    # shows from / before CounterState.rolled_at, maintained by counters.py
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+
+# artists_page(sort='popular') walks this index
+db.Index('ix_artist_popularity', -Artist.upcoming_shows_count, Artist.id)
+
+
+def sort_text(column):
+    # the '' is inlined, not bound, so that queries match the expression indexes
+    return func.coalesce(column, literal_column("''"))
+
+
+# the keyset order of /venues and of /artists by name, see listings.keyset_page
+db.Index('ix_venue_directory', sort_text(Venue.state), sort_text(Venue.city), sort_text(Venue.name), Venue.id)
+db.Index('ix_artist_name', sort_text(Artist.name), Artist.id)
+
+# show lengths, see scheduling.py
+DEFAULT_SHOW_MINUTES = 120
+MAX_SHOW_MINUTES = 24 * 60
 
 class Show(db.Model):
     __tablename__ = 'Show'
+    # detail pages filter on one side of the show plus a start_time range
+    __table_args__ = (
+        db.Index('ix_show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_show_artist_id_start_time', 'artist_id', 'start_time'),
+        # the keyset order of /shows
+        db.Index('ix_show_start_time_id', 'start_time', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
     start_time = db.Column(db.DateTime)
-    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), primary_key=True)
-    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), primary_key=True)
\ No newline at end of file
+    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
+    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
+    # the venue and the artist are booked from start_time for this long
+    duration_minutes = db.Column(db.Integer, nullable=False, default=DEFAULT_SHOW_MINUTES,
+                                 server_default=str(DEFAULT_SHOW_MINUTES))
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+
+class CounterState(db.Model):
+    __tablename__ = 'counter_state'
+
+    id = db.Column(db.Integer, primary_key=True)
+    # shows starting before this are counted as past; moved by counters.rollover()
+    rolled_at = db.Column(db.DateTime, nullable=False)
+
+class DeleteCount(db.Model):
+    __tablename__ = 'delete_counts'
+
+    # one row per table, bumped by counters.count_deletes()
+    table_name = db.Column(db.String(50), primary_key=True)
+    deletes = db.Column(db.Integer, nullable=False, default=0)
+
+class Job(db.Model):
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        # workers claim due jobs oldest first, see jobs.DatabaseQueue
+        db.Index('ix_jobs_status_run_at', 'status', 'run_at'),
+        # at most one waiting job per dedup key
+        db.Index('ix_jobs_pending_dedup_key', 'dedup_key', unique=True,
+                 postgresql_where=db.text("status = 'pending'"), sqlite_where=db.text("status = 'pending'")),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    args = db.Column(db.JSON, nullable=False)
+    dedup_key = db.Column(db.String(200))
+    # pending -> running -> deleted when done, or failed after max_attempts
+    status = db.Column(db.String(20), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False)
+    run_at = db.Column(db.DateTime, nullable=False)
+    locked_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
@@ -0,0 +1,28 @@
+from flask import current_app
+from sqlalchemy import inspect
+
+from models import db
+from read_models import ArtistDetail, VenueDetail, load_detail
+from timeline import artist_timeline, venue_timeline
+
+#----------------------------------------------------------------------------#
+# Detail payloads, shared by the pages and the API.
+#----------------------------------------------------------------------------#
+
+def entity_payload(entity):
+    # plain dict of the loaded columns so the payload can be cached and pickled
+    return dict((prop.key, getattr(entity, prop.key)) for prop in inspect(type(entity)).column_attrs if not prop.deferred)
+
+
+def venue_payload(venue_id, now):
+    venue = load_detail(db.session, VenueDetail, venue_id)
+    if venue is None:
+        return None
+    return venue.with_timeline(venue_timeline(db.session, venue_id, now, current_app.config['DETAIL_SHOWS_LIMIT']))
+
+
+def artist_payload(artist_id, now):
+    artist = load_detail(db.session, ArtistDetail, artist_id)
+    if artist is None:
+        return None
+    return artist.with_timeline(artist_timeline(db.session, artist_id, now, current_app.config['DETAIL_SHOWS_LIMIT']))
@@ -0,0 +1,126 @@
+from collections import namedtuple
+
+from sqlalchemy import inspect, select
+
+from models import Artist, Venue
+
+#----------------------------------------------------------------------------#
+# Read models.
+#----------------------------------------------------------------------------#
+
+# The detail pages, the venue directory and the show timelines render
+# records loaded with column-only select()s, not ORM instances: there is
+# no identity map entry, instance state or change tracking behind them,
+# only a slot per column. Templates read them as attributes; the API reads
+# them like the dicts they replaced (record['name'], 'name' in record).
+# They pickle, for the page cache and the snapshots.
+
+Timeline = namedtuple('Timeline', 'past_shows upcoming_shows past_shows_count upcoming_shows_count')
+
+
+def _columns(model):
+    return tuple(prop.key for prop in inspect(model).column_attrs if not prop.deferred)
+
+
+class ReadModel(object):
+    """ A record with one slot per field. Fields left unset are missing:
+    not attributes, not keys and not in _asdict(). """
+
+    __slots__ = ()
+
+    def __init__(self, *values, **named):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+        for name, value in named.items():
+            setattr(self, name, value)
+
+    @classmethod
+    def from_values(cls, names, values):
+        record = cls.__new__(cls)
+        for name, value in zip(names, values):
+            setattr(record, name, value)
+        return record
+
+    @classmethod
+    def from_row(cls, row):
+        """ A record of a result row whose columns are named after fields. """
+        return cls.from_values(row._fields, row)
+
+    def keys(self):
+        return [name for name in self.__slots__ if hasattr(self, name)]
+
+    def __contains__(self, name):
+        return hasattr(self, name)
+
+    def __getitem__(self, name):
+        try:
+            return getattr(self, name)
+        except AttributeError:
+            raise KeyError(name)
+
+    def _asdict(self):
+        return dict((name, getattr(self, name)) for name in self.keys())
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self._asdict() == other._asdict()
+
+    def __repr__(self):
+        return '%s(%s)' % (type(self).__name__,
+                           ', '.join('%s=%r' % item for item in self._asdict().items()))
+
+
+class ShowRow(ReadModel):
+    """ A show on a timeline. Only the other side's columns are set: the
+    artist's on a venue page, the venue's on an artist page. """
+
+    __slots__ = ('venue_id', 'venue_name', 'venue_image_link',
+                 'artist_id', 'artist_name', 'artist_image_link', 'start_time')
+
+
+class VenueCard(ReadModel):
+    """ A venue in the /venues directory. """
+
+    __slots__ = ('id', 'name', 'city', 'state', 'num_upcoming_shows')
+
+
+class _Detail(ReadModel):
+
+    __slots__ = ()
+    model = None
+    columns = ()
+
+    def with_timeline(self, timeline):
+        # the timeline's counts are the ones on the page, as in the old payload dicts
+        for name, value in zip(Timeline._fields, timeline):
+            setattr(self, name, value)
+        return self
+
+
+def _detail_slots(model):
+    columns = _columns(model)
+    return columns + tuple(name for name in Timeline._fields if name not in columns)
+
+
+class VenueDetail(_Detail):
+    """ A venue's columns and its Timeline, for /venues/<id>. """
+
+    __slots__ = _detail_slots(Venue)
+    model = Venue
+    columns = _columns(Venue)
+
+
+class ArtistDetail(_Detail):
+    """ An artist's columns and its Timeline, for /artists/<id>. """
+
+    __slots__ = _detail_slots(Artist)
+    model = Artist
+    columns = _columns(Artist)
+
+
+def load_detail(session, detail, entity_id):
+    """ The columns of one venue or artist as a `detail` record (VenueDetail
+    or ArtistDetail), or None when there is no such row. """
+    model = detail.model
+    query = select(*[getattr(model, name) for name in detail.columns]).where(model.id == entity_id)
+    row = session.execute(query).first()
+    return None if row is None else detail.from_row(row)
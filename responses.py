@@ -0,0 +1,279 @@
+import zlib
+from itertools import chain
+
+from flask import g, request, session
+from flask.sessions import SecureCookieSessionInterface
+from werkzeug.datastructures import Headers
+from werkzeug.http import parse_accept_header
+
+from routing import LAST_WRITE_KEY
+
+try:
+    import brotli
+except ImportError:  # optional: pip install brotli
+    brotli = None
+
+#----------------------------------------------------------------------------#
+# Compression.
+#----------------------------------------------------------------------------#
+
+# Text responses of COMPRESSION_MIN_SIZE bytes or more are sent with
+# brotli (when installed) or gzip, whichever the client prefers. Streamed
+# responses are buffered up to that size, which covers the layout's head,
+# and then compressed as they go: the compressor is flushed every
+# FLUSH_BYTES so that a slow page still reaches the browser in pieces.
+
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript', 'application/xml', 'image/svg+xml')
+# statuses without a body worth compressing, or whose body must stay as it is
+UNCOMPRESSED_STATUSES = (204, 206, 304)
+FLUSH_BYTES = 16384
+
+
+def negotiate(accept_encoding, encodings):
+    """ The first of `encodings` with the highest quality in the header. """
+    accepted = parse_accept_header(accept_encoding)
+    best, best_quality = None, 0
+    for encoding in encodings:
+        quality = accepted.quality(encoding)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class GzipEncoder(object):
+
+    def __init__(self, level):
+        # wbits 16 + MAX_WBITS: gzip header and trailer
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class BrotliEncoder(object):
+
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+class CompressionMiddleware(object):
+    """ WSGI middleware compressing text responses for clients that accept it.
+
+    Responses that already have a Content-Encoding (the precompressed
+    assets), carry Cache-Control: no-transform or are below min_size pass
+    through. Compressed responses get a weak ETag, since their bytes are
+    not those the strong one was computed for.
+    """
+
+    def __init__(self, app, min_size=1024, level=6, brotli_quality=4):
+        self.app = app
+        self.min_size = min_size
+        self.level = level
+        self.brotli_quality = brotli_quality
+        self.encodings = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+    def __call__(self, environ, start_response):
+        captured = []
+        pending = []
+
+        def capture(status, headers, exc_info=None):
+            if exc_info is not None and captured:
+                raise exc_info[1].with_traceback(exc_info[2])
+            captured[:] = [status, headers, exc_info]
+            return pending.append
+
+        result = self.app(environ, capture)
+        body = result
+        if not captured:
+            # start_response may be called as late as the first chunk
+            first = []
+            body = iter(result)
+            for chunk in body:
+                first.append(chunk)
+                if captured:
+                    break
+            body = chain(first, body)
+        status, headers, exc_info = captured
+        headers, body = self.compress(environ, int(status.split(' ', 1)[0]), headers, chain(pending, body))
+        start_response(status, headers, exc_info)
+        return _ClosingIterator(body, result)
+
+    def encoder(self, encoding):
+        if encoding == 'br':
+            return BrotliEncoder(self.brotli_quality)
+        return GzipEncoder(self.level)
+
+    def compress(self, environ, status, headers, body):
+        """ (headers, body) to send for a response, compressed when that is
+        worthwhile. Also used by the ASGI app for the pages it renders. """
+        headers = Headers(headers)
+        content_type = headers.get('Content-Type', '')
+        if (status < 200 or status in UNCOMPRESSED_STATUSES or 'Content-Encoding' in headers
+                or not content_type.startswith(COMPRESSIBLE_TYPES)
+                or 'no-transform' in headers.get('Cache-Control', '')):
+            return headers.to_wsgi_list(), body
+        _add_vary(headers, 'Accept-Encoding')
+        encoding = negotiate(environ.get('HTTP_ACCEPT_ENCODING', ''), self.encodings)
+        length = headers.get('Content-Length', type=int)
+        if encoding is None or environ['REQUEST_METHOD'] == 'HEAD' or (length is not None and length < self.min_size):
+            return headers.to_wsgi_list(), body
+
+        body = iter(body)
+        streamed = length is None
+        if streamed:
+            head, size = [], 0
+            for chunk in body:
+                head.append(chunk)
+                size += len(chunk)
+                if size >= self.min_size:
+                    break
+            else:
+                headers['Content-Length'] = str(size)
+                return headers.to_wsgi_list(), head
+            body = chain([b''.join(head)], body)
+
+        headers.remove('Content-Length')
+        headers['Content-Encoding'] = encoding
+        etag = headers.get('ETag')
+        if etag and not etag.startswith('W/'):
+            headers['ETag'] = 'W/' + etag
+        return headers.to_wsgi_list(), self._encode(self.encoder(encoding), body, streamed)
+
+    def _encode(self, encoder, body, streamed):
+        unflushed = 0
+        for index, chunk in enumerate(body):
+            data = encoder.compress(chunk)
+            unflushed += len(chunk)
+            # a streamed page's first chunk, the layout's head, goes out right away
+            if (streamed and index == 0) or unflushed >= FLUSH_BYTES:
+                data += encoder.flush()
+                unflushed = 0
+            if data:
+                yield data
+        yield encoder.finish()
+
+
+class _ClosingIterator(object):
+    """ Iterates the compressed body and closes the app's own iterable. """
+
+    def __init__(self, body, result):
+        self._body = body
+        self._result = result
+
+    def __iter__(self):
+        return iter(self._body)
+
+    def close(self):
+        if hasattr(self._body, 'close'):
+            self._body.close()
+        if hasattr(self._result, 'close'):
+            self._result.close()
+
+
+def _add_vary(headers, name):
+    values = [value.strip() for value in headers.get('Vary', '').split(',') if value.strip()]
+    if name.lower() not in (value.lower() for value in values):
+        headers['Vary'] = ', '.join(values + [name])
+
+
+#----------------------------------------------------------------------------#
+# Cache policies.
+#----------------------------------------------------------------------------#
+
+# Views pick a Cache-Control policy with @cache_policy(name):
+#
+#   page    public, max-age=HTTP_CACHE_MAX_AGE with stale-while-revalidate
+#           of HTTP_CACHE_STALE_SECONDS, so that a reverse proxy in front of
+#           the app serves the listings; they get an ETag too, so the proxy
+#           revalidates them cheaply
+#   detail  public, no-cache with an ETag: a venue or artist page is what its
+#           editor is redirected to, so caches must check back every time
+#   form    no-store
+#
+# A page showing flashed messages, or that changed the session, is this
+# client's own and goes out as private instead, as does every page for a
+# client that has written (its session carries routing.LAST_WRITE_KEY), so
+# no cache serves it a page from before its own edit. Responses a shared
+# cache may store are sent without the session cookie (and without Vary:
+# Cookie), which would otherwise keep proxies from caching them.
+
+POLICIES = ('page', 'detail', 'form')
+
+
+def cache_policy(name):
+    if name not in POLICIES:
+        raise ValueError('unknown cache policy %r' % name)
+
+    def decorate(view):
+        view.cache_policy = name
+        return view
+    return decorate
+
+
+def _view_policy(app):
+    # looked up by endpoint, so that the ASGI app's own views get it too
+    return getattr(app.view_functions.get(request.endpoint), 'cache_policy', None)
+
+
+def apply_cache_policy(app, response):
+    policy = _view_policy(app)
+    if policy is None or 'Cache-Control' in response.headers:
+        return response
+    if policy == 'form':
+        response.cache_control.no_store = True
+        return response
+    if request.method not in ('GET', 'HEAD') or response.status_code != 200:
+        return response
+    if session.modified or '_flashes' in session or LAST_WRITE_KEY in session:
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response
+    if policy == 'detail':
+        response.headers['Cache-Control'] = 'public, no-cache'
+    else:
+        response.headers['Cache-Control'] = 'public, max-age=%d, stale-while-revalidate=%d' % (
+            app.config['HTTP_CACHE_MAX_AGE'], app.config['HTTP_CACHE_STALE_SECONDS'])
+    g.shared_cacheable = True
+    if not response.is_streamed:
+        response.add_etag()
+        response.make_conditional(request)
+    return response
+
+
+class CacheableSessionInterface(SecureCookieSessionInterface):
+    """ The cookie session, left out of responses shared caches may store. """
+
+    def save_session(self, app, session, response):
+        if g.get('shared_cacheable'):
+            return
+        super(CacheableSessionInterface, self).save_session(app, session, response)
+
+
+#----------------------------------------------------------------------------#
+# Setup.
+#----------------------------------------------------------------------------#
+
+def setup_responses(app):
+    """ Cache policies, and compression when COMPRESSION is on. """
+    app.session_interface = CacheableSessionInterface()
+    app.after_request(lambda response: apply_cache_policy(app, response))
+    config = app.config
+    if config['COMPRESSION']:
+        app.wsgi_app = app.extensions['compression'] = CompressionMiddleware(
+            app.wsgi_app, config['COMPRESSION_MIN_SIZE'], config['COMPRESSION_LEVEL'],
+            config['COMPRESSION_BROTLI_QUALITY'])
@@ -0,0 +1,70 @@
+import random
+import time
+from functools import wraps
+
+from flask import current_app, g, has_request_context, session as cookie_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+#----------------------------------------------------------------------------#
+# Read-replica routing.
+#----------------------------------------------------------------------------#
+
+REPLICA_PREFIX = 'replica_'
+# flask session key holding the time of this client's last write
+LAST_WRITE_KEY = '_db_last_write'
+
+
+def replica_binds(uris):
+    """ SQLALCHEMY_BINDS entries for the configured replicas. """
+    return dict((REPLICA_PREFIX + str(index), uri) for index, uri in enumerate(uris))
+
+
+def read_only(view):
+    """ Let the view's queries go to a replica. Anything that flushes, and
+    any client that wrote within READ_YOUR_WRITES_SECONDS, stays on the
+    primary. """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.db_read_only = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def recently_wrote():
+    """ Whether this client committed a write within READ_YOUR_WRITES_SECONDS. """
+    last_write = cookie_session.get(LAST_WRITE_KEY)
+    window = current_app.config['READ_YOUR_WRITES_SECONDS']
+    return last_write is not None and time.time() - last_write < window
+
+
+class RoutingSession(Session):
+    """ Session sending read-only requests to a replica engine. """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_request_context() and g.get('db_read_only'):
+            replica = g.get('db_replica')
+            if replica is None:
+                replicas = [engine for key, engine in self._db.engines.items()
+                            if key is not None and key.startswith(REPLICA_PREFIX)]
+                # pinned for the whole request so its reads are consistent
+                replica = g.db_replica = random.choice(replicas) if replicas and not recently_wrote() else False
+            if replica:
+                return replica
+        return super(RoutingSession, self).get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _mark_write(session, flush_context):
+    session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _remember_write(session):
+    if session.info.pop('wrote', False) and has_request_context():
+        cookie_session[LAST_WRITE_KEY] = time.time()
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _forget_write(session):
+    session.info.pop('wrote', None)
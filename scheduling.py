@@ -0,0 +1,168 @@
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import select
+
+from models import DEFAULT_SHOW_MINUTES, MAX_SHOW_MINUTES, Show
+
+#----------------------------------------------------------------------------#
+# Show scheduling.
+#----------------------------------------------------------------------------#
+
+# A show occupies its venue and its artist from start_time for
+# duration_minutes. Bookings of one venue, or of one artist, may not
+# overlap. On Postgres the show_venue_no_overlap / show_artist_no_overlap
+# exclusion constraints enforce this; check_schedule() reports conflicts
+# up front, for a single show or a whole import batch in one pass.
+
+SIDES = (('venue', Show.venue_id), ('artist', Show.artist_id))
+
+Booking = namedtuple('Booking', 'start end show_id')
+
+
+def show_end(start_time, duration_minutes):
+    return start_time + timedelta(minutes=duration_minutes or DEFAULT_SHOW_MINUTES)
+
+
+class Calendar(object):
+    """ Bookings per (side, entity id), sorted by start.
+
+    Alongside each list runs the latest end of the bookings up to each
+    position, so a bisect on start plus that running max finds a collision
+    even when existing bookings overlap one another (rows from before the
+    exclusion constraints, or on SQLite); no interval tree is needed.
+    """
+
+    def __init__(self):
+        self._bookings = {}
+        self._reach = {}
+
+    def add(self, key, booking):
+        bookings = self._bookings.setdefault(key, [])
+        reach = self._reach.setdefault(key, [])
+        position = bisect_right(bookings, booking)
+        bookings.insert(position, booking)
+        reach.insert(position, booking.end)
+        latest = reach[position - 1] if position else booking.end
+        for index in range(position, len(bookings)):
+            latest = max(latest, bookings[index].end)
+            reach[index] = latest
+
+    def bookings(self, key):
+        return self._bookings.get(key, [])
+
+    def conflict(self, key, start, end):
+        """ A booking overlapping [start, end), or None. """
+        bookings = self._bookings.get(key)
+        if not bookings:
+            return None
+        reach = self._reach[key]
+        position = bisect_left(bookings, (start,))
+        # something starting earlier still runs at `start`: walk back to it
+        index = position - 1
+        while index >= 0 and reach[index] > start:
+            if bookings[index].end > start:
+                return bookings[index]
+            index -= 1
+        if position < len(bookings) and bookings[position].start < end:
+            return bookings[position]
+        return None
+
+    def free_slots(self, key, window_start, window_end, min_minutes=0):
+        """ (start, end) gaps of at least min_minutes within the window. """
+        slots = []
+        cursor = window_start
+        for booking in self.bookings(key):
+            if booking.end <= cursor:
+                continue
+            if booking.start >= window_end:
+                break
+            if booking.start > cursor:
+                slots.append((cursor, booking.start))
+            cursor = max(cursor, booking.end)
+        if cursor < window_end:
+            slots.append((cursor, window_end))
+        minimum = timedelta(minutes=min_minutes)
+        return [(start, end) for start, end in slots if end - start >= minimum]
+
+
+def load_calendar(session, sides, window_start, window_end):
+    """ Existing bookings overlapping the window, for {side: entity ids}.
+
+    One query per side, each a range scan of the (side_id, start_time) index.
+    """
+    calendar = Calendar()
+    earliest = window_start - timedelta(minutes=MAX_SHOW_MINUTES)
+    for side, column in SIDES:
+        ids = sides.get(side)
+        if not ids:
+            continue
+        query = select(column, Show.id, Show.start_time, Show.duration_minutes).where(
+            column.in_(sorted(ids)), Show.start_time >= earliest, Show.start_time < window_end)
+        for entity_id, show_id, start_time, duration in session.execute(query):
+            end = show_end(start_time, duration)
+            if end > window_start:
+                calendar.add((side, entity_id), Booking(start_time, end, show_id))
+    return calendar
+
+
+def check_schedule(session, shows):
+    """ Conflicts for a batch of shows, checked against the database and
+    against each other in one pass.
+
+    `shows` are dicts or objects with venue_id, artist_id, start_time and
+    duration_minutes. Returns {index: {'venue'/'artist': [message]}} for
+    the shows that collide; earlier shows in the batch win.
+    """
+    def value(show, name):
+        return show.get(name) if isinstance(show, dict) else getattr(show, name)
+
+    entries = []
+    for index, show in enumerate(shows):
+        start = value(show, 'start_time')
+        if start is None:
+            continue
+        entries.append((index, int(value(show, 'venue_id')), int(value(show, 'artist_id')),
+                        start, show_end(start, value(show, 'duration_minutes'))))
+    if not entries:
+        return {}
+
+    calendar = load_calendar(session,
+                             {'venue': set(entry[1] for entry in entries),
+                              'artist': set(entry[2] for entry in entries)},
+                             min(entry[3] for entry in entries), max(entry[4] for entry in entries))
+    conflicts = {}
+    for index, venue_id, artist_id, start, end in entries:
+        keys = (('venue', venue_id), ('artist', artist_id))
+        for key in keys:
+            booking = calendar.conflict(key, start, end)
+            if booking is not None:
+                conflicts.setdefault(index, {})[key[0]] = [
+                    '%s %d is already booked from %s to %s%s.' % (
+                        key[0].capitalize(), key[1], booking.start.strftime('%Y-%m-%d %H:%M'),
+                        booking.end.strftime('%Y-%m-%d %H:%M'),
+                        ' (show %d)' % booking.show_id if booking.show_id else ' by an earlier row')]
+        if index not in conflicts:
+            for key in keys:
+                calendar.add(key, Booking(start, end, 0))
+    return conflicts
+
+
+def week_start(value=None):
+    """ Monday 00:00 of the week given as '2026-W43', a date, or today. """
+    if not value:
+        day = date.today()
+    elif 'W' in value:
+        year, week = value.split('-W')
+        day = date.fromisocalendar(int(year), int(week), 1)
+    else:
+        day = date.fromisoformat(value)
+    return datetime.combine(day - timedelta(days=day.weekday()), datetime.min.time())
+
+
+def free_slots(session, side, entity_id, start, days=7, min_minutes=DEFAULT_SHOW_MINUTES):
+    """ Free (start, end) slots of the venue or artist in [start, start + days). """
+    end = start + timedelta(days=days)
+    calendar = load_calendar(session, {side: [entity_id]}, start, end)
+    return calendar.free_slots((side, entity_id), start, end, min_minutes)
@@ -0,0 +1,265 @@
+import re
+import threading
+from bisect import bisect_left
+
+from sqlalchemy import event, or_
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import expression, func
+
+from listings import genre_filter
+from models import Artist, Venue
+
+#----------------------------------------------------------------------------#
+# Search.
+#----------------------------------------------------------------------------#
+
+# Postgres text search configuration used by the search_vector triggers.
+TS_CONFIG = 'simple'
+# pg_trgm's default word_similarity threshold, mirrored by the in-memory index.
+WORD_SIMILARITY_THRESHOLD = 0.6
+DEFAULT_LIMIT = 50
+
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    return _WORD.findall((text or '').lower())
+
+
+def trigrams(word):
+    """ Trigrams the way pg_trgm builds them: padded with two leading blanks
+    and one trailing blank. """
+    padded = '  ' + word + ' '
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def similarity(left, right):
+    if not left or not right:
+        return 0.0
+    return len(left & right) / float(len(left | right))
+
+
+def word_similarity(term_words, text_words):
+    """ Rough equivalent of pg_trgm's word_similarity(): how well every word
+    of the term matches its closest word in the text. """
+    if not term_words or not text_words:
+        return 0.0
+    return sum(max(similarity(wanted, word) for word in text_words)
+               for wanted in term_words) / len(term_words)
+
+
+def _document(entity):
+    """ Weighted fields indexed for an entity, matching the trigger bodies in
+    the search migration: name (A), city/state (B), genres (C). """
+    return (
+        (1.0, entity.name),
+        (0.4, ' '.join(filter(None, [entity.city, entity.state]))),
+        (0.2, ' '.join(entity.genres or [])),
+    )
+
+
+#  Postgres
+#  ----------------------------------------------------------------
+
+def _tsquery(tokens):
+    # every term is a prefix match and all of them must be present
+    return func.to_tsquery(TS_CONFIG, ' & '.join(token + ':*' for token in tokens))
+
+
+def _search_postgres(session, model, term, tokens, limit, genres, genre_match):
+    query = _tsquery(tokens)
+    name = func.lower(model.name)
+    rank = func.ts_rank(model.search_vector, query) + func.word_similarity(term, name)
+    results = session.query(model).filter(
+        or_(model.search_vector.op('@@')(query), expression.literal(term).op('<%')(name)))
+    if genres:
+        results = results.filter(genre_filter(session, model.genres, genres, genre_match))
+    return results.order_by(rank.desc(), model.id).limit(limit).all()
+
+
+#  In-memory fallback (SQLite)
+#  ----------------------------------------------------------------
+
+class InMemorySearchIndex(object):
+    """ Pure Python stand-in for the tsvector/pg_trgm indexes.
+
+    Keeps an inverted index from token to weighted postings, a sorted
+    vocabulary for prefix lookups and per-word name trigrams for fuzzy
+    matching.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._postings = {}
+        self._vocabulary = []
+        self._documents = {}
+        self._names = {}
+
+    def __len__(self):
+        return len(self._documents)
+
+    def add(self, entity):
+        self.put(*self.entry(entity))
+
+    @staticmethod
+    def entry(entity):
+        """ What add() indexes for an entity: (id, token weights, name
+        trigrams), taken while its attributes are loaded. """
+        weights = {}
+        for weight, text in _document(entity):
+            for token in tokenize(text):
+                weights[token] = max(weights.get(token, 0.0), weight)
+        return entity.id, weights, [trigrams(word) for word in tokenize(entity.name)]
+
+    def put(self, entity_id, weights, names):
+        with self._lock:
+            self.remove(entity_id)
+            for token, weight in weights.items():
+                postings = self._postings.get(token)
+                if postings is None:
+                    postings = self._postings[token] = {}
+                    self._vocabulary.insert(bisect_left(self._vocabulary, token), token)
+                postings[entity_id] = weight
+            self._documents[entity_id] = tuple(weights)
+            self._names[entity_id] = names
+
+    def remove(self, entity_id):
+        with self._lock:
+            for token in self._documents.pop(entity_id, ()):
+                postings = self._postings[token]
+                del postings[entity_id]
+                if not postings:
+                    del self._postings[token]
+                    del self._vocabulary[bisect_left(self._vocabulary, token)]
+            self._names.pop(entity_id, None)
+
+    def _prefix_scores(self, prefix):
+        scores = {}
+        start = bisect_left(self._vocabulary, prefix)
+        for token in self._vocabulary[start:]:
+            if not token.startswith(prefix):
+                break
+            # exact token hits outrank prefix hits
+            boost = 1.0 if token == prefix else 0.5
+            for entity_id, weight in self._postings[token].items():
+                scores[entity_id] = max(scores.get(entity_id, 0.0), weight * boost)
+        return scores
+
+    def search(self, term, limit=DEFAULT_LIMIT):
+        """ Return (id, score) pairs, best first. """
+        tokens = tokenize(term)
+        if not tokens:
+            return []
+        with self._lock:
+            scores = None
+            for token in tokens:
+                matches = self._prefix_scores(token)
+                if scores is None:
+                    scores = matches
+                else:
+                    scores = dict((entity_id, score + matches[entity_id])
+                                  for entity_id, score in scores.items()
+                                  if entity_id in matches)
+            wanted = [trigrams(token) for token in tokens]
+            for entity_id, words in self._names.items():
+                score = word_similarity(wanted, words)
+                if score >= WORD_SIMILARITY_THRESHOLD or entity_id in scores:
+                    scores[entity_id] = scores.get(entity_id, 0.0) + score
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:limit]
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def _memory_index(session, model):
+    index = _indexes.get(model)
+    if index is None:
+        with _indexes_lock:
+            index = _indexes.get(model)
+            if index is None:
+                index = InMemorySearchIndex()
+                for entity in session.query(model).yield_per(1000):
+                    index.add(entity)
+                _indexes[model] = index
+    return index
+
+
+def reset_index(model):
+    """ Drop the in-memory index so it is rebuilt on the next search, e.g.
+    after rows were written without going through the ORM. """
+    with _indexes_lock:
+        _indexes.pop(model, None)
+
+
+def _search_memory(session, model, term, limit, genres, genre_match):
+    # with a genre filter, rank every match and let the query below filter them
+    ranked = _memory_index(session, model).search(term, None if genres else limit)
+    if not ranked:
+        return []
+    entities = session.query(model).filter(model.id.in_([entity_id for entity_id, _ in ranked]))
+    if genres:
+        entities = entities.filter(genre_filter(session, model.genres, genres, genre_match))
+    entities = dict((entity.id, entity) for entity in entities)
+    return [entities[entity_id] for entity_id, _ in ranked if entity_id in entities][:limit]
+
+
+# The indexes are shared by every session in the process, so they only ever
+# hold committed rows: flushes stage their changes on the session, commits
+# apply them and rollbacks drop them, as the search_vector triggers'
+# writes are only seen once their transaction commits.
+
+STAGED_KEY = 'search_index_changes'
+
+
+def _stage(session, model, change):
+    session.info.setdefault(STAGED_KEY, []).append((model, change))
+
+
+def _keep_index_current(model):
+    # the in-memory counterpart of the search_vector triggers
+    def upsert(mapper, connection, target):
+        _stage(Session.object_session(target), model, InMemorySearchIndex.entry(target))
+
+    def delete(mapper, connection, target):
+        _stage(Session.object_session(target), model, target.id)
+
+    event.listen(model, 'after_insert', upsert)
+    event.listen(model, 'after_update', upsert)
+    event.listen(model, 'after_delete', delete)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_staged(session):
+    for model, change in session.info.pop(STAGED_KEY, ()):
+        index = _indexes.get(model)
+        if index is None:
+            continue
+        if isinstance(change, tuple):
+            index.put(*change)
+        else:
+            index.remove(change)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_staged(session):
+    session.info.pop(STAGED_KEY, None)
+
+
+_keep_index_current(Venue)
+_keep_index_current(Artist)
+
+
+#  Entry point
+#  ----------------------------------------------------------------
+
+def search(session, model, term, limit=DEFAULT_LIMIT, genres=None, genre_match='any'):
+    """ Ranked prefix/fuzzy search over name, city/state and genres,
+    optionally restricted to entities with any/all of `genres`. """
+    term = ' '.join(tokenize(term))
+    if not term:
+        return []
+    if session.get_bind().dialect.name == 'postgresql':
+        return _search_postgres(session, model, term, term.split(), limit, genres, genre_match)
+    return _search_memory(session, model, term, limit, genres, genre_match)
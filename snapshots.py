@@ -0,0 +1,246 @@
+import hashlib
+import json
+import os
+import stat
+import threading
+import time
+from collections import namedtuple
+
+from flask import make_response, render_template, session as cookie_session
+
+from directory import venue_directory
+from jobs import enqueue
+from listings import artists_page
+from models import db
+from templating import compile_templates
+
+#----------------------------------------------------------------------------#
+# Page snapshots.
+#----------------------------------------------------------------------------#
+
+# The home page and the first, unfiltered page of /venues and /artists are
+# the same for everyone and change only when venues or artists are written.
+# Each is kept as a snapshot: its template context and the page rendered
+# from it, built in one go and swapped in whole. A write enqueues a rebuild
+# of the snapshots listing that kind; a snapshot older than
+# SNAPSHOT_MAX_AGE is served once more while a rebuild is queued. The
+# version, a hash of the page, goes out in X-Snapshot-Version.
+#
+# SNAPSHOT_STORE picks where snapshots live:
+#
+#   memory  per process (default)
+#   disk    files in SNAPSHOT_DIR, replaced atomically and shared by the
+#           workers on a host; `flask fyyur warm` at deploy fills them.
+#           Only the page is stored, as JSON: a page with flashed messages
+#           is rendered from a context built there and then.
+
+Snapshot = namedtuple('Snapshot', 'name version built_at context html')
+
+Definition = namedtuple('Definition', 'name path template build kinds')
+
+DEFINITIONS = {}
+
+
+def snapshot(name, path, template, kinds=()):
+    """ Register a snapshot of the page at `path`. The function returns its
+    template context from a session; `kinds` are the entity kinds whose
+    writes make it stale. """
+    def register(build):
+        DEFINITIONS[name] = Definition(name, path, template, build, tuple(kinds))
+        return build
+    return register
+
+
+class SnapshotPage(object):
+    """ A first page of a listing, as the pager template needs it. """
+
+    cursor = None
+
+    def __init__(self, next_cursor, per_page):
+        self.next_cursor = next_cursor
+        self.per_page = per_page
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+@snapshot('home', '/', 'pages/home.html')
+def home_context(session):
+    return {}
+
+
+# shows too: the directory lists each venue's upcoming show count
+@snapshot('venues', '/venues', 'pages/venues.html', kinds=('venue', 'show'))
+def venues_context(session):
+    areas, page = venue_directory(session)
+    areas = list(areas)
+    return {'areas': areas, 'page': SnapshotPage(page.next_cursor, page.per_page)}
+
+
+@snapshot('artists', '/artists', 'pages/artists.html', kinds=('artist',))
+def artists_context(session):
+    page = artists_page(session, {})
+    artists = [{'id': row.id, 'name': row.name} for row in page]
+    return {'artists': artists, 'page': SnapshotPage(page.next_cursor, page.per_page)}
+
+
+#  Stores
+#  ----------------------------------------------------------------
+
+class MemoryStore(object):
+
+    def __init__(self):
+        self._snapshots = {}
+
+    def get(self, name):
+        return self._snapshots.get(name)
+
+    def put(self, snapshot):
+        # one dict assignment: readers see the old snapshot or the new one
+        self._snapshots[snapshot.name] = snapshot
+
+
+def private_directory(directory):
+    """ Create `directory` for this user only, and refuse one that another
+    user owns or may write to, as Jinja's FileSystemBytecodeCache does. """
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    info = os.lstat(directory)
+    if not stat.S_ISDIR(info.st_mode):
+        raise RuntimeError('%s is not a directory' % directory)
+    if hasattr(os, 'getuid'):
+        if info.st_uid != os.getuid():
+            raise RuntimeError('%s belongs to another user' % directory)
+        if info.st_mode & 0o077:
+            os.chmod(directory, 0o700)
+    return directory
+
+
+class DiskStore(object):
+    """ One JSON file per snapshot, reread whenever another process replaced it. """
+
+    def __init__(self, directory):
+        self.directory = private_directory(directory)
+        self._loaded = {}
+
+    def _path(self, name):
+        return os.path.join(self.directory, name + '.json')
+
+    def get(self, name):
+        try:
+            info = os.stat(self._path(name))
+        except FileNotFoundError:
+            return None
+        key = (info.st_ino, info.st_mtime_ns, info.st_size)
+        loaded = self._loaded.get(name)
+        if loaded is None or loaded[0] != key:
+            with open(self._path(name), encoding='utf-8') as source:
+                fields = json.load(source)
+            snapshot = Snapshot(name, fields['version'], fields['built_at'], None, fields['html'])
+            loaded = self._loaded[name] = (key, snapshot)
+        return loaded[1]
+
+    def put(self, snapshot):
+        path = self._path(snapshot.name)
+        temporary = '%s.%d.%d.tmp' % (path, os.getpid(), threading.get_ident())
+        with open(temporary, 'w', encoding='utf-8') as target:
+            json.dump({'version': snapshot.version, 'built_at': snapshot.built_at, 'html': snapshot.html}, target)
+        os.replace(temporary, path)
+
+
+#  Serving
+#  ----------------------------------------------------------------
+
+class Snapshots(object):
+
+    def __init__(self, app, store, max_age=300):
+        self.app = app
+        self.store = store
+        self.max_age = max_age
+        self._build_lock = threading.Lock()
+
+    def build(self, name):
+        definition = DEFINITIONS[name]
+        # rendered as an anonymous request for the page, so without flashes
+        with self.app.test_request_context(definition.path):
+            context = definition.build(db.session)
+            html = render_template(definition.template, **context)
+        version = hashlib.sha1(html.encode('utf-8')).hexdigest()[:16]
+        return Snapshot(name, version, time.time(), context, html)
+
+    def refresh(self, names=None):
+        """ Rebuild and swap in the snapshots; all of them by default. """
+        built = [self.build(name) for name in (names or sorted(DEFINITIONS))]
+        for snapshot in built:
+            self.store.put(snapshot)
+        return built
+
+    def names_for(self, kind):
+        return [name for name, definition in sorted(DEFINITIONS.items()) if kind in definition.kinds]
+
+    def get(self, name):
+        snapshot = self.store.get(name)
+        if snapshot is None:
+            # one request builds it, the others wait for that one
+            with self._build_lock:
+                snapshot = self.store.get(name)
+                if snapshot is None:
+                    snapshot = self.refresh([name])[0]
+        elif time.time() - snapshot.built_at > self.max_age:
+            enqueue('refresh_snapshots', dedup_key='snapshots:' + name, names=[name])
+        return snapshot
+
+    def ready(self, name):
+        """ Whether the snapshot is there to serve; if not, it is built in
+        the background, for callers that must not build it themselves. """
+        if self.store.get(name) is not None:
+            return True
+        enqueue('refresh_snapshots', dedup_key='snapshots:' + name, names=[name])
+        return False
+
+    def response(self, name):
+        snapshot = self.get(name)
+        if '_flashes' in cookie_session:
+            # the flashed messages are part of the layout; the disk store keeps no context
+            definition = DEFINITIONS[name]
+            context = snapshot.context if snapshot.context is not None else definition.build(db.session)
+            html = render_template(definition.template, **context)
+        else:
+            html = snapshot.html
+        response = make_response(html)
+        response.headers['X-Snapshot-Version'] = snapshot.version
+        return response
+
+    def stats(self):
+        now = time.time()
+        stats = {}
+        for name in sorted(DEFINITIONS):
+            snapshot = self.store.get(name)
+            stats[name] = None if snapshot is None else {
+                'version': snapshot.version, 'age_seconds': round(now - snapshot.built_at, 1)}
+        return stats
+
+
+def warm(app):
+    """ Build every snapshot and fill the template bytecode cache. """
+    with app.app_context():
+        compile_templates(app)
+        built = app.extensions['snapshots'].refresh()
+        db.session.remove()
+        # processes forked after this must not share its connections
+        for engine in db.engines.values():
+            engine.dispose()
+    return built
+
+
+def setup_snapshots(app):
+    config = app.config
+    backend = config['SNAPSHOT_STORE']
+    if backend == 'memory':
+        store = MemoryStore()
+    elif backend == 'disk':
+        store = DiskStore(config['SNAPSHOT_DIR'])
+    else:
+        raise RuntimeError('unknown SNAPSHOT_STORE %r' % backend)
+    app.extensions['snapshots'] = Snapshots(app, store, config['SNAPSHOT_MAX_AGE'])
+    return app.extensions['snapshots']
@@ -0,0 +1,127 @@
+import threading
+import time
+
+from jinja2 import FileSystemBytecodeCache, Template, nodes
+from jinja2.ext import Extension
+
+from cache import FragmentCache
+
+#----------------------------------------------------------------------------#
+# Fragment cache tag.
+#----------------------------------------------------------------------------#
+
+def fragment_key(key):
+    # ('nav', 'venues') -> 'nav:venues'
+    if isinstance(key, (list, tuple)):
+        return ':'.join(str(part) for part in key)
+    return str(key)
+
+
+class FragmentCacheExtension(Extension):
+    """ {% cache key, ttl %}...{% endcache %} renders its body once per key.
+
+    The key is a string or a tuple; the TTL in seconds is optional. Without
+    environment.fragment_cache the body always renders. Fragments are kept
+    per process and nothing invalidates them, so they are for markup that
+    does not show venue, artist or show data: pages that do are cached
+    whole by the page cache, whose invalidation reaches every worker.
+    """
+
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super(FragmentCacheExtension, self).__init__(environment)
+        environment.extend(fragment_cache=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        if parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        else:
+            args.append(nodes.Const(None))
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render', args), [], [], body).set_lineno(lineno)
+
+    def _render(self, key, ttl, caller):
+        fragment_cache = self.environment.fragment_cache
+        if fragment_cache is None:
+            return caller()
+        key = fragment_key(key)
+        html = fragment_cache.get(key)
+        if html is None:
+            html = caller()
+            fragment_cache.set(key, html, ttl)
+        return html
+
+
+#----------------------------------------------------------------------------#
+# Render times.
+#----------------------------------------------------------------------------#
+
+class TemplateTimings(object):
+    """ Render count and times per top-level template for one process. """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._templates = {}
+
+    def record(self, name, seconds):
+        with self._lock:
+            renders, total, worst = self._templates.get(name, (0, 0.0, 0.0))
+            self._templates[name] = (renders + 1, total + seconds, max(worst, seconds))
+
+    def snapshot(self):
+        with self._lock:
+            return dict((name, {'renders': renders,
+                                'total_ms': round(total * 1000, 3),
+                                'avg_ms': round(total * 1000 / renders, 3),
+                                'max_ms': round(worst * 1000, 3)})
+                        for name, (renders, total, worst) in self._templates.items())
+
+
+timings = TemplateTimings()
+
+
+class TimedTemplate(Template):
+    # streamed listings go through generate() and are not timed
+
+    def render(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super(TimedTemplate, self).render(*args, **kwargs)
+        finally:
+            timings.record(self.name, time.perf_counter() - started)
+
+
+#----------------------------------------------------------------------------#
+# Setup.
+#----------------------------------------------------------------------------#
+
+def setup_templating(app):
+    """ Must run before app.jinja_env is first used. """
+    config = app.config
+    options = dict(app.jinja_options)
+    options['extensions'] = list(options.get('extensions', ())) + [FragmentCacheExtension]
+    if config['TEMPLATE_BYTECODE_CACHE']:
+        # compiled templates survive restarts; stale entries are detected by source checksum
+        options['bytecode_cache'] = FileSystemBytecodeCache(config['TEMPLATE_BYTECODE_CACHE_DIR'])
+    app.jinja_options = options
+
+    env = app.jinja_env
+    env.template_class = TimedTemplate
+    if config['FRAGMENT_CACHE']:
+        env.fragment_cache = app.extensions['fragment_cache'] = FragmentCache(
+            config['FRAGMENT_CACHE_MAX_ENTRIES'], config['FRAGMENT_CACHE_TTL'])
+
+
+def compile_templates(app):
+    """ Load every template once so the bytecode cache is filled. """
+    names = app.jinja_env.list_templates(extensions=('html',))
+    for name in names:
+        app.jinja_env.get_template(name)
+    return names
@@ -0,0 +1,60 @@
+from bisect import bisect_left
+
+from sqlalchemy import and_, case, or_, select
+from sqlalchemy.sql import func
+
+from models import Artist, Show, Venue
+from read_models import ShowRow, Timeline
+
+#----------------------------------------------------------------------------#
+# Show timeline.
+#----------------------------------------------------------------------------#
+
+def _timeline(session, entity_column, entity_id, other_column, other, other_prefix, now, limit):
+    """ Fetch the shows of one venue or artist in a single query.
+
+    Rows come back ordered by start_time and are split into past and
+    upcoming with a bisect on the timestamps. With a limit, only the last
+    `limit` past and the next `limit` upcoming shows are fetched; the full
+    counts ride along as window aggregates.
+    """
+    is_upcoming = case((Show.start_time >= now, 1), else_=0)
+    shows = select(other.id.label(other_prefix + '_id'),
+                   other.name.label(other_prefix + '_name'),
+                   other.image_link.label(other_prefix + '_image_link'),
+                   Show.start_time,
+                   Show.id.label('show_id'),
+                   is_upcoming.label('is_upcoming'),
+                   func.row_number().over(partition_by=is_upcoming,
+                                          order_by=(Show.start_time, Show.id)).label('position'),
+                   func.count().over(partition_by=is_upcoming).label('total')
+                   ).select_from(Show
+                   ).join(other, other_column == other.id
+                   ).where(entity_column == entity_id, Show.start_time.isnot(None)
+                   ).subquery()
+
+    query = select(shows).order_by(shows.c.start_time, shows.c.show_id)
+    if limit is not None:
+        query = query.where(or_(and_(shows.c.is_upcoming == 1, shows.c.position <= limit),
+                                and_(shows.c.is_upcoming == 0, shows.c.position > shows.c.total - limit)))
+    rows = session.execute(query).all()
+
+    split = bisect_left([row.start_time for row in rows], now)
+    counts = {0: 0, 1: 0}
+    for row in (rows[split - 1:split] + rows[split:split + 1]):
+        counts[row.is_upcoming] = row.total
+
+    columns = (other_prefix + '_id', other_prefix + '_name', other_prefix + '_image_link', 'start_time')
+    past = [ShowRow.from_values(columns, row) for row in reversed(rows[:split])]
+    upcoming = [ShowRow.from_values(columns, row) for row in rows[split:]]
+    return Timeline(past, upcoming, counts[0], counts[1])
+
+
+def venue_timeline(session, venue_id, now, limit=None):
+    """ Past (most recent first) and upcoming shows at a venue. """
+    return _timeline(session, Show.venue_id, venue_id, Show.artist_id, Artist, 'artist', now, limit)
+
+
+def artist_timeline(session, artist_id, now, limit=None):
+    """ Past (most recent first) and upcoming shows of an artist. """
+    return _timeline(session, Show.artist_id, artist_id, Show.venue_id, Venue, 'venue', now, limit)